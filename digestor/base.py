@@ -10,13 +10,49 @@ import os
 import sys
 import re
 import json
+import shlex
 import logging
 import subprocess as sub
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-import yaml
-import numpy as np
-from astropy.io import fits
-from astropy.table import Table
+from .cache import is_current, remove_stamp, stage_key, write_stamp
+from .header import read_header, table_columns
+from .tapschema import ColumnList
+
+#
+# Parsed YAML files, shared by all objects in a process.
+#
+_yaml_cache = dict()
+
+
+def read_yaml(filename):
+    """Read a YAML configuration file, parsing it at most once per process.
+
+    The file is parsed again if it has been modified.  The returned
+    object is shared, so it should not be modified.
+
+    Parameters
+    ----------
+    filename : :class:`str`
+        Name of the YAML configuration file.
+
+    Returns
+    -------
+    :class:`dict`
+        The contents of `filename`.
+    """
+    key = (os.path.abspath(filename), os.stat(filename).st_mtime_ns)
+    if key not in _yaml_cache:
+        import yaml
+        #
+        # The C parser, if available, is about ten times faster.
+        #
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        with open(filename) as f:
+            _yaml_cache[key] = yaml.load(f, Loader=loader)
+    return _yaml_cache[key]
 
 
 class Digestor(object):
@@ -42,6 +78,17 @@ class Digestor(object):
     galactic : :class:`bool`, optional
         If ``False``, *don't* add galactic coordinates (probably because
         they already exist).
+    ra : :class:`str`, optional
+        Look for Right Ascension in this column (default 'ra').  The
+        Declination column is found by replacing 'ra' with 'dec'.
+    native : :class:`bool`, optional
+        If ``False``, compute *all* Data Lab-added columns with STILTS,
+        instead of computing them in-process where possible.
+    threads : :class:`int`, optional
+        Convert columns on this many threads (default 1).
+    metrics : :class:`bool`, optional
+        If ``True``, record the cost of converting each column in
+        :attr:`columnMetrics`.
     """
     #
     # Name of the root logger provided by Digestor.
@@ -59,23 +106,62 @@ class Digestor(object):
                        'cmd=addcol nest4096 (int)healpixNestIndex(12,{ra},{dec})']
     _stilts_ecliptic = 'cmd=addskycoords -inunit deg -outunit deg icrs ecliptic {ra} {dec} elon elat'
     _stilts_galactic = 'cmd=addskycoords -inunit deg -outunit deg icrs galactic {ra} {dec} glon glat'
+    #
+    # Custom STILTS commands that have an in-process equivalent,
+    # mapped to the column they add.
+    #
+    _native_stilts = dict()
+    #
+    # FITS data types that can be converted to each SQL data type.
+    # The first entry is an exact match.
+    #
+    _type_map = {'bigint': ('K', 'J', 'I', 'B'),
+                 'integer': ('J', 'I', 'B'),
+                 'smallint': ('I', 'B'),
+                 'boolean': ('L'),
+                 'double': ('D', 'E'),
+                 'real': ('E',),
+                 'character': ('A',)}
+    #
+    # NumPy data type for each SQL data type.
+    #
+    _np_map = {'bigint': 'i8',
+               'integer': 'i4',
+               'smallint': 'i2',
+               'boolean': '?',
+               'double': 'f8',
+               'real': 'f4'}
+    #
+    # Conversions that are safe if the values are within these limits.
+    #
+    _safe_conversion = {('J', 'smallint'): 2**15}
+    #
+    # Strip the repeat count from a FITS data type.
+    #
+    _rebase = re.compile(r'^(\d+)(\D+)')
 
     def __init__(self, schema, table, description=None, merge=None,
-                 pixels=True, random=True, ecliptic=True, galactic=True):
+                 pixels=True, random=True, ecliptic=True, galactic=True,
+                 ra='ra', native=True, threads=1, metrics=False):
         self.schema = schema
         self.table = table
         self.pixels = pixels
         self.random = random
         self.ecliptic = ecliptic
         self.galactic = galactic
+        self.ra = ra
+        self.native = native
+        self.threads = threads
+        self.metrics = metrics
+        self.columnMetrics = None
         self.tapSchema = self._initTapSchema(description, merge)
         self.mapping = dict()
         self.FITS = dict()
         self._tableIndexCache = dict()
-        self._columnIndexCache = dict()
         self._inputFITS = None
         self._yamlCache = dict()
         self._custom_stilts_command = list()
+        self._plan = None
 
     @classmethod
     def configureLog(cls, filename, debug=False):
@@ -87,6 +173,11 @@ class Digestor(object):
             Name of the log file.
         debug : :class:`bool`, optional
             If ``True``, set log level to DEBUG.
+
+        Returns
+        -------
+        :class:`logging.FileHandler`
+            The new log handler.
         """
         # ch = logging.StreamHandler(sys.stdout)
         ch = logging.FileHandler(filename)
@@ -98,7 +189,7 @@ class Digestor(object):
         if debug:
             level = logging.DEBUG
         log.setLevel(level)
-        return
+        return ch
 
     def logName(self, method):
         """Get a logger with name `method`.
@@ -172,6 +263,7 @@ class Digestor(object):
                 metadata['columns'] += self._dlColumns()
             except KeyError:
                 metadata['columns'] = self._dlColumns()
+        metadata['columns'] = ColumnList(metadata['columns'])
         return metadata
 
     def _dlColumns(self):
@@ -237,8 +329,7 @@ class Digestor(object):
             return self._yamlCache[filename]
         if os.path.exists(filename):
             log.debug("Opening %s.", filename)
-            with open(filename) as f:
-                self._yamlCache[filename] = yaml.safe_load(f)
+            self._yamlCache[filename] = read_yaml(filename)
             return self._yamlCache[filename]
         return None
 
@@ -280,13 +371,19 @@ class Digestor(object):
         :exc:`ValueError`
             If the table is not found.
         """
-        try:
-            return self._tableIndexCache[self.table]
-        except KeyError:
-            for i, t in enumerate(self.tapSchema['tables']):
-                if t['schema_name'] == self.schema and t['table_name'] == self.table:
-                    self._tableIndexCache[self.table] = i
-                    return i
+        tables = self.tapSchema['tables']
+        i = self._tableIndexCache.get((self.schema, self.table))
+        #
+        # Check that the cached entry is still correct.
+        #
+        if (i is not None and i < len(tables) and
+                tables[i]['schema_name'] == self.schema and
+                tables[i]['table_name'] == self.table):
+            return i
+        for i, t in enumerate(tables):
+            if t['schema_name'] == self.schema and t['table_name'] == self.table:
+                self._tableIndexCache[(self.schema, self.table)] = i
+                return i
         raise ValueError("Table {0.table} was not found in schema {0.schema}!".format(self))
 
     def columnIndex(self, column):
@@ -298,13 +395,28 @@ class Digestor(object):
             If the column is not found.
         """
         try:
-            return self._columnIndexCache[(self.table, column)]
+            return self._columnList.slot(self.table, column)
         except KeyError:
-            for i, c in enumerate(self.tapSchema['columns']):
-                if c['table_name'] == self.table and c['column_name'] == column:
-                    self._columnIndexCache[(self.table, column)] = i
-                    return i
-        raise ValueError("Column {0} was not found in {1.stable}!".format(column, self))
+            raise ValueError("Column {0} was not found in {1.stable}!".format(column, self))
+
+    @property
+    def _columnList(self):
+        """TapSchema column definitions, indexed by table and column.
+
+        A plain list assigned to ``tapSchema['columns']`` is replaced by
+        an indexed :class:`~digestor.tapschema.ColumnList`.
+        """
+        columns = self.tapSchema['columns']
+        if not isinstance(columns, ColumnList):
+            columns = self.tapSchema['columns'] = ColumnList(columns)
+        return columns
+
+    @property
+    def tableColumns(self):
+        """List of column definitions in the table.
+        """
+        columns = self._columnList
+        return [columns[i] for i in columns.slots(self.table)]
 
     @property
     def stable(self):
@@ -316,14 +428,146 @@ class Digestor(object):
     def colNames(self):
         """List of columns in the table.
         """
-        return [c['column_name'] for c in self.tapSchema['columns']
-                if c['table_name'] == self.table]
+        return self._columnList.names(self.table)
 
     @property
     def nColumns(self):
         """Number of columns in the table.
         """
-        return len(self.colNames)
+        return len(self._columnList.slots(self.table))
+
+    @property
+    def nativePositionColumns(self):
+        """List of Data Lab-added columns that are computed in-process
+        from the position of each row.
+        """
+        columns = list()
+        if self.native:
+            if self.pixels:
+                columns += ['htm9', 'ring256', 'nest4096']
+            if self.ecliptic:
+                columns += ['elon', 'elat']
+            if self.galactic:
+                columns += ['glon', 'glat']
+        return columns
+
+    @property
+    def nativeColumns(self):
+        """List of Data Lab-added columns that are computed in-process,
+        including those that replace custom STILTS commands.
+        """
+        columns = self.nativePositionColumns
+        if self.native:
+            columns += [self._native_stilts[cmd] for cmd in self._custom_stilts_command
+                        if cmd in self._native_stilts]
+        return columns
+
+    def positionColumns(self, names):
+        """Find the Right Ascension and Declination columns.
+
+        Parameters
+        ----------
+        names : iterable
+            Names of the FITS columns.  The search is case-insensitive.
+
+        Returns
+        -------
+        :class:`tuple`
+            The names of the Right Ascension and Declination columns.
+
+        Raises
+        ------
+        :exc:`KeyError`
+            If either column cannot be found.
+        """
+        fra = self.ra.lower()
+        fdec = fra.replace('ra', 'dec')
+        lower = dict([(n.lower(), n) for n in names])
+        for c in (fra, fdec):
+            if c not in lower:
+                msg = "Could not find a FITS column corresponding to %s!"
+                self.logName('base.Digestor.positionColumns').error(msg, c)
+                raise KeyError(msg % c)
+        return (lower[fra], lower[fdec])
+
+    @property
+    def inputColumns(self):
+        """FITS columns needed to convert the table, in FITS order.
+
+        Columns that are only mapped to SQL columns computed in-process,
+        and columns that are not mapped at all, are not read.
+        """
+        native = self.nativeColumns
+        used = set([self.mapping[c].split('[')[0] for c in self.colNames
+                    if c in self.mapping and c not in native])
+        if self.nativePositionColumns:
+            used.update(self.positionColumns(self.FITS))
+        return [c for c in self.FITS if c in used]
+
+    def readFITS(self, hdu=1):
+        """Read the input FITS file, memory-mapped.
+
+        Only the columns listed in :attr:`inputColumns` are read.
+
+        Parameters
+        ----------
+        hdu : :class:`int`, optional
+            Read data from this HDU (default 1).
+
+        Returns
+        -------
+        :class:`astropy.table.Table`
+            The input data.
+        """
+        from .stream import read_blocks
+        log = self.logName('base.Digestor.readFITS')
+        columns = self.inputColumns
+        log.info("Reading %d of %d FITS columns.", len(columns), len(self.FITS))
+        log.debug("old = next(read_blocks('%s', %d, None, columns=%s, signed=True))",
+                  self._inputFITS, hdu, str(columns))
+        return next(read_blocks(self._inputFITS, hdu, None, columns=columns,
+                                signed=True))
+
+    def deriveColumns(self, old):
+        """Compute Data Lab-added columns from the positions in `old`.
+
+        Parameters
+        ----------
+        old : :class:`astropy.table.Table`
+            Input data, either the entire table or a block of rows.
+
+        Returns
+        -------
+        :class:`dict`
+            A mapping of column name to column data, for each column
+            in :attr:`nativePositionColumns`.  Subclasses should compute
+            any other columns in :attr:`nativeColumns`.
+        """
+        log = self.logName('base.Digestor.deriveColumns')
+        native = self.nativePositionColumns
+        derived = dict()
+        if not native:
+            return derived
+        from .coordinates import ecliptic, galactic
+        from .healpix import nest_index, ring_index
+        from .htm import htm_index
+        ra, dec = self.positionColumns(old.colnames)
+        if 'htm9' in native:
+            log.debug("derived['htm9'] = htm_index(9, old['%s'], old['%s'])", ra, dec)
+            derived['htm9'] = htm_index(9, old[ra], old[dec])
+        if 'ring256' in native:
+            log.debug("derived['ring256'] = ring_index(8, old['%s'], old['%s'])", ra, dec)
+            derived['ring256'] = ring_index(8, old[ra], old[dec])
+        if 'nest4096' in native:
+            log.debug("derived['nest4096'] = nest_index(12, old['%s'], old['%s'])", ra, dec)
+            derived['nest4096'] = nest_index(12, old[ra], old[dec])
+        if 'elon' in native:
+            log.debug("derived['elon'], derived['elat'] = ecliptic(old['%s'], old['%s'])", ra, dec)
+            derived['elon'], derived['elat'] = ecliptic(old[ra], old[dec])
+        if 'glon' in native:
+            log.debug("derived['glon'], derived['glat'] = galactic(old['%s'], old['%s'])", ra, dec)
+            derived['glon'], derived['glat'] = galactic(old[ra], old[dec])
+        return derived
 
     def mapColumns(self):
         """Complete mapping of FITS table columns to SQL columns.
@@ -336,8 +580,13 @@ class Digestor(object):
             If an expected mapping cannot be found.
         """
         log = self.logName('base.Digestor.mapColumns')
+        native = self.nativeColumns
+        if self.nativePositionColumns:
+            self.positionColumns(self.FITS)
         for sc in self.colNames:
-            if sc in self.mapping:
+            if sc in native:
+                log.debug("SQL: %s will be computed in-process.", sc)
+            elif sc in self.mapping:
                 if self.mapping[sc] in self.FITS:
                     log.debug("FITS: %s -> SQL: %s", self.mapping[sc], sc)
                 else:
@@ -375,20 +624,28 @@ class Digestor(object):
                     log.debug("self.tapSchema['columns'][%d]['%s'] = col_fix['%s']['%s'] = '%s'",
                               i, k, col, k, col_fix[col][k])
                     self.tapSchema['columns'][i][k] = col_fix[col][k]
+                    if k in ('table_name', 'column_name'):
+                        self._columnList.reindex()
         return
 
     def sortColumns(self):
         """Sort the SQL columns for best performance.
         """
-        new_columns = list()
-        for o in self.ordered:
-            for c in self.tapSchema['columns']:
-                if c['table_name'] == self.table and c['datatype'] == o:
-                    new_columns.append(c)
-        assert len(new_columns) == self.nColumns
-        for i, c in enumerate(self.tapSchema['columns']):
-            if c['table_name'] == self.table:
-                self.tapSchema['columns'][i] = new_columns.pop(0)
+        columns = self._columnList
+        slots = list(columns.slots(self.table))
+        by_type = dict([(o, list()) for o in self.ordered])
+        for i in slots:
+            c = columns[i]
+            if c['datatype'] in by_type:
+                by_type[c['datatype']].append(c)
+        new_columns = [c for o in self.ordered for c in by_type[o]]
+        assert len(new_columns) == len(slots)
+        #
+        # Columns of other tables keep their positions.
+        #
+        for i, c in zip(slots, new_columns):
+            list.__setitem__(columns, i, c)
+        columns.reindex()
         return
 
     def customSTILTS(self, filename):
@@ -409,7 +666,7 @@ class Digestor(object):
             self._custom_stilts_command += stilts
         return
 
-    def addDLColumns(self, filename, ra='ra', overwrite=False):
+    def addDLColumns(self, filename, ra=None, overwrite=False):
         """Add DL columns to FITS file prior to column reorganization.
 
         Parameters
@@ -417,14 +674,17 @@ class Digestor(object):
         filename : :class:`str`
             Name of the FITS file.
         ra : :class:`str`, optional
-            Look for Right Ascension in this column (default 'ra').
+            Look for Right Ascension in this column (default :attr:`ra`).
         overwrite : :class:`bool`, optional
-            If ``True``, remove any existing file.
+            If ``True``, remove any existing file.  Otherwise, reuse an
+            existing file written from the same input with the same
+            commands.
 
         Returns
         -------
         :class:`str`
-            The name of the processed file.
+            The name of the processed file, or `filename` if there is
+            nothing for STILTS to do.
 
         Raises
         ------
@@ -432,24 +692,25 @@ class Digestor(object):
             If a problem with :command:`stilts` is detected.
         """
         log = self.logName('base.Digestor.addDLColumns')
+        stilts_command = self.stiltsCommands(ra)
+        if not stilts_command:
+            log.info("No STILTS processing needed for %s.", filename)
+            return filename
         out = filename.replace('.fits', '.stilts.fits')
-        if os.path.exists(out) and not overwrite:
+        command = ['stilts', 'tpipe', 'in={0}'.format(filename)]
+        command += stilts_command
+        command += ['ofmt=fits-basic', 'out={0}'.format(out)]
+        #
+        # The command includes any table-specific configuration.
+        #
+        key = stage_key('addDLColumns', [filename], {'command': command})
+        if not overwrite and is_current([out], key):
             log.info("Using existing file: %s.", out)
             return out
+        remove_stamp([out])
         if os.path.exists(out):
             log.info("Removing existing file: %s.", out)
             os.remove(out)
-        fra = ra.lower()
-        fdec = ra.lower().replace('ra', 'dec')
-        command = ['stilts', 'tpipe', 'in={0}'.format(filename)]
-        command += self._custom_stilts_command
-        if self.pixels:
-            command += [cmd.format(ra=fra, dec=fdec) for cmd in self._stilts_command]
-        if self.ecliptic:
-            command.append(self._stilts_ecliptic.format(ra=fra, dec=fdec))
-        if self.galactic:
-            command.append(self._stilts_galactic.format(ra=fra, dec=fdec))
-        command += ['ofmt=fits-basic', 'out={0}'.format(out)]
         log.debug(' '.join(command))
         proc = sub.Popen(command, stdout=sub.PIPE, stderr=sub.PIPE)
         o, e = proc.communicate()
@@ -465,26 +726,97 @@ class Digestor(object):
                 log.info('STILTS STDOUT = %s', o.decode('utf-8'))
             if e:
                 log.info('STILTS STDERR = %s', e.decode('utf-8'))
+        write_stamp([out], key)
         return out
 
-    def parseFITS(self, filename, hdu=1):
+    def stiltsCommands(self, ra=None):
+        """STILTS commands needed to add Data Lab columns.
+
+        Parameters
+        ----------
+        ra : :class:`str`, optional
+            Look for Right Ascension in this column (default :attr:`ra`).
+
+        Returns
+        -------
+        :class:`list`
+            The ``cmd=`` arguments of :command:`stilts tpipe`, empty if
+            there is nothing for STILTS to do.
+        """
+        if ra is None:
+            ra = self.ra
+        fra = ra.lower()
+        fdec = ra.lower().replace('ra', 'dec')
+        native = self.nativeColumns
+        command = [cmd for cmd in self._custom_stilts_command
+                   if self._native_stilts.get(cmd) not in native]
+        if self.pixels:
+            command += [cmd.format(ra=fra, dec=fdec) for cmd in self._stilts_command
+                        if cmd.split()[1] not in native]
+        if self.ecliptic and 'elon' not in native:
+            command.append(self._stilts_ecliptic.format(ra=fra, dec=fdec))
+        if self.galactic and 'glon' not in native:
+            command.append(self._stilts_galactic.format(ra=fra, dec=fdec))
+        return command
+
+    def stiltsColumns(self, ra=None):
+        """Columns that :meth:`addDLColumns` would add with STILTS.
+
+        Parameters
+        ----------
+        ra : :class:`str`, optional
+            Look for Right Ascension in this column (default :attr:`ra`).
+
+        Returns
+        -------
+        :class:`list`
+            Names of the columns added by ``addcol`` and ``addskycoords``
+            commands.
+        """
+        columns = list()
+        for cmd in self.stiltsCommands(ra):
+            words = shlex.split(cmd.split('=', 1)[1])
+            if words[0] == 'addcol':
+                #
+                # Every addcol flag takes a value.
+                #
+                k = 1
+                while words[k].startswith('-'):
+                    k += 2
+                columns.append(words[k])
+            elif words[0] == 'addskycoords':
+                columns += words[-2:]
+        return columns
+
+    def parseFITS(self, filename, hdu=1, pending=None):
         """Read FITS metadata from `filename`.
 
+        Only the header is read.
+
         Parameters
         ----------
         filename : :class:`str`
             Name of the FITS file.
         hdu : :class:`int`, optional
             Read data from this HDU (default 1).
+        pending : :class:`list`, optional
+            Names of columns that are not in `filename` yet, because they
+            would be added by :meth:`addDLColumns`.  They are recorded with
+            an unknown (``None``) data type, which is enough to map columns
+            and write metadata, but not to convert any data.
         """
-        with fits.open(filename) as hdulist:
-            fits_names = hdulist[hdu].columns.names
-            fits_types = hdulist[hdu].columns.formats
+        log = self.logName('base.Digestor.parseFITS')
+        fits_names, fits_types = table_columns(read_header(filename, hdu))
         self._inputFITS = filename
         for i, f in enumerate(fits_names):
             self.FITS[f] = fits_types[i]
+        if pending:
+            log.debug("Columns %s will be added by STILTS.", ', '.join(pending))
+            for f in pending:
+                self.FITS[f] = None
 
-    def processFITS(self, hdu=1, overwrite=False):
+    def processFITS(self, hdu=1, overwrite=False, blocksize=None,
+                    processes=1, shards=False, output='fits'):
         """Convert a pre-processed FITS file into one ready for database loading.
 
         This method may be overridden in subclasses with survey-specific
@@ -495,12 +827,28 @@ class Digestor(object):
         hdu : :class:`int`, optional
             Read data from this HDU (default 1).
         overwrite : :class:`bool`, optional
-            If ``True``, remove any existing file.
+            If ``True``, remove any existing file.  Otherwise, reuse
+            existing files written from the same input with the same
+            conversion plan.
+        blocksize : :class:`int`, optional
+            If set, read, convert and write the data in blocks of this
+            many rows, so that memory usage does not depend on the
+            size of the file.
+        processes : :class:`int`, optional
+            If greater than 1, split the rows into this many ranges and
+            convert each range in a separate process.
+        shards : :class:`bool`, optional
+            If ``True``, and `processes` is greater than 1, write each range
+            of rows to a separate file, instead of combining them.
+        output : :class:`str`, optional
+            Write a FITS file (``'fits'``, the default), or a PostgreSQL
+            binary ``COPY`` file (``'pgcopy'``).
 
         Returns
         -------
-        :class:`str`
-            The name of the file written.
+        :class:`str` or :class:`list`
+            The name of the file written, or a list of file names, in row
+            order, if `shards` is set.
 
         Raises
         ------
@@ -508,85 +856,700 @@ class Digestor(object):
             If the FITS data type cannot be converted to SQL.
         """
         log = self.logName('base.Digestor.processFITS')
-        out = "{0.schema}.{0.table}.fits".format(self)
-        if os.path.exists(out) and not overwrite:
-            log.info("Using existing file: %s.", out)
+        outputs = self.outputFiles(processes if shards else 1, output)
+        out = outputs[0] if len(outputs) == 1 else outputs
+        #
+        # Check the conversion of every column before touching any data.
+        #
+        self.compilePlan()
+        key = self.outputKey(hdu, outputs)
+        if not overwrite and is_current(outputs, key):
+            for o in outputs:
+                log.info("Using existing file: %s.", o)
             return out
-        if os.path.exists(out):
-            log.info("Removing existing file: %s.", out)
-            os.remove(out)
-        type_map = {'bigint': ('K', 'J', 'I', 'B'),
-                    'integer': ('J', 'I', 'B'),
-                    'smallint': ('I', 'B'),
-                    'boolean': ('L'),
-                    'double': ('D', 'E'),
-                    'real': ('E',),
-                    'character': ('A',)}
-        np_map = {'bigint': np.int64,
-                  'integer': np.int32,
-                  'smallint': np.int16,
-                  'boolean': bool,
-                  'double': np.float64,
-                  'real': np.float32}
-        safe_conversion = {('J', 'smallint'): 2**15}
-        rebase = re.compile(r'^(\d+)(\D+)')
-        columns = [c for c in self.tapSchema['columns']
-                   if c['table_name'] == self.table]
-        old = Table.read(self._inputFITS, hdu=hdu)
-        new = Table()
-        for col in columns:
-            if col['column_name'] == 'random_id':
-                log.info("Skipping %s which will be added by FITS2DB.",
-                         col['column_name'])
-                continue
-            fcol = self.mapping[col['column_name']]
-            index = None
-            if '[' in fcol:
-                foo = fcol.split('[')
-                fcol = foo[0]
-                index = int(foo[1].strip(']'))
-            ftype = self.FITS[fcol]
-            fbasetype = rebase.sub(r'\2', ftype)
-            if fbasetype == type_map[col['datatype']][0]:
-                log.debug("Type match for %s -> %s.", fcol, col['column_name'])
-                if index is not None:
-                    log.debug("new['%s'] = old['%s'][:, %d]",
-                              col['column_name'], fcol, index)
-                    new[col['column_name']] = old[fcol][:, index]
-                else:
-                    log.debug("new['%s'] = old['%s']", col['column_name'], fcol)
-                    new[col['column_name']] = old[fcol]
-            elif fbasetype in type_map[col['datatype']]:
-                log.debug("Safe type conversion possible for %s (%s) -> %s (%s).",
-                          fcol, fbasetype, col['column_name'], col['datatype'])
-                if index is not None:
-                    log.debug("new['%s'] = old['%s'][:, %d].astype(%s)",
-                              col['column_name'], fcol, index,
-                              str(np_map[col['datatype']]))
-                    new[col['column_name']] = old[fcol][:, index].astype(np_map[col['datatype']])
-                else:
-                    log.debug("new['%s'] = old['%s'].astype(%s)",
-                              col['column_name'], fcol,
-                              str(np_map[col['datatype']]))
-                    new[col['column_name']] = old[fcol].astype(np_map[col['datatype']])
+        remove_stamp(outputs)
+        for o in outputs:
+            if os.path.exists(o):
+                log.info("Removing existing file: %s.", o)
+                os.remove(o)
+        self.prepareConversion()
+        if self.metrics:
+            self.resetMetrics()
+        if processes > 1:
+            self._parallelFITS(outputs, hdu, blocksize, processes, output)
+        elif blocksize is None:
+            old = self.readFITS(hdu)
+            new = self.convertTable(old)
+            if output == 'pgcopy':
+                log.debug("PGCopyWriter('%s').write(new)", out)
+                with self.outputWriter(out, len(new), output) as writer:
+                    writer.write(new)
             else:
-                if (fbasetype, col['datatype']) in safe_conversion:
-                    limit = safe_conversion[(fbasetype, col['datatype'])]
-                    if ((old[fcol] >= -limit) & (old[fcol] <= limit - 1)).all():
-                        if index is not None:
-                            log.debug("new['%s'] = old['%s'][:, %d].astype(%s)", col['column_name'], fcol, index, str(np_map[col['datatype']]))
-                            new[col['column_name']] = old[fcol][:, index].astype(np_map[col['datatype']])
-                        else:
-                            log.debug("new['%s'] = old['%s'].astype(%s)", col['column_name'], fcol, str(np_map[col['datatype']]))
-                            new[col['column_name']] = old[fcol].astype(np_map[col['datatype']])
-                else:
-                    msg = "No safe data type conversion possible for %s (%s) -> %s (%s)!"
-                    log.error(msg, fcol, fbasetype, col['column_name'], col['datatype'])
-                    raise ValueError(msg % (fcol, fbasetype, col['column_name'], col['datatype']))
-        log.debug("new.write('%s')", out)
-        new.write(out)
+                log.debug("new.write('%s')", out)
+                new.write(out)
+        else:
+            self._streamFITS(out, hdu, blocksize, output)
+        write_stamp(outputs, key)
         return out
 
+    def prepareConversion(self):
+        """Prepare to convert data, after any existing output has been removed.
+
+        This method does nothing, but may be overridden in subclasses
+        with survey-specific requirements.
+        """
+        pass
+
+    def outputKey(self, hdu, outputs):
+        """Identify everything the output of :meth:`processFITS` depends on.
+
+        Parameters
+        ----------
+        hdu : :class:`int`
+            Read data from this HDU.
+        outputs : :class:`list`
+            Names of the output files.
+
+        Returns
+        -------
+        :class:`str`
+            A key computed by :func:`~digestor.cache.stage_key` from the
+            input FITS file, the conversion plan and the output files.
+            The plan includes the position columns read by
+            :meth:`deriveColumns`.
+        """
+        return stage_key('processFITS', [self._inputFITS],
+                         {'hdu': hdu, 'outputs': outputs, 'plan': self.plan})
+
+    def outputFiles(self, shards=1, output='fits'):
+        """Names of the files written by :meth:`processFITS`.
+
+        Parameters
+        ----------
+        shards : :class:`int`, optional
+            Number of files the rows are split into (default 1).
+        output : :class:`str`, optional
+            Output format, ``'fits'`` (the default) or ``'pgcopy'``.
+
+        Returns
+        -------
+        :class:`list`
+            The file names, in row order.
+
+        Raises
+        ------
+        :exc:`ValueError`
+            If the output format is unknown.
+        """
+        if output not in ('fits', 'pgcopy'):
+            msg = "Unknown output format: %s!"
+            self.logName('base.Digestor.outputFiles').error(msg, output)
+            raise ValueError(msg % output)
+        if shards > 1:
+            return ["{0.schema}.{0.table}.{1:03d}.{2}".format(self, k, output)
+                    for k in range(shards)]
+        return ["{0.schema}.{0.table}.{1}".format(self, output)]
+
+    @property
+    def columnTypes(self):
+        """Mapping of column name to SQL data type for this table.
+        """
+        return dict([(c['column_name'], c['datatype'])
+                     for c in self.tableColumns])
+
+    def outputWriter(self, filename, nrows, output='fits'):
+        """Create an object that writes converted data in blocks.
+
+        Parameters
+        ----------
+        filename : :class:`str`
+            Name of the output file.
+        nrows : :class:`int`
+            Total number of rows that will be written.
+        output : :class:`str`, optional
+            Output format, ``'fits'`` (the default) or ``'pgcopy'``.
+
+        Returns
+        -------
+        :class:`~digestor.stream.FITSBlockWriter` or :class:`~digestor.pgcopy.PGCopyWriter`
+            An object with ``write()`` and ``close()`` methods.
+        """
+        if output == 'pgcopy':
+            from .pgcopy import PGCopyWriter
+            return PGCopyWriter(filename, self.columnTypes)
+        from .stream import FITSBlockWriter
+        return FITSBlockWriter(filename, nrows)
+
+    def copySQL(self, filename=None):
+        """Construct a statement that loads a binary ``COPY`` file.
+
+        Parameters
+        ----------
+        filename : :class:`str`, optional
+            Name of the file on the database server.  If not set,
+            read from standard input.
+
+        Returns
+        -------
+        :class:`str`
+            A SQL COPY statement listing the columns written by
+            :meth:`processFITS`, which excludes skipped columns.
+        """
+        columns = [step['column'] for step in self.plan if step['kernel'] != 'skip']
+        source = 'STDIN' if filename is None else "'{0}'".format(filename)
+        return ("COPY {0.schema}.{0.table} ({1}) FROM {2} " +
+                "WITH (FORMAT binary);\n").format(self, ', '.join(columns), source)
+
+    def _parallelFITS(self, outputs, hdu, blocksize, processes, output='fits'):
+        """Convert ranges of rows of the input FITS file in separate processes.
+
+        Parameters
+        ----------
+        outputs : :class:`list`
+            Name of the output file, or one file name per process.
+        hdu : :class:`int`
+            Read data from this HDU.
+        blocksize : :class:`int`
+            Number of rows to convert at a time.  If ``None``, each process
+            converts its range of rows all at once.
+        processes : :class:`int`
+            Number of processes.
+        output : :class:`str`, optional
+            Output format, ``'fits'`` (the default) or ``'pgcopy'``.
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        import numpy as np
+        from .pgcopy import concatenate
+        from .stream import FITSBlockWriter, read_blocks
+        log = self.logName('base.Digestor._parallelFITS')
+        nrows = read_header(self._inputFITS, hdu)['NAXIS2']
+        bounds = [(nrows * k) // processes for k in range(processes + 1)]
+        log.info("Converting %d rows in %d processes.", nrows, processes)
+        layout = None
+        combined = None
+        if len(outputs) == 1:
+            if output == 'pgcopy':
+                #
+                # Rows have variable length, so write separate parts
+                # and combine them afterwards.
+                #
+                combined = outputs[0]
+                outputs = ["{0}.part{1:03d}".format(combined, k) for k in range(processes)]
+            else:
+                #
+                # Use the first row to define the output columns, then each
+                # process writes its rows directly into the combined file.
+                #
+                sample = next(read_blocks(self._inputFITS, hdu, blocksize=1,
+                                             columns=self.inputColumns,
+                                             signed=True))
+                writer = FITSBlockWriter(outputs[0], nrows)
+                layout = writer.allocate(self.convertTable(sample))
+                outputs = outputs * processes
+                if self.metrics:
+                    self.resetMetrics()
+        #
+        # Workers must not repeat the same sequence of random numbers.
+        #
+        seeds = np.random.randint(0, 2**31 - 1, size=processes)
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(_convert_rows, self, outputs[k], hdu,
+                                   bounds[k], bounds[k + 1], blocksize,
+                                   layout, int(seeds[k]), output)
+                       for k in range(processes)]
+            for k, f in enumerate(futures):
+                metrics = f.result()
+                if metrics is not None:
+                    self.mergeMetrics(metrics)
+                log.debug("Rows %d to %d written to %s.",
+                          bounds[k], bounds[k + 1], outputs[k])
+        if combined is not None:
+            log.debug("concatenate(%s, '%s')", str(outputs), combined)
+            concatenate(outputs, combined)
+        return
+
+    def _streamFITS(self, out, hdu, blocksize, output='fits'):
+        """Convert the input FITS file block by block.
+
+        Parameters
+        ----------
+        out : :class:`str`
+            Name of the output file.
+        hdu : :class:`int`
+            Read data from this HDU.
+        blocksize : :class:`int`
+            Number of rows to convert at a time.
+        output : :class:`str`, optional
+            Output format, ``'fits'`` (the default) or ``'pgcopy'``.
+        """
+        from .stream import read_blocks
+        log = self.logName('base.Digestor._streamFITS')
+        nrows = read_header(self._inputFITS, hdu)['NAXIS2']
+        log.info("Converting %d rows in blocks of %d rows.", nrows, blocksize)
+        with self.outputWriter(out, nrows, output) as writer:
+            for old in read_blocks(self._inputFITS, hdu, blocksize,
+                                   columns=self.inputColumns, signed=True):
+                log.debug("writer.write(new)  # rows %d to %d",
+                          writer.written, writer.written + len(old))
+                writer.write(self.convertTable(old))
+        return
+
+    def convertTable(self, old):
+        """Convert FITS data into columns ready for database loading.
+
+        Columns are converted by :meth:`convertColumn`, following
+        :attr:`plan`, on :attr:`threads` threads if more than one
+        is requested.
+
+        Parameters
+        ----------
+        old : :class:`astropy.table.Table`
+            Input data, either the entire table or a block of rows.
+
+        Returns
+        -------
+        :class:`astropy.table.Table`
+            The converted data, with columns in SQL order.
+
+        Raises
+        ------
+        :exc:`ValueError`
+            If the FITS data type cannot be converted to SQL.
+        """
+        from astropy.table import Table
+        steps = self.plan
+        derived = self.deriveColumns(old)
+        converted = [(step['column'], data) for step, data in
+                     zip(steps, self.convertColumns(steps, old, derived))
+                     if data is not None]
+        #
+        # Columns whose type already matches are views of the input data,
+        # which may be memory-mapped.  Don't copy them.
+        #
+        return Table([c[1] for c in converted], names=[c[0] for c in converted],
+                     copy=False)
+
+    def convertColumns(self, steps, old, derived):
+        """Convert several columns, possibly in parallel.
+
+        Conversions of different columns are independent, and most of the
+        underlying NumPy operations release the GIL, so they can run on a
+        pool of :attr:`threads` threads.  The time each thread spends
+        converting columns is logged, relative to the total time.
+
+        Parameters
+        ----------
+        steps : :class:`list`
+            Conversion steps from :meth:`compilePlan`.
+        old : :class:`astropy.table.Table`
+            Input data.
+        derived : :class:`dict`
+            Columns computed by :meth:`deriveColumns`.
+
+        Returns
+        -------
+        :class:`list`
+            The converted data, in the same order as `steps`.
+        """
+        log = self.logName('base.Digestor.convertColumns')
+        if self.columnMetrics is None:
+            convert_one = self.convertColumn
+        else:
+            convert_one = self.measureColumn
+        if self.threads <= 1:
+            return [convert_one(step, old, derived) for step in steps]
+        lock = threading.Lock()
+        busy = dict()
+
+        def convert(step):
+            start = time.perf_counter()
+            try:
+                return convert_one(step, old, derived)
+            finally:
+                elapsed = time.perf_counter() - start
+                name = threading.current_thread().name
+                with lock:
+                    n, t = busy.get(name, (0, 0.0))
+                    busy[name] = (n + 1, t + elapsed)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.threads,
+                                thread_name_prefix='convert') as pool:
+            results = list(pool.map(convert, steps))
+        wall = time.perf_counter() - start
+        for name in sorted(busy):
+            n, t = busy[name]
+            log.info("%s converted %d columns in %.3f s (%.0f%% of %.3f s).",
+                     name, n, t, 100.0*t/wall if wall > 0 else 100.0, wall)
+        return results
+
+    def resetMetrics(self):
+        """Start recording the cost of converting each column in :attr:`plan`.
+
+        :attr:`columnMetrics` maps the name of each column that is written
+        to a :class:`dict` containing the ``kernel`` used, and the
+        totals of ``rows`` converted, ``bytes_in`` read from the input
+        columns, ``bytes_out`` written, ``time`` spent in
+        :meth:`convertColumn` and ``sentinels`` substituted for
+        non-finite values.  The time of ``derived`` columns does not
+        include :meth:`deriveColumns`.
+        """
+        self.columnMetrics = dict()
+        for step in self.plan:
+            if step['kernel'] == 'skip':
+                continue
+            self.columnMetrics[step['column']] = {'column': step['column'],
+                                                  'kernel': step['kernel'],
+                                                  'rows': 0,
+                                                  'bytes_in': 0,
+                                                  'bytes_out': 0,
+                                                  'time': 0.0,
+                                                  'sentinels': 0}
+
+    def mergeMetrics(self, metrics):
+        """Add metrics recorded by another process to :attr:`columnMetrics`.
+
+        Parameters
+        ----------
+        metrics : :class:`dict`
+            The :attr:`columnMetrics` of another process.
+        """
+        for name, m in metrics.items():
+            total = self.columnMetrics[name]
+            for key in ('rows', 'bytes_in', 'bytes_out', 'time', 'sentinels'):
+                total[key] += m[key]
+
+    def metricsTable(self):
+        """List the conversion metrics of all columns, most expensive first.
+
+        Returns
+        -------
+        :class:`list`
+            The values of :attr:`columnMetrics`, sorted by ``time``, or
+            an empty list if no metrics were recorded.
+        """
+        if self.columnMetrics is None:
+            return []
+        return sorted(self.columnMetrics.values(), key=lambda m: m['time'],
+                      reverse=True)
+
+    def inputBytes(self, step, old):
+        """Size of the input data read by one conversion step.
+
+        This method may be overridden in subclasses with kernels that
+        read more than one column.
+
+        Parameters
+        ----------
+        step : :class:`dict`
+            Conversion step from :meth:`compilePlan`.
+        old : :class:`astropy.table.Table`
+            Input data, either the entire table or a block of rows.
+
+        Returns
+        -------
+        :class:`int`
+            The number of bytes.
+        """
+        if step['source'] is None:
+            return 0
+        data = old[step['source']]
+        if step['index'] is not None:
+            return len(old)*data.dtype.itemsize
+        return data.nbytes
+
+    def measureColumn(self, step, old, derived):
+        """Convert the data for a single column, recording its cost.
+
+        Parameters
+        ----------
+        step : :class:`dict`
+            Conversion step from :meth:`compilePlan`.
+        old : :class:`astropy.table.Table`
+            Input data, either the entire table or a block of rows.
+        derived : :class:`dict`
+            Columns computed by :meth:`deriveColumns`.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The result of :meth:`convertColumn`.
+        """
+        start = time.perf_counter()
+        new = self.convertColumn(step, old, derived)
+        elapsed = time.perf_counter() - start
+        if new is not None:
+            #
+            # Each column is converted by one thread at a time.
+            #
+            m = self.columnMetrics[step['column']]
+            m['rows'] += len(old)
+            m['bytes_in'] += self.inputBytes(step, old)
+            m['bytes_out'] += new.nbytes
+            m['time'] += elapsed
+        return new
+
+    def replaceSentinel(self, step, new, view=False):
+        """Replace non-finite values with the sentinel value of a column.
+
+        Parameters
+        ----------
+        step : :class:`dict`
+            Conversion step from :meth:`compilePlan`.
+        new : :class:`numpy.ndarray`
+            Converted data, modified in place unless `view` is set.
+        view : :class:`bool`, optional
+            If ``True``, `new` is a view of the memory-mapped input, which
+            is read-only, so it is copied if any values are replaced.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The converted data, either `new` or a copy.
+        """
+        import numpy as np
+        bad = ~np.isfinite(new)
+        nbad = int(np.count_nonzero(bad))
+        if self.columnMetrics is not None:
+            self.columnMetrics[step['column']]['sentinels'] += nbad
+        if nbad > 0:
+            if view:
+                new = new.copy()
+            new[bad] = step['sentinel']
+        return new
+
+    def planColumn(self, col):
+        """Decide how the data for a single column will be converted.
+
+        This method may be overridden in subclasses with survey-specific
+        requirements.
+
+        Parameters
+        ----------
+        col : :class:`dict`
+            TapSchema column definition.
+
+        Returns
+        -------
+        :class:`dict`
+            A conversion step, see :meth:`planStep`.
+
+        Raises
+        ------
+        :exc:`ValueError`
+            If the FITS data type cannot be converted to SQL.
+        """
+        log = self.logName('base.Digestor.planColumn')
+        name = col['column_name']
+        if name in self.nativeColumns:
+            step = self.planStep(col, 'derived')
+            #
+            # Record the Right Ascension column, which determines the
+            # Declination column, so that the plan changes with :attr:`ra`.
+            #
+            if name in self.nativePositionColumns:
+                step['source'] = self.positionColumns(self.FITS)[0]
+            return step
+        if name == 'random_id':
+            log.info("Skipping %s which will be added by FITS2DB.", name)
+            return self.planStep(col, 'skip')
+        fcol = self.mapping[name]
+        index = None
+        if '[' in fcol:
+            foo = fcol.split('[')
+            fcol = foo[0]
+            index = int(foo[1].strip(']'))
+        fbasetype = self._rebase.sub(r'\2', self.FITS[fcol])
+        types = self._type_map[col['datatype']]
+        if fbasetype == types[0]:
+            log.debug("Type match for %s -> %s.", fcol, name)
+            return self.planStep(col, 'passthrough', fcol, index)
+        if fbasetype in types:
+            log.debug("Safe type conversion possible for %s (%s) -> %s (%s).",
+                      fcol, fbasetype, name, col['datatype'])
+            return self.planStep(col, 'widen', fcol, index)
+        if (fbasetype, col['datatype']) in self._safe_conversion:
+            limit = self._safe_conversion[(fbasetype, col['datatype'])]
+            return self.planStep(col, 'narrow', fcol, index, limit)
+        msg = "No safe data type conversion possible for %s (%s) -> %s (%s)!"
+        log.error(msg, fcol, fbasetype, name, col['datatype'])
+        raise ValueError(msg % (fcol, fbasetype, name, col['datatype']))
+
+    def planStep(self, col, kernel, source=None, index=None, limit=None):
+        """Construct one step of a conversion plan.
+
+        Parameters
+        ----------
+        col : :class:`dict`
+            TapSchema column definition.
+        kernel : :class:`str`
+            Type of conversion, for example ``'passthrough'`` (copy the
+            data unchanged), ``'widen'`` (safe type conversion),
+            ``'narrow'`` (range-checked type conversion), ``'derived'``
+            (computed by :meth:`deriveColumns`) or ``'skip'``.
+        source : :class:`str`, optional
+            FITS column containing the data.
+        index : :class:`int`, optional
+            Element of an array-valued FITS column.
+        limit : :class:`int`, optional
+            For a range-checked conversion, values must be greater than or
+            equal to ``-limit`` and less than `limit`.
+
+        Returns
+        -------
+        :class:`dict`
+            The conversion step.
+        """
+        import numpy as np
+        if col['datatype'] == 'character':
+            m = self._rebase.match(self.FITS[source]) if source else None
+            dtype = np.dtype('S{0}'.format(m.groups()[0] if m else 1))
+        else:
+            dtype = np.dtype(self._np_map[col['datatype']])
+        return {'column': col['column_name'],
+                'source': source,
+                'index': index,
+                'kernel': kernel,
+                'datatype': col['datatype'],
+                'ftype': None if source is None else self._rebase.sub(r'\2', self.FITS[source]),
+                'dtype': dtype,
+                'limit': limit,
+                'sentinel': None}
+
+    def compilePlan(self):
+        """Decide how every column will be converted, before reading any data.
+
+        This must be called again if the table definition, the mapping
+        of FITS columns or :attr:`ra` changes.
+
+        Returns
+        -------
+        :class:`list`
+            The conversion steps, in SQL column order.
+
+        Raises
+        ------
+        :exc:`ValueError`
+            If the FITS data type cannot be converted to SQL.
+        """
+        log = self.logName('base.Digestor.compilePlan')
+        self._plan = [self.planColumn(col) for col in self.tableColumns]
+        log.debug("Compiled conversion plan with %d steps.", len(self._plan))
+        return self._plan
+
+    @property
+    def plan(self):
+        """Conversion plan for the table, compiled by :meth:`compilePlan`
+        when first needed.
+        """
+        if self._plan is None:
+            self.compilePlan()
+        return self._plan
+
+    def formatPlan(self, nrows=None, output='fits'):
+        """Describe the conversion plan, and estimate the size of the output.
+
+        Parameters
+        ----------
+        nrows : :class:`int`, optional
+            Number of rows in the input file.  If set, estimate the size
+            of the output file.
+        output : :class:`str`, optional
+            Output format, ``'fits'`` (the default) or ``'pgcopy'``.
+
+        Returns
+        -------
+        :class:`str`
+            A table of conversion steps, one per line.
+        """
+        lines = ["{0:<24s} {1:<24s} {2:<12s} {3}".format('column', 'source', 'kernel', 'dtype')]
+        width = 0
+        for step in self.plan:
+            if step['kernel'] == 'skip':
+                continue
+            source = step['source'] or ''
+            if step['index'] is not None:
+                source += '[{0:d}]'.format(step['index'])
+            lines.append("{0:<24s} {1:<24s} {2:<12s} {3}".format(step['column'], source,
+                                                                 step['kernel'],
+                                                                 step['dtype'].str))
+            width += step['dtype'].itemsize
+            if output == 'pgcopy':
+                width += 4
+        if nrows is not None:
+            if output == 'pgcopy':
+                from .pgcopy import PGCOPY_HEADER, PGCOPY_TRAILER
+                size = len(PGCOPY_HEADER) + nrows*(2 + width) + len(PGCOPY_TRAILER)
+            else:
+                size = 2*2880 + ((nrows*width + 2879)//2880)*2880
+            lines.append("Estimated size of {0:d} rows: {1:d} bytes ({2:.1f} MiB).".format(nrows, size, size/2**20))
+        return '\n'.join(lines) + '\n'
+
+    def convertColumn(self, step, old, derived):
+        """Convert the data for a single column.
+
+        This method may be overridden in subclasses that add kernels.
+
+        Parameters
+        ----------
+        step : :class:`dict`
+            Conversion step from :meth:`compilePlan`.
+        old : :class:`astropy.table.Table`
+            Input data, either the entire table or a block of rows.
+        derived : :class:`dict`
+            Columns computed by :meth:`deriveColumns`.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            The converted data, or ``None`` if the column should not be
+            written.
+
+        Raises
+        ------
+        :exc:`ValueError`
+            If values do not fit in a narrower SQL data type.
+        """
+        from .kernels import signed_view
+        log = self.logName('base.Digestor.convertColumn')
+        name = step['column']
+        kernel = step['kernel']
+        if kernel == 'derived':
+            log.debug("new['%s'] = derived['%s'].astype(%s)",
+                      name, name, str(step['dtype']))
+            return derived[name].astype(step['dtype'])
+        if kernel == 'skip':
+            return None
+        fcol = step['source']
+        index = step['index']
+        if index is not None:
+            data = old[fcol][:, index]
+            source = "old['{0}'][:, {1:d}]".format(fcol, index)
+        else:
+            data = old[fcol]
+            source = "old['{0}']".format(fcol)
+        if kernel == 'narrow':
+            limit = step['limit']
+            if not ((data >= -limit) & (data <= limit - 1)).all():
+                msg = "No safe data type conversion possible for %s (%s) -> %s (%s)!"
+                log.error(msg, fcol, step['ftype'], name, step['datatype'])
+                raise ValueError(msg % (fcol, step['ftype'], name, step['datatype']))
+            kernel = 'widen'
+        view = kernel == 'passthrough'
+        if view:
+            if data.dtype.kind == 'u' and data.dtype.itemsize == step['dtype'].itemsize:
+                log.debug("new['%s'] = signed_view(%s)", name, source)
+                new = signed_view(data)
+            else:
+                log.debug("new['%s'] = %s", name, source)
+                new = data
+        else:
+            log.debug("new['%s'] = %s.astype(%s)", name, source, str(step['dtype']))
+            new = data.astype(step['dtype'])
+        if step['sentinel'] is not None:
+            new = self.replaceSentinel(step, new, view)
+        return new
+
     def writeTapSchema(self, filename):
         """Write the TapSchema metadata to a JSON file.
 
@@ -608,14 +1571,13 @@ class Digestor(object):
         """
         # log = self.logName('base.Digestor.createSQL')
         sql = [r"CREATE TABLE IF NOT EXISTS {0.schema}.{0.table} (".format(self)]
-        for c in self.tapSchema['columns']:
-            if c['table_name'] == self.table:
-                typ = c['datatype']
-                if typ == 'double':
-                    typ = 'double precision'
-                if typ == 'character':
-                    typ = 'varchar({size})'.format(**c)
-                sql.append("    {0} {1} NOT NULL,".format(c['column_name'], typ))
+        for c in self.tableColumns:
+            typ = c['datatype']
+            if typ == 'double':
+                typ = 'double precision'
+            if typ == 'character':
+                typ = 'varchar({size})'.format(**c)
+            sql.append("    {0} {1} NOT NULL,".format(c['column_name'], typ))
         sql[-1] = sql[-1].replace(',', '')
         sql.append(r") WITH (fillfactor=100);")
         return '\n'.join(sql) + '\n'
@@ -630,3 +1592,50 @@ class Digestor(object):
         """
         with open(filename, 'w') as POST:
             POST.write(self.createSQL())
+
+
+def _convert_rows(digestor, filename, hdu, start, stop, blocksize, layout, seed,
+                  output='fits'):
+    """Convert a range of rows in a worker process.
+
+    Parameters
+    ----------
+    digestor : :class:`Digestor`
+        The object defining the conversion.
+    filename : :class:`str`
+        Name of the output file.
+    hdu : :class:`int`
+        Read data from this HDU.
+    start : :class:`int`
+        Index of the first row to convert.
+    stop : :class:`int`
+        Convert rows up to, but not including, this row.
+    blocksize : :class:`int`
+        Number of rows to convert at a time, or ``None``.
+    layout : :class:`tuple`
+        If set, write into a file prepared by
+        :meth:`~digestor.stream.FITSBlockWriter.allocate`, otherwise
+        `filename` is a separate file for these rows.
+    seed : :class:`int`
+        Seed for random number generation.
+    output : :class:`str`, optional
+        Output format, ``'fits'`` (the default) or ``'pgcopy'``.
+
+    Returns
+    -------
+    :class:`dict`
+        The :attr:`~Digestor.columnMetrics` of these rows, if recorded.
+    """
+    import numpy as np
+    from .stream import FITSPartWriter, read_blocks
+    np.random.seed(seed)
+    if layout is None:
+        writer = digestor.outputWriter(filename, stop - start, output)
+    else:
+        writer = FITSPartWriter(filename, stop - start, start, layout)
+    with writer:
+        for old in read_blocks(digestor._inputFITS, hdu, blocksize,
+                               start=start, stop=stop,
+                               columns=digestor.inputColumns, signed=True):
+            writer.write(digestor.convertTable(old))
+    return digestor.columnMetrics
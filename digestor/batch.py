@@ -0,0 +1,178 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.batch
+==============
+
+Convert several SDSS tables, listed in a manifest, with one command.
+"""
+import json
+import os
+import shlex
+import sys
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import yaml
+
+from .base import read_yaml
+from .sdss import get_options as sdss_options
+from .sdss import main as sdss_main
+from .sdss import template_environment
+
+
+def _split(options):
+    """Convert options in a manifest into a list of arguments.
+
+    Parameters
+    ----------
+    options : :class:`str` or :class:`list`
+        Options as a single string, or a list of arguments.
+
+    Returns
+    -------
+    :class:`list`
+        A list of arguments.
+    """
+    if options is None:
+        return []
+    if isinstance(options, str):
+        return shlex.split(options)
+    return [str(o) for o in options]
+
+
+def read_manifest(filename):
+    """Read a list of conversion jobs from a YAML manifest.
+
+    The manifest has an optional ``options`` entry, containing
+    :command:`sdss2dl` options shared by every job, and a ``jobs`` entry.
+    Each job has ``fits`` and ``sql`` entries, and optional ``table``
+    and ``options`` entries, for example::
+
+        options: -s sdss_dr16 -d "Sloan Digital Sky Survey Data Release 16"
+        jobs:
+            - fits: specObj-dr16.fits
+              sql: specobjall.sql
+              table: specobjall
+              options: -r plug_ra
+
+    Parameters
+    ----------
+    filename : :class:`str`
+        Name of the manifest file.
+
+    Returns
+    -------
+    :class:`list`
+        A list of :command:`sdss2dl` argument lists, one per job.
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If a job is missing a required entry.
+    """
+    with open(filename) as f:
+        manifest = yaml.safe_load(f)
+    shared = _split(manifest.get('options'))
+    jobs = list()
+    for k, job in enumerate(manifest['jobs']):
+        for key in ('fits', 'sql'):
+            if key not in job:
+                raise ValueError("Job {0:d} in {1} has no '{2}' entry!".format(k, filename, key))
+        args = shared + _split(job.get('options'))
+        if 'table' in job:
+            args += ['--table', str(job['table'])]
+        args += [str(job['fits']), str(job['sql'])]
+        jobs.append(args)
+    return jobs
+
+
+def run_job(args):
+    """Run one :command:`sdss2dl` conversion.
+
+    Parameters
+    ----------
+    args : :class:`list`
+        Command-line arguments.
+
+    Returns
+    -------
+    :class:`dict`
+        Summary of the job.
+    """
+    start = time.time()
+    error = None
+    try:
+        status = sdss_main(args)
+    except Exception as e:
+        status = 2
+        error = '{0}: {1}'.format(type(e).__name__, str(e))
+    return {'args': args,
+            'status': status,
+            'error': error,
+            'elapsed': time.time() - start}
+
+
+def get_options():
+    """Parse command-line options.
+
+    Returns
+    -------
+    :class:`argparse.Namespace`
+        The parsed options.
+    """
+    parser = ArgumentParser(description=__doc__.split("\n")[-2],
+                            prog=os.path.basename(sys.argv[0]))
+    parser.add_argument('-n', '--processes', dest='processes', metavar='N',
+                        type=int, default=os.cpu_count(),
+                        help='Run up to N jobs at the same time (default %(default)s).')
+    parser.add_argument('-o', '--summary', dest='summary', metavar='FILE',
+                        help='Write a summary of all jobs to FILE (default MANIFEST.summary.json).')
+    parser.add_argument('manifest', help='YAML file listing the tables to convert.')
+    return parser.parse_args()
+
+
+def main():
+    """Entry-point for command-line script.
+
+    Returns
+    -------
+    :class:`int`
+        An integer suitable for passing to :func:`sys.exit`.
+    """
+    options = get_options()
+    if options.summary is None:
+        options.summary = os.path.splitext(options.manifest)[0] + '.summary.json'
+    try:
+        jobs = read_manifest(options.manifest)
+    except (OSError, KeyError, ValueError, yaml.YAMLError) as e:
+        print("Could not read {0}: {1}".format(options.manifest, str(e)), file=sys.stderr)
+        return 1
+    #
+    # Check every job before starting any of them.  Load the shared
+    # configuration once, so that worker processes inherit it.
+    #
+    for args in jobs:
+        try:
+            job_options = sdss_options(args)
+        except SystemExit:
+            print("Invalid options for job: {0}".format(' '.join(args)), file=sys.stderr)
+            return 1
+        if os.path.exists(job_options.config):
+            read_yaml(job_options.config)
+    template_environment()
+    start = time.time()
+    with ProcessPoolExecutor(max_workers=options.processes) as pool:
+        summary = list(pool.map(run_job, jobs))
+    for job in summary:
+        print("{0:d} {1:8.1f} s {2}".format(job['status'], job['elapsed'], ' '.join(job['args'])))
+        if job['error'] is not None:
+            print("    " + job['error'])
+    failed = len([job for job in summary if job['status'] != 0])
+    with open(options.summary, 'w') as JSON:
+        json.dump({'manifest': options.manifest,
+                   'elapsed': time.time() - start,
+                   'failed': failed,
+                   'jobs': summary}, JSON, indent=4)
+    return int(failed > 0)
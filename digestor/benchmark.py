@@ -0,0 +1,364 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.benchmark
+==================
+
+Benchmark the stages of an SDSS conversion on synthetic data.
+"""
+import glob
+import json
+import logging
+import os
+import platform
+import subprocess as sub
+import sys
+import time
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+
+from . import __version__
+
+#
+# Benchmarks, in the order they are run.
+#
+BENCHMARKS = ('parseSQL', 'mapColumns', 'processFITS', 'processFITS_blocks',
+              'processFITS_pgcopy', 'main')
+#
+# Schema used for the synthetic table.
+#
+_schema = 'benchmark'
+
+
+def prepare_input(directory, nrows, seed=1):
+    """Find or generate the synthetic input files.
+
+    Generating a large file takes much longer than converting it, so
+    existing files are reused.
+
+    Parameters
+    ----------
+    directory : :class:`str`
+        Directory containing the input files.
+    nrows : :class:`int`
+        Number of rows.
+    seed : :class:`int`, optional
+        Seed for random number generation.
+
+    Returns
+    -------
+    :class:`tuple`
+        The names of the FITS file and the SQL file.
+    """
+    from .synthetic import write_synthetic
+    base = os.path.join(directory, 'synthetic_{0:d}_{1:d}'.format(nrows, seed))
+    fits, sql = base + '.fits', base + '.sql'
+    if not (os.path.exists(fits) and os.path.exists(sql)):
+        write_synthetic(fits + '.tmp', nrows, seed=seed, sql=sql)
+        os.replace(fits + '.tmp', fits)
+    return (fits, sql)
+
+
+def _prepared(fits, sql, threads=1):
+    """Construct an :class:`~digestor.sdss.SDSS` object ready to convert data.
+    """
+    from .sdss import SDSS
+    s = SDSS(_schema, os.path.splitext(os.path.basename(sql))[0],
+             threads=threads, join=False)
+    s.parseFITS(fits)
+    s.parseSQL(sql)
+    s.mapColumns()
+    s.sortColumns()
+    return s
+
+
+def _cases(fits, sql, blocksize, threads):
+    """Construct the setup and run functions of each benchmark.
+
+    Each setup function returns the argument of the run function, so
+    that only the run function is timed.
+    """
+    from .sdss import SDSS, _data_dir, main
+    table = os.path.splitext(os.path.basename(sql))[0]
+    sql_files = sorted(glob.glob(os.path.join(_data_dir, '*.sql'))) + [sql]
+
+    def parse_setup():
+        return SDSS(_schema, table)
+
+    def parse_run(s):
+        s.parseSchema(sql_files, cache=False)
+
+    def map_setup():
+        s = SDSS(_schema, table, join=False)
+        s.parseFITS(fits)
+        s.parseSQL(sql)
+        return s
+
+    def process_setup():
+        return _prepared(fits, sql, threads)
+
+    def main_setup():
+        return ['-J', '-s', _schema, '-t', table, '-o', table + '.sql',
+                '-T', str(threads), fits, sql]
+
+    return {'parseSQL': (parse_setup, parse_run, False),
+            'mapColumns': (map_setup, lambda s: s.mapColumns(), False),
+            'processFITS': (process_setup,
+                            lambda s: s.processFITS(overwrite=True), True),
+            'processFITS_blocks': (process_setup,
+                                   lambda s: s.processFITS(overwrite=True, blocksize=blocksize),
+                                   True),
+            'processFITS_pgcopy': (process_setup,
+                                   lambda s: s.processFITS(overwrite=True, output='pgcopy'),
+                                   True),
+            'main': (main_setup, main, True)}
+
+
+def run_benchmarks(fits, sql, names=BENCHMARKS, repeat=3, blocksize=100000,
+                   threads=1, directory=None):
+    """Run benchmarks.
+
+    Parameters
+    ----------
+    fits : :class:`str`
+        Name of the input FITS file.
+    sql : :class:`str`
+        Name of the SQL file defining the table.
+    names : :class:`list`, optional
+        Names of the benchmarks to run, from :data:`BENCHMARKS`.
+    repeat : :class:`int`, optional
+        Run each benchmark this many times (default 3).
+    blocksize : :class:`int`, optional
+        Number of rows in each block, for ``processFITS_blocks``.
+    threads : :class:`int`, optional
+        Convert columns on this many threads.
+    directory : :class:`str`, optional
+        Write output files in a temporary directory in this directory.
+
+    Returns
+    -------
+    :class:`dict`
+        For each benchmark, the time of each run, the best and mean
+        times and, for benchmarks that convert data, the number of rows
+        converted per second in the best run.
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If a benchmark is unknown, or a conversion fails.
+    """
+    from .header import read_header
+    from .sdss import SDSS
+    nrows = read_header(fits, 1)['NAXIS2']
+    cases = _cases(os.path.abspath(fits), os.path.abspath(sql), blocksize, threads)
+    for name in names:
+        if name not in cases:
+            raise ValueError("Unknown benchmark: {0}!".format(name))
+    results = dict()
+    cwd = os.getcwd()
+    if directory is not None:
+        directory = os.path.abspath(directory)
+    with TemporaryDirectory(dir=directory) as d:
+        handler = SDSS.configureLog(os.path.join(d, 'benchmark.log'))
+        os.chdir(d)
+        try:
+            for name in names:
+                setup, run, convert = cases[name]
+                times = list()
+                for k in range(repeat):
+                    argument = setup()
+                    start = time.perf_counter()
+                    status = run(argument)
+                    times.append(time.perf_counter() - start)
+                    if name == 'main' and status != 0:
+                        raise ValueError("sdss2dl failed with status {0}!".format(status))
+                    #
+                    # Keep the logs, which are small, in case of failure.
+                    #
+                    for f in os.listdir(d):
+                        if not f.endswith('.log'):
+                            os.remove(f)
+                best = min(times)
+                results[name] = {'times': times,
+                                 'best': best,
+                                 'mean': sum(times)/len(times)}
+                if convert:
+                    results[name]['rows_per_second'] = nrows/best if best > 0 else None
+        finally:
+            os.chdir(cwd)
+            logging.getLogger(SDSS.rootLogger).removeHandler(handler)
+            handler.close()
+    return results
+
+
+def _commit():
+    """Identify the commit of the package source, if it is a git checkout.
+    """
+    try:
+        out = sub.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                      stdout=sub.PIPE, stderr=sub.DEVNULL, check=True,
+                      universal_newlines=True).stdout
+    except (OSError, sub.CalledProcessError):
+        return None
+    return out.strip()
+
+
+def record(results, nrows, repeat):
+    """Describe a set of benchmark results, for storage.
+
+    Parameters
+    ----------
+    results : :class:`dict`
+        Results from :func:`run_benchmarks`.
+    nrows : :class:`int`
+        Number of rows in the input file.
+    repeat : :class:`int`
+        Number of runs of each benchmark.
+
+    Returns
+    -------
+    :class:`dict`
+        The results, with the version, commit, date, host and library
+        versions.
+    """
+    import numpy as np
+    return {'version': __version__,
+            'commit': _commit(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'host': platform.node(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'rows': nrows,
+            'repeat': repeat,
+            'benchmarks': results}
+
+
+def read_results(filename):
+    """Read stored benchmark results.
+
+    Parameters
+    ----------
+    filename : :class:`str`
+        Name of a file containing one JSON record per line.
+
+    Returns
+    -------
+    :class:`list`
+        The records, oldest first, or an empty list if `filename` does
+        not exist.
+    """
+    if not os.path.exists(filename):
+        return []
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def compare(current, previous):
+    """Compare two sets of benchmark results.
+
+    Parameters
+    ----------
+    current : :class:`dict`
+        A record from :func:`record`.
+    previous : :class:`dict`
+        An earlier record, or ``None``.
+
+    Returns
+    -------
+    :class:`str`
+        A table of the best time of each benchmark and, if `previous`
+        contains the same benchmark, its best time and the ratio of the
+        two.  A ratio greater than one is a slowdown.
+    """
+    lines = ["{0:<20s} {1:>10s} {2:>10s} {3:>7s}".format('benchmark', 'best (s)',
+                                                          'before (s)', 'ratio')]
+    before = dict() if previous is None else previous['benchmarks']
+    for name, r in current['benchmarks'].items():
+        if name in before:
+            b = before[name]['best']
+            lines.append("{0:<20s} {1:10.4f} {2:10.4f} {3:7.2f}".format(name, r['best'], b,
+                                                                        r['best']/b if b > 0 else float('inf')))
+        else:
+            lines.append("{0:<20s} {1:10.4f} {2:>10s} {3:>7s}".format(name, r['best'], '-', '-'))
+    if previous is not None:
+        lines.append("Compared to {0} ({1}) of {2}.".format(previous['version'],
+                                                           (previous['commit'] or 'unknown')[:10],
+                                                           previous['date']))
+    return '\n'.join(lines) + '\n'
+
+
+def get_options(args=None):
+    """Parse command-line options.
+
+    Parameters
+    ----------
+    args : :class:`list`, optional
+        Parse these arguments instead of :data:`sys.argv`.
+
+    Returns
+    -------
+    :class:`argparse.Namespace`
+        The parsed options.
+    """
+    parser = ArgumentParser(description=__doc__.split("\n")[-2],
+                            prog=os.path.basename(sys.argv[0]))
+    parser.add_argument('-B', '--benchmark', dest='names', metavar='NAME',
+                        action='append', choices=BENCHMARKS,
+                        help='Run only benchmark NAME; may be repeated (default all of {0}).'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('-b', '--block-size', dest='blocksize', metavar='N',
+                        type=int, default=100000,
+                        help='Convert blocks of N rows in processFITS_blocks (default %(default)s).')
+    parser.add_argument('-d', '--directory', metavar='DIR', default='.',
+                        help='Find or generate input files, and write temporary output files, in DIR (default %(default)s).')
+    parser.add_argument('-g', '--generate', action='store_true',
+                        help='Only generate the input files.')
+    parser.add_argument('-n', '--rows', dest='rows', metavar='N',
+                        type=int, default=1000000,
+                        help='Number of rows in the synthetic input (default %(default)s).')
+    parser.add_argument('-o', '--results', dest='results', metavar='FILE',
+                        default='benchmarks.jsonl',
+                        help='Append results to FILE, and compare with the previous results for the same number of rows on the same host (default %(default)s).')
+    parser.add_argument('-r', '--repeat', metavar='N', type=int, default=3,
+                        help='Run each benchmark N times (default %(default)s).')
+    parser.add_argument('-s', '--seed', metavar='N', type=int, default=1,
+                        help='Seed for random number generation (default %(default)s).')
+    parser.add_argument('-T', '--threads', dest='threads', metavar='N',
+                        type=int, default=1,
+                        help='Convert columns on N threads (default %(default)s).')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """Entry-point for command-line script.
+
+    Parameters
+    ----------
+    args : :class:`list`, optional
+        Use these command-line arguments instead of :data:`sys.argv`.
+
+    Returns
+    -------
+    :class:`int`
+        An integer suitable for passing to :func:`sys.exit`.
+    """
+    options = get_options(args)
+    fits, sql = prepare_input(options.directory, options.rows, options.seed)
+    if options.generate:
+        print("Input files: {0}, {1}.".format(fits, sql))
+        return 0
+    names = options.names if options.names else BENCHMARKS
+    try:
+        results = run_benchmarks(fits, sql, names, repeat=options.repeat,
+                                 blocksize=options.blocksize,
+                                 threads=options.threads,
+                                 directory=options.directory)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    current = record(results, options.rows, options.repeat)
+    previous = [r for r in read_results(options.results)
+                if r['rows'] == current['rows'] and r['host'] == current['host']]
+    print(compare(current, previous[-1] if previous else None), end='')
+    with open(options.results, 'a') as f:
+        f.write(json.dumps(current) + '\n')
+    return 0
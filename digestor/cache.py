@@ -0,0 +1,252 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.cache
+==============
+
+Decide whether the output of a processing stage can be reused.
+
+Each output file has a small stamp file next to it, containing a key that
+identifies everything the output depends on: the input files, the
+configuration and options of the stage, and the version of this package.
+An output is reused only if its stamp has the key of the current run, so
+changing any input reruns exactly the stages that depend on it.
+
+Results that depend only on the contents of packaged or user-supplied
+files, such as parsed SQL definitions, are kept in a per-user cache
+directory instead, keyed by a digest of those contents.
+"""
+import hashlib
+import json
+import os
+
+from . import __version__
+
+#
+# Suffix of the stamp file written next to each output.
+#
+STAMP_SUFFIX = '.stage.json'
+#
+# Environment variable that overrides the cache directory.  If it is set
+# to an empty string, nothing is cached.
+#
+CACHE_ENV = 'DIGESTOR_CACHE'
+
+
+def file_identity(filename):
+    """Identify the contents of a file without reading it.
+
+    Parameters
+    ----------
+    filename : :class:`str`
+        Name of the file.
+
+    Returns
+    -------
+    :class:`dict`
+        The name, size and modification time of the file.  The size and
+        time are ``None`` if the file does not exist.
+    """
+    try:
+        s = os.stat(filename)
+    except FileNotFoundError:
+        return {'name': os.path.basename(filename), 'size': None, 'mtime': None}
+    return {'name': os.path.basename(filename),
+            'size': s.st_size,
+            'mtime': s.st_mtime_ns}
+
+
+def stage_key(stage, inputs, parameters):
+    """Compute the key of a processing stage.
+
+    Parameters
+    ----------
+    stage : :class:`str`
+        Name of the stage.
+    inputs : :class:`list`
+        Names of the files read by the stage.
+    parameters : :class:`dict`
+        Anything else that determines the output, such as configuration
+        and options.  Values that are not JSON types are converted
+        to strings.
+
+    Returns
+    -------
+    :class:`str`
+        A hexadecimal digest.
+    """
+    description = {'stage': stage,
+                   'version': __version__,
+                   'inputs': [file_identity(f) for f in inputs],
+                   'parameters': parameters}
+    data = json.dumps(description, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def is_current(outputs, key):
+    """Check whether existing outputs were written by a stage with `key`.
+
+    Parameters
+    ----------
+    outputs : :class:`list`
+        Names of the output files.
+    key : :class:`str`
+        Key of the stage, from :func:`stage_key`.
+
+    Returns
+    -------
+    :class:`bool`
+        ``True`` if every output exists and has a stamp matching `key`.
+    """
+    for o in outputs:
+        try:
+            with open(o + STAMP_SUFFIX) as f:
+                stamp = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if stamp.get('key') != key or not os.path.exists(o):
+            return False
+    return True
+
+
+def write_stamp(outputs, key):
+    """Record that `outputs` are complete.
+
+    Parameters
+    ----------
+    outputs : :class:`list`
+        Names of the output files.  Files that were not actually written
+        are not stamped.
+    key : :class:`str`
+        Key of the stage, from :func:`stage_key`.
+    """
+    for o in outputs:
+        if not os.path.isfile(o):
+            continue
+        with open(o + STAMP_SUFFIX, 'w') as f:
+            json.dump({'key': key, 'version': __version__}, f)
+
+
+def remove_stamp(outputs):
+    """Remove the stamps of `outputs`, before they are rewritten.
+
+    Parameters
+    ----------
+    outputs : :class:`list`
+        Names of the output files.
+    """
+    for o in outputs:
+        try:
+            os.remove(o + STAMP_SUFFIX)
+        except FileNotFoundError:
+            pass
+
+
+def content_digest(filenames):
+    """Compute a digest of the contents of several files.
+
+    Parameters
+    ----------
+    filenames : :class:`list`
+        Names of the files, in order.
+
+    Returns
+    -------
+    :class:`str`
+        A hexadecimal digest.
+    """
+    h = hashlib.sha256()
+    for f in filenames:
+        with open(f, 'rb') as i:
+            data = i.read()
+        h.update('{0:d}:'.format(len(data)).encode('ascii'))
+        h.update(data)
+    return h.hexdigest()
+
+
+def cache_directory():
+    """Directory containing cached results.
+
+    Returns
+    -------
+    :class:`str`
+        The value of :envvar:`DIGESTOR_CACHE` if set, otherwise a
+        ``digestor`` directory in :envvar:`XDG_CACHE_HOME` or
+        ``~/.cache``.  ``None`` if caching is disabled.
+    """
+    if CACHE_ENV in os.environ:
+        return os.environ[CACHE_ENV] or None
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'digestor')
+
+
+def _cache_file(kind, digest):
+    """Name of the file containing a cached result, or ``None``.
+    """
+    d = cache_directory()
+    if d is None:
+        return None
+    return os.path.join(d, '{0}-{1}.json'.format(kind, digest))
+
+
+def read_cache(kind, digest):
+    """Read a cached result.
+
+    Parameters
+    ----------
+    kind : :class:`str`
+        Kind of result, for example ``'schema'``.
+    digest : :class:`str`
+        Digest of the inputs, from :func:`content_digest`.
+
+    Returns
+    -------
+    :class:`dict`
+        The cached result, or ``None`` if there is none, or if it was
+        written by a different version of this package.
+    """
+    filename = _cache_file(kind, digest)
+    if filename is None:
+        return None
+    try:
+        with open(filename) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get('version') != __version__:
+        return None
+    return cached.get('data')
+
+
+def write_cache(kind, digest, data):
+    """Store a result in the cache.
+
+    Failure to write the cache, for example to a read-only directory,
+    is ignored.
+
+    Parameters
+    ----------
+    kind : :class:`str`
+        Kind of result, for example ``'schema'``.
+    digest : :class:`str`
+        Digest of the inputs, from :func:`content_digest`.
+    data : :class:`dict`
+        The result, which must be JSON-serializable.
+    """
+    filename = _cache_file(kind, digest)
+    if filename is None:
+        return
+    tmp = '{0}.{1:d}'.format(filename, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        with open(tmp, 'w') as f:
+            json.dump({'version': __version__, 'data': data}, f)
+        #
+        # Other processes never see a partial file.
+        #
+        os.replace(tmp, filename)
+    except OSError:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
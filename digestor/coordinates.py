@@ -0,0 +1,136 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.coordinates
+====================
+
+Vectorized transformation of ICRS positions to galactic and ecliptic
+coordinates.
+
+Both transformations are fixed rotations of unit vectors, so whole arrays
+are converted with a single matrix product.  The rotations are built in the
+same way as the STILTS command ``addskycoords icrs galactic|ecliptic``,
+which uses the Starlink Positional Astronomy Library (PAL): ICRS is first
+rotated to FK5 J2000 (``palHfk5z``), then to galactic (``palEqgal``) or to
+mean ecliptic coordinates of J2000 (``palEqecl``).  The results agree with
+STILTS to within double precision round-off, about :math:`10^{-10}` degrees.
+"""
+import numpy as np
+
+#
+# Orientation of FK5 with respect to Hipparcos (ICRS), as a rotation
+# vector in arcsec.
+#
+_fk5_orientation = np.array([-19.9e-3, -9.1e-3, 22.9e-3])
+#
+# FK5 J2000 to galactic.
+#
+_fk5_galactic = np.array([[-0.054875539726, -0.873437108010, -0.483834985808],
+                          [+0.494109453312, -0.444829589425, +0.746982251810],
+                          [-0.867666135858, -0.198076386122, +0.455983795705]])
+#
+# Mean obliquity of the ecliptic at J2000 (IAU 1976), in arcsec.
+#
+_obliquity = 84381.448
+
+
+def _axial_rotation(v):
+    """Rotation matrix corresponding to the axial vector `v` (``palDav2m``).
+
+    Parameters
+    ----------
+    v : :class:`numpy.ndarray`
+        Axial vector; the rotation angle in radians is its length.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        A 3x3 rotation matrix.
+    """
+    phi = np.sqrt((v*v).sum())
+    s = np.sin(phi)
+    c = np.cos(phi)
+    f = 1.0 - c
+    x, y, z = v/phi
+    return np.array([[x*x*f + c, x*y*f + z*s, x*z*f - y*s],
+                     [x*y*f - z*s, y*y*f + c, y*z*f + x*s],
+                     [x*z*f + y*s, y*z*f - x*s, z*z*f + c]])
+
+
+#
+# ICRS to FK5 J2000 is the inverse of the FK5 to ICRS orientation.
+#
+_icrs_fk5 = _axial_rotation(np.radians(_fk5_orientation/3600.0)).T
+_eps = np.radians(_obliquity/3600.0)
+_fk5_ecliptic = np.array([[1.0, 0.0, 0.0],
+                          [0.0, np.cos(_eps), np.sin(_eps)],
+                          [0.0, -np.sin(_eps), np.cos(_eps)]])
+#
+# Complete transformations.
+#
+ICRS_GALACTIC = np.dot(_fk5_galactic, _icrs_fk5)
+ICRS_ECLIPTIC = np.dot(_fk5_ecliptic, _icrs_fk5)
+
+
+def rotate(matrix, ra, dec):
+    """Apply a rotation to spherical coordinates.
+
+    Parameters
+    ----------
+    matrix : :class:`numpy.ndarray`
+        A 3x3 rotation matrix.
+    ra : array-like
+        Longitude in degrees.
+    dec : array-like
+        Latitude in degrees.
+
+    Returns
+    -------
+    :class:`tuple`
+        Rotated longitude, in the range 0 to 360, and latitude,
+        both in degrees.
+    """
+    ra = np.radians(np.asarray(ra, dtype=np.float64))
+    dec = np.radians(np.asarray(dec, dtype=np.float64))
+    cd = np.cos(dec)
+    p = np.stack((cd*np.cos(ra), cd*np.sin(ra), np.sin(dec)))
+    x, y, z = np.dot(matrix, p.reshape(3, -1)).reshape(p.shape)
+    lon = np.mod(np.arctan2(y, x), 2.0*np.pi)
+    lat = np.arctan2(z, np.hypot(x, y))
+    return (np.degrees(lon), np.degrees(lat))
+
+
+def galactic(ra, dec):
+    """Convert ICRS positions to galactic coordinates.
+
+    Parameters
+    ----------
+    ra : array-like
+        Right Ascension in degrees.
+    dec : array-like
+        Declination in degrees.
+
+    Returns
+    -------
+    :class:`tuple`
+        Galactic longitude and latitude in degrees.
+    """
+    return rotate(ICRS_GALACTIC, ra, dec)
+
+
+def ecliptic(ra, dec):
+    """Convert ICRS positions to mean ecliptic coordinates of J2000.
+
+    Parameters
+    ----------
+    ra : array-like
+        Right Ascension in degrees.
+    dec : array-like
+        Declination in degrees.
+
+    Returns
+    -------
+    :class:`tuple`
+        Ecliptic longitude and latitude in degrees.
+    """
+    return rotate(ICRS_ECLIPTIC, ra, dec)
@@ -0,0 +1,143 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.header
+===============
+
+Read FITS headers without importing :mod:`astropy.io.fits`.
+
+Importing :mod:`astropy` takes much longer than reading a header, so
+operations that only need metadata, such as writing the SQL and JSON
+files for a table, read headers with this module instead.
+"""
+import gzip
+
+#
+# Size of a FITS block and of a header card, in bytes.
+#
+_block = 2880
+_card = 80
+
+
+def _value(text):
+    """Convert the value field of a header card to a Python object.
+    """
+    text = text.strip()
+    if text.startswith("'"):
+        #
+        # A quote inside a string is written as two quotes.
+        #
+        value = list()
+        i = 1
+        while i < len(text):
+            if text[i] == "'":
+                if text[i + 1:i + 2] != "'":
+                    break
+                i += 1
+            value.append(text[i])
+            i += 1
+        return ''.join(value).rstrip()
+    text = text.split('/', 1)[0].strip()
+    if text == 'T':
+        return True
+    if text == 'F':
+        return False
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text.replace('D', 'E'))
+    except ValueError:
+        return text
+
+
+def _data_size(header):
+    """Size of the data following `header`, in bytes, including padding.
+    """
+    naxis = header.get('NAXIS', 0)
+    if naxis == 0:
+        return 0
+    n = 1
+    for k in range(1, naxis + 1):
+        n *= header['NAXIS{0:d}'.format(k)]
+    n = (abs(header['BITPIX']) // 8) * header.get('GCOUNT', 1) * (header.get('PCOUNT', 0) + n)
+    return ((n + _block - 1) // _block) * _block
+
+
+def _read_one(f):
+    """Read the header at the current position of `f`.
+
+    Returns ``None`` at the end of the file.
+    """
+    header = dict()
+    while True:
+        block = f.read(_block)
+        if len(block) < _block:
+            return None
+        for i in range(0, _block, _card):
+            card = block[i:i + _card].decode('ascii', errors='replace')
+            keyword = card[:8].strip()
+            if keyword == 'END':
+                return header
+            if card[8:10] == '= ' and keyword not in header:
+                header[keyword] = _value(card[10:])
+
+
+def read_header(filename, hdu=0):
+    """Read one header of a FITS file.
+
+    Only the header blocks are read; data are skipped.  Files compressed
+    with :command:`gzip` are also supported, although they have to be
+    decompressed up to the requested header.
+
+    Parameters
+    ----------
+    filename : :class:`str`
+        Name of the FITS file.
+    hdu : :class:`int`, optional
+        Read this HDU (default 0).
+
+    Returns
+    -------
+    :class:`dict`
+        A mapping of keyword to value.  Only the first occurrence of a
+        keyword is kept.  Commentary keywords are omitted.
+
+    Raises
+    ------
+    :exc:`IndexError`
+        If `filename` does not contain `hdu`.
+    """
+    with open(filename, 'rb') as f:
+        compressed = f.read(2) == b'\x1f\x8b'
+    opener = gzip.open if compressed else open
+    with opener(filename, 'rb') as f:
+        for k in range(hdu + 1):
+            header = _read_one(f)
+            if header is None:
+                raise IndexError("{0} does not contain HDU {1:d}!".format(filename, hdu))
+            if k < hdu:
+                f.seek(_data_size(header), 1)
+    return header
+
+
+def table_columns(header):
+    """Names and formats of the columns of a binary table.
+
+    Parameters
+    ----------
+    header : :class:`dict`
+        A header returned by :func:`read_header`.
+
+    Returns
+    -------
+    :class:`tuple`
+        A list of column names and a list of ``TFORM`` values, in
+        column order, as in the ``names`` and ``formats`` attributes of
+        :class:`astropy.io.fits.ColDefs`.
+    """
+    n = header.get('TFIELDS', 0)
+    names = [header.get('TTYPE{0:d}'.format(k), '') for k in range(1, n + 1)]
+    formats = [header['TFORM{0:d}'.format(k)] for k in range(1, n + 1)]
+    return (names, formats)
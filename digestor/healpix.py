@@ -0,0 +1,181 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.healpix
+================
+
+Vectorized HEALPix pixel indexing.
+
+These functions follow the HEALPix reference implementation
+(Górski et al. 2005, ApJ, 622, 759) and are equivalent to the STILTS
+functions ``healpixRingIndex(k, ra, dec)`` and ``healpixNestIndex(k, ra, dec)``,
+where ``k`` is the HEALPix order, and ``nside = 2**k``.
+"""
+import numpy as np
+
+
+def _fmodulo(v1, v2):
+    """Floating point modulo that always returns a value in ``[0, v2)``.
+    """
+    r = np.fmod(v1, v2)
+    r = np.where(r < 0, r + v2, r)
+    return np.where(r >= v2, 0.0, r)
+
+
+def _spread_bits(i):
+    """Interleave zero bits between the bits of `i`.
+
+    Parameters
+    ----------
+    i : :class:`numpy.ndarray`
+        Integers less than ``2**29``.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        Integers with the bits of `i` in the even bit positions.
+    """
+    i = i.astype(np.int64)
+    i = (i | (i << 16)) & 0x0000FFFF0000FFFF
+    i = (i | (i << 8)) & 0x00FF00FF00FF00FF
+    i = (i | (i << 4)) & 0x0F0F0F0F0F0F0F0F
+    i = (i | (i << 2)) & 0x3333333333333333
+    i = (i | (i << 1)) & 0x5555555555555555
+    return i
+
+
+def _locate(order, ra, dec):
+    """Compute the intermediate quantities shared by both pixel schemes.
+
+    Parameters
+    ----------
+    order : :class:`int`
+        HEALPix order, ``nside = 2**order``.
+    ra : array-like
+        Right Ascension in degrees.
+    dec : array-like
+        Declination in degrees.
+
+    Returns
+    -------
+    :class:`tuple`
+        A tuple containing ``nside``, ``z``, ``tt``, a mask selecting the
+        equatorial region, and the ``jp``, ``jm`` coordinates of each point.
+    """
+    if order < 0 or order > 29:
+        raise ValueError("HEALPix order must be in the range 0 to 29!")
+    nside = 1 << order
+    theta = np.pi/2 - np.radians(np.asarray(dec, dtype=np.float64))
+    phi = _fmodulo(np.radians(np.asarray(ra, dtype=np.float64)), 2.0*np.pi)
+    z = np.cos(theta)
+    za = np.abs(z)
+    tt = _fmodulo(phi * (2.0 / np.pi), 4.0)
+    equator = za <= 2.0/3.0
+    jp = np.zeros(z.shape, dtype=np.int64)
+    jm = np.zeros(z.shape, dtype=np.int64)
+    #
+    # Equatorial region.
+    #
+    temp1 = nside * (0.5 + tt[equator])
+    temp2 = nside * z[equator] * 0.75
+    jp[equator] = (temp1 - temp2).astype(np.int64)
+    jm[equator] = (temp1 + temp2).astype(np.int64)
+    #
+    # Polar caps.  Near the poles, use sin(theta) to preserve precision.
+    #
+    polar = ~equator
+    ntt = np.minimum(tt[polar].astype(np.int64), 3)
+    tp = tt[polar] - ntt
+    zp = za[polar]
+    tp_theta = theta[polar]
+    near = (tp_theta < 0.01) | (tp_theta > 3.14159 - 0.01)
+    tmp = np.where(near,
+                   nside * np.sin(tp_theta) / np.sqrt((1.0 + zp) / 3.0),
+                   nside * np.sqrt(3.0 * (1.0 - zp)))
+    jp[polar] = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+    jm[polar] = np.minimum(((1.0 - tp) * tmp).astype(np.int64), nside - 1)
+    return (nside, z, tt, equator, jp, jm)
+
+
+def ring_index(order, ra, dec):
+    """Compute HEALPix pixel numbers in the RING scheme.
+
+    Parameters
+    ----------
+    order : :class:`int`
+        HEALPix order, ``nside = 2**order``.
+    ra : array-like
+        Right Ascension in degrees.
+    dec : array-like
+        Declination in degrees.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        Pixel numbers as 64-bit integers.
+    """
+    nside, z, tt, equator, jp, jm = _locate(order, ra, dec)
+    nl4 = 4 * nside
+    ncap = 2 * nside * (nside - 1)
+    npix = 12 * nside * nside
+    pix = np.zeros(z.shape, dtype=np.int64)
+    #
+    # Equatorial region.
+    #
+    ir = nside + 1 + jp[equator] - jm[equator]
+    kshift = 1 - (ir & 1)
+    t1 = jp[equator] + jm[equator] - nside + kshift + 1 + nl4 + nl4
+    ip = (t1 >> 1) % nl4
+    pix[equator] = ncap + (ir - 1) * nl4 + ip
+    #
+    # Polar caps.
+    #
+    polar = ~equator
+    ir = jp[polar] + jm[polar] + 1
+    ip = np.minimum((tt[polar] * ir).astype(np.int64), 4 * ir - 1)
+    pix[polar] = np.where(z[polar] > 0,
+                          2 * ir * (ir - 1) + ip,
+                          npix - 2 * ir * (ir + 1) + ip)
+    return pix
+
+
+def nest_index(order, ra, dec):
+    """Compute HEALPix pixel numbers in the NESTED scheme.
+
+    Parameters
+    ----------
+    order : :class:`int`
+        HEALPix order, ``nside = 2**order``.
+    ra : array-like
+        Right Ascension in degrees.
+    dec : array-like
+        Declination in degrees.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        Pixel numbers as 64-bit integers.
+    """
+    nside, z, tt, equator, jp, jm = _locate(order, ra, dec)
+    face = np.zeros(z.shape, dtype=np.int64)
+    ix = np.zeros(z.shape, dtype=np.int64)
+    iy = np.zeros(z.shape, dtype=np.int64)
+    #
+    # Equatorial region.
+    #
+    ifp = jp[equator] >> order
+    ifm = jm[equator] >> order
+    face[equator] = np.where(ifp == ifm, ifp | 4,
+                             np.where(ifp < ifm, ifp, ifm + 8))
+    ix[equator] = jm[equator] & (nside - 1)
+    iy[equator] = nside - (jp[equator] & (nside - 1)) - 1
+    #
+    # Polar caps.
+    #
+    polar = ~equator
+    ntt = np.minimum(tt[polar].astype(np.int64), 3)
+    north = z[polar] >= 0
+    face[polar] = np.where(north, ntt, ntt + 8)
+    ix[polar] = np.where(north, nside - jm[polar] - 1, jp[polar])
+    iy[polar] = np.where(north, nside - jp[polar] - 1, jm[polar])
+    return (face << (2 * order)) + _spread_bits(ix) + (_spread_bits(iy) << 1)
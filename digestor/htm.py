@@ -0,0 +1,205 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.htm
+============
+
+Vectorized Hierarchical Triangular Mesh (HTM) indexing.
+
+This follows the JHU HTM library (Kunszt, Szalay & Thakar 2001), which is
+also used by the STILTS function ``htmIndex(level, ra, dec)``.  All points
+descend the triangle tree together, one level at a time.
+"""
+import numpy as np
+
+#
+# Vertices of the octahedron.
+#
+_anchor = np.array([[0.0, 0.0, 1.0],
+                    [1.0, 0.0, 0.0],
+                    [0.0, 1.0, 0.0],
+                    [-1.0, 0.0, 0.0],
+                    [0.0, -1.0, 0.0],
+                    [0.0, 0.0, -1.0]])
+#
+# Root trixels S0, S1, S2, S3, N0, N1, N2, N3, with IDs 8 to 15,
+# as indexes into _anchor.
+#
+_base = np.array([[1, 5, 2],
+                  [2, 5, 3],
+                  [3, 5, 4],
+                  [4, 5, 1],
+                  [1, 0, 4],
+                  [4, 0, 3],
+                  [3, 0, 2],
+                  [2, 0, 1]])
+#
+# Tolerance for points that lie on the edge of a trixel.
+#
+_epsilon = 1.0e-15
+
+
+#
+# Number of points processed together, chosen so that intermediate arrays
+# stay in cache.
+#
+_chunk = 8192
+
+
+def _edge(p, a, b):
+    """Compute the triple product ``p . (a x b)`` for arrays of vectors.
+
+    Vectors are stored as tuples of ``(x, y, z)`` arrays.
+    """
+    return (p[0]*(a[1]*b[2] - b[1]*a[2]) +
+            p[1]*(a[2]*b[0] - b[2]*a[0]) +
+            p[2]*(a[0]*b[1] - b[0]*a[1]))
+
+
+def _midpoint(a, b):
+    """Normalized midpoint of arrays of vectors.
+    """
+    x = a[0] + b[0]
+    y = a[1] + b[1]
+    z = a[2] + b[2]
+    norm = np.sqrt(x*x + y*y + z*z)
+    return (x/norm, y/norm, z/norm)
+
+
+def _inside(p, v0, v1, v2):
+    """Test whether the points `p` are inside the trixels (`v0`, `v1`, `v2`).
+    """
+    return ((_edge(p, v0, v1) >= -_epsilon) &
+            (_edge(p, v1, v2) >= -_epsilon) &
+            (_edge(p, v2, v0) >= -_epsilon))
+
+
+def _root(x, y, z):
+    """Find the root trixel containing each point.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        Index into the list of root trixels, in the range 0 to 7.
+    """
+    quadrant = np.select([(x > 0) & (y >= 0),
+                          (x <= 0) & (y > 0),
+                          (x < 0) & (y <= 0),
+                          (x >= 0) & (y < 0)],
+                         [0, 1, 2, 3], default=0)
+    #
+    # Quadrant 0 is N3 or S0, quadrant 1 is N2 or S1, etc.
+    #
+    return np.where(z >= 0, 7 - quadrant, quadrant)
+
+
+def _select(inside, a, b, d, e):
+    """Select one of four vectors according to the first true member of `inside`.
+    """
+    in0, in1, in2 = inside
+    return tuple(np.where(in0, a[i], np.where(in1, b[i], np.where(in2, d[i], e[i])))
+                 for i in range(3))
+
+
+def _descend(level, p, exact=False):
+    """Descend the HTM tree for one chunk of points.
+
+    In the reference algorithm, a point is assigned to the first child
+    trixel for which all three edge tests pass.  Away from the edges of
+    its parent, only the edge shared with the central child can fail, so
+    by default only those three edges are tested.  Points close enough to
+    *any* edge that the two methods could disagree are flagged, and should
+    be recomputed with `exact` set.
+
+    Parameters
+    ----------
+    level : :class:`int`
+        Depth of the HTM tree.
+    p : :class:`tuple`
+        Unit vectors as a tuple of ``(x, y, z)`` arrays.
+    exact : :class:`bool`, optional
+        If ``True``, test all edges of every child, exactly as the
+        reference algorithm does.
+
+    Returns
+    -------
+    :class:`tuple`
+        Trixel IDs as 64-bit integers and a boolean array flagging points
+        that must be recomputed with `exact` set.
+    """
+    root = _root(*p)
+    htmid = root.astype(np.int64) + 8
+    v0, v1, v2 = [tuple(_anchor[_base[root, k], i] for i in range(3))
+                  for k in range(3)]
+    #
+    # The edges of the root trixels are the coordinate planes.  Moving one
+    # level down at most halves the triple product of a point with an edge,
+    # so require a margin that is still safe at the final level.
+    #
+    margin = 1.0e-14 * 2.0**level
+    flag = ((np.abs(p[0]) <= margin) | (np.abs(p[1]) <= margin) |
+            (np.abs(p[2]) <= margin))
+    for k in range(level):
+        w0 = _midpoint(v1, v2)
+        w1 = _midpoint(v0, v2)
+        w2 = _midpoint(v0, v1)
+        if exact:
+            in0 = _inside(p, v0, w2, w1)
+            in1 = _inside(p, v1, w0, w2)
+            in2 = _inside(p, v2, w1, w0)
+        else:
+            e0 = _edge(p, w2, w1)
+            e1 = _edge(p, w0, w2)
+            e2 = _edge(p, w1, w0)
+            margin *= 0.5
+            flag |= ((np.abs(e0) <= margin) | (np.abs(e1) <= margin) |
+                     (np.abs(e2) <= margin))
+            in0 = e0 >= -_epsilon
+            in1 = e1 >= -_epsilon
+            in2 = e2 >= -_epsilon
+        htmid = (htmid << 2) + np.where(in0, 0, np.where(in1, 1, np.where(in2, 2, 3)))
+        #
+        # Child 0 is (v0, w2, w1), child 1 is (v1, w0, w2),
+        # child 2 is (v2, w1, w0) and child 3 is (w0, w1, w2).
+        #
+        inside = (in0, in1, in2)
+        v0, v1, v2 = (_select(inside, v0, v1, v2, w0),
+                      _select(inside, w2, w0, w1, w1),
+                      _select(inside, w1, w2, w0, w2))
+    return (htmid, flag)
+
+
+def htm_index(level, ra, dec):
+    """Compute HTM trixel IDs.
+
+    Parameters
+    ----------
+    level : :class:`int`
+        Depth of the HTM tree, in the range 0 to 30.
+    ra : array-like
+        Right Ascension in degrees.
+    dec : array-like
+        Declination in degrees.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        Trixel IDs as 64-bit integers, in the range ``8*4**level`` to
+        ``16*4**level - 1``.
+    """
+    if level < 0 or level > 30:
+        raise ValueError("HTM level must be in the range 0 to 30!")
+    ra = np.radians(np.atleast_1d(np.asarray(ra, dtype=np.float64)))
+    dec = np.radians(np.atleast_1d(np.asarray(dec, dtype=np.float64)))
+    cd = np.cos(dec)
+    x = cd*np.cos(ra)
+    y = cd*np.sin(ra)
+    z = np.sin(dec)
+    htmid = np.zeros(x.shape, dtype=np.int64)
+    for i in range(0, x.size, _chunk):
+        j = slice(i, i + _chunk)
+        htmid[j], flag = _descend(level, (x[j], y[j], z[j]))
+        if flag.any():
+            f = np.nonzero(flag)[0] + i
+            htmid[f], _ = _descend(level, (x[f], y[f], z[f]), exact=True)
+    return htmid
@@ -0,0 +1,161 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.kernels
+================
+
+Vectorized kernels for column conversions that NumPy does not provide
+directly.
+"""
+import numpy as np
+
+#
+# Number of rows processed together, chosen so that intermediate arrays
+# stay in cache.
+#
+_chunk = 8192
+#
+# Number of digits handled by parse_integers(), and the largest unsigned
+# 64-bit integer, split into the top four digits and the rest.
+#
+_ndigits = 24
+_max_top = np.uint64(1844)
+_max_rest = np.uint64(6744073709551615)
+
+
+def signed_view(col, offset=False):
+    """Reinterpret unsigned integers as signed integers with the same bits.
+
+    This is how 64-bit unsigned identifiers are stored in a ``bigint``
+    column (quasi-unsigned integers).  No data are copied.
+
+    Parameters
+    ----------
+    col : :class:`numpy.ndarray`
+        Unsigned integers.  If `offset` is set, signed integers stored
+        with the FITS unsigned convention instead, *i.e.* the raw values
+        of a column with ``TZERO`` equal to :math:`2^{N-1}`.
+    offset : :class:`bool`, optional
+        If ``True``, convert raw FITS values by flipping their sign bit.
+        This modifies `col` in place.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        A view of `col` as signed integers, with the same byte order.
+    """
+    col = np.asarray(col)
+    signed = col.dtype.newbyteorder('=').str.replace('u', 'i')
+    signed = np.dtype(signed).newbyteorder(col.dtype.byteorder)
+    if offset:
+        bits = col.view(signed.str.replace('i', 'u'))
+        np.bitwise_xor(bits, np.array(1 << (8*col.dtype.itemsize - 1),
+                                      dtype=bits.dtype), out=bits)
+    return col.view(signed)
+
+
+def _parse_chunk(codes, wrap):
+    """Parse right-justified integers from a 2D array of character codes.
+
+    Rows with trailing blanks are flagged.
+    """
+    n, w = codes.shape
+    rows = np.arange(n)
+    d = codes - np.uint8(48)
+    digit = d < 10
+    nonblank = (codes != 32) & (codes != 0)
+    first = np.argmax(nonblank, axis=1)
+    blank = ~nonblank[rows, first]
+    #
+    # Every character from the first non-blank one to the end must be a
+    # digit, except for a leading sign.
+    #
+    r = np.argmax(~digit[:, ::-1], axis=1)
+    last = np.where(digit[rows, w - 1 - r], -1, w - 1 - r)
+    lead = codes[rows, first]
+    negative = lead == 45
+    signed = negative | (lead == 43)
+    valid = digit[:, -1] & ((last < first) | (signed & (last == first)))
+    bad = ~blank & ~valid
+    #
+    # Combine pairs of digits, then pairs of pairs, etc., with blanks
+    # and signs as zeros.
+    #
+    dz = np.zeros((n, _ndigits), dtype=np.uint8)
+    if w > _ndigits:
+        bad |= (digit[:, :w - _ndigits] & (d[:, :w - _ndigits] > 0)).any(axis=1)
+        np.copyto(dz, d[:, w - _ndigits:], where=digit[:, w - _ndigits:])
+    else:
+        np.copyto(dz[:, _ndigits - w:], d, where=digit)
+    v2 = dz[:, 0::2]*np.uint8(10) + dz[:, 1::2]
+    v4 = v2[:, 0::2].astype(np.uint16)*np.uint16(100) + v2[:, 1::2]
+    v8 = v4[:, 0::2].astype(np.uint32)*np.uint32(10000) + v4[:, 1::2]
+    top = v8[:, 0].astype(np.uint64)
+    rest = v8[:, 1].astype(np.uint64)*np.uint64(10**8) + v8[:, 2]
+    bad |= (top > _max_top) | ((top == _max_top) & (rest > _max_rest))
+    value = top*np.uint64(10**16) + rest
+    bad |= negative & (value > np.uint64(2**63))
+    if not wrap:
+        bad |= ~negative & (value >= np.uint64(2**63))
+    result = signed_view(value)
+    np.negative(result, out=result, where=negative)
+    return (result, bad, nonblank[:, -1] | blank)
+
+
+def parse_integers(col, wrap=True):
+    """Parse fixed-width ASCII integers directly from the character data.
+
+    Each field may contain leading and trailing blanks, an optional sign
+    and decimal digits.  Blank fields, and masked values, are parsed as 0.
+    Nothing is raised for invalid fields; they are flagged instead.  The
+    input is not modified.
+
+    Parameters
+    ----------
+    col : array-like
+        Strings, as bytes or unicode.
+    wrap : :class:`bool`, optional
+        If ``True`` (the default), values from :math:`2^{63}` to
+        :math:`2^{64} - 1` are stored as negative 64-bit integers with
+        the same bits (quasi-unsigned integers).  Otherwise they are flagged.
+
+    Returns
+    -------
+    :class:`tuple`
+        The values as 64-bit integers, and a boolean array flagging fields
+        that are not integers or are out of range.  Flagged values are
+        undefined.
+    """
+    mask = None
+    if isinstance(col, np.ma.MaskedArray):
+        mask = np.ma.getmaskarray(col)
+        col = col.data
+    col = np.ascontiguousarray(col)
+    n = col.shape[0]
+    if col.dtype.kind == 'U':
+        #
+        # Anything that is not ASCII is replaced by an invalid character.
+        #
+        codes = col.reshape(n, 1).view(np.uint32)
+        codes = np.where(codes < 128, codes, 127).astype(np.uint8)
+        col = codes.view('S{0:d}'.format(codes.shape[1])).reshape(n)
+    else:
+        codes = col.reshape(n, 1).view(np.uint8)
+    result = np.zeros((n,), dtype=np.int64)
+    bad = np.zeros((n,), dtype=bool)
+    justified = np.ones((n,), dtype=bool)
+    for i in range(0, n, _chunk):
+        j = slice(i, i + _chunk)
+        result[j], bad[j], justified[j] = _parse_chunk(codes[j], wrap)
+    if not justified.all():
+        #
+        # Rare: fields with trailing blanks are parsed again, right-justified.
+        #
+        k = np.nonzero(~justified)[0]
+        fixed = np.char.rjust(np.char.rstrip(col[k]), col.dtype.itemsize)
+        fixed = np.ascontiguousarray(fixed).reshape(len(k), 1).view(np.uint8)
+        result[k], bad[k], _ = _parse_chunk(fixed, wrap)
+    if mask is not None:
+        result[mask] = 0
+        bad &= ~mask
+    return (result, bad)
@@ -0,0 +1,220 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.pgcopy
+===============
+
+Write tables in PostgreSQL binary ``COPY`` format, so that they can be
+loaded with ``COPY ... FROM ... WITH (FORMAT binary)``, without any
+further conversion.
+
+The format consists of a fixed header, then for each row a 16-bit field
+count followed by a 32-bit length and the value of each field, and finally
+a 16-bit trailer.  All integers are in network (big-endian) byte order.
+"""
+import os
+import shutil
+
+import numpy as np
+
+#
+# Signature, flags and header extension length.
+#
+PGCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + np.array([0, 0], dtype='>i4').tobytes()
+PGCOPY_TRAILER = np.array([-1], dtype='>i2').tobytes()
+#
+# Binary representation of each SQL data type.  Character data has
+# variable length.
+#
+pg_types = {'bigint': np.dtype('>i8'),
+            'integer': np.dtype('>i4'),
+            'smallint': np.dtype('>i2'),
+            'real': np.dtype('>f4'),
+            'double': np.dtype('>f8'),
+            'boolean': np.dtype('u1'),
+            'character': None}
+
+
+def _field(col, datatype):
+    """Convert one column into fields of binary rows.
+
+    Numeric columns that are already big-endian with the correct width,
+    such as columns of a memory-mapped FITS file, are not copied.
+
+    Parameters
+    ----------
+    col : array-like
+        Column data.
+    datatype : :class:`str`
+        SQL data type of the column.
+
+    Returns
+    -------
+    :class:`tuple`
+        A 2D array of bytes containing the value of each field, and the
+        length of each value in bytes, or ``None`` if all values have the
+        full width of the array.
+    """
+    if isinstance(col, np.ma.MaskedArray):
+        col = col.filled()
+    col = np.asarray(col)
+    n = col.shape[0]
+    dtype = pg_types[datatype]
+    if dtype is not None:
+        if col.dtype != dtype:
+            col = col.astype(dtype)
+        return (col.reshape(n, 1).view(np.uint8), None)
+    #
+    # Strings are sent without trailing blanks.
+    #
+    if col.dtype.kind == 'U':
+        col = np.char.encode(col, 'utf-8')
+    nchar = np.char.str_len(np.char.rstrip(col))
+    return (col.reshape(n, 1).view(np.uint8), nchar)
+
+
+def _rows(table, datatypes):
+    """Convert `table` into PostgreSQL binary ``COPY`` rows.
+
+    Every field is copied once, directly into its place in a buffer of
+    rows padded to the maximum width of each string column.  If there are
+    string columns, the padding is then removed.
+
+    Parameters
+    ----------
+    table : :class:`astropy.table.Table`
+        A block of data.
+    datatypes : :class:`dict`
+        SQL data type of each column.
+
+    Returns
+    -------
+    :class:`numpy.ndarray`
+        The rows, as a 1D array of bytes.
+    """
+    n = len(table)
+    fields = [_field(table[c], datatypes[c]) for c in table.colnames]
+    width = 2 + sum([4 + f[0].shape[1] for f in fields])
+    buffer = np.empty((n, width), dtype=np.uint8)
+    buffer[:, :2] = np.array([len(fields)], dtype='>i2').view(np.uint8)
+    keep = None
+    i = 2
+    for value, nchar in fields:
+        size = value.shape[1]
+        if nchar is None:
+            buffer[:, i:i+4] = np.array([size], dtype='>i4').view(np.uint8)
+        else:
+            buffer[:, i:i+4] = nchar.astype('>i4').reshape(n, 1).view(np.uint8)
+            if keep is None:
+                keep = np.ones((n, width), dtype=bool)
+            keep[:, i+4:i+4+size] = np.arange(size) < nchar.reshape(n, 1)
+        buffer[:, i+4:i+4+size] = value
+        i += 4 + size
+    if keep is None:
+        return buffer.reshape(-1)
+    return buffer[keep]
+
+
+def records(table, datatypes):
+    """Convert `table` into PostgreSQL binary ``COPY`` rows.
+
+    Parameters
+    ----------
+    table : :class:`astropy.table.Table`
+        A block of data.
+    datatypes : :class:`dict`
+        SQL data type of each column.
+
+    Returns
+    -------
+    :class:`bytes`
+        The rows, without header or trailer.
+    """
+    return _rows(table, datatypes).tobytes()
+
+
+class PGCopyWriter(object):
+    """Write a table in PostgreSQL binary ``COPY`` format, one block of
+    rows at a time.
+
+    Parameters
+    ----------
+    filename : :class:`str`
+        Name of the output file.
+    datatypes : :class:`dict`
+        SQL data type of each column, as in TapSchema metadata.
+    """
+
+    def __init__(self, filename, datatypes):
+        self.filename = filename
+        self.datatypes = datatypes
+        self.written = 0
+        self._fileobj = open(filename, 'wb')
+        self._fileobj.write(PGCOPY_HEADER)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._fileobj.close()
+            os.remove(self.filename)
+        return False
+
+    def write(self, table):
+        """Append a block of rows to the file.
+
+        Parameters
+        ----------
+        table : :class:`astropy.table.Table`
+            A block of data.
+        """
+        self._fileobj.write(_rows(table, self.datatypes))
+        self.written += len(table)
+
+    def close(self):
+        """Write the trailer and close the file.
+        """
+        if self._fileobj.closed:
+            return
+        self._fileobj.write(PGCOPY_TRAILER)
+        self._fileobj.close()
+
+
+def concatenate(filenames, out):
+    """Combine several binary ``COPY`` files with the same columns.
+
+    Parameters
+    ----------
+    filenames : :class:`list`
+        Files to combine, in order.  They are removed afterwards.
+    out : :class:`str`
+        Name of the combined file.
+    """
+    with open(out, 'wb') as o:
+        o.write(PGCOPY_HEADER)
+        for f in filenames:
+            size = os.stat(f).st_size - len(PGCOPY_HEADER) - len(PGCOPY_TRAILER)
+            with open(f, 'rb') as i:
+                i.seek(len(PGCOPY_HEADER))
+                shutil.copyfileobj(_Limited(i, size), o)
+            os.remove(f)
+        o.write(PGCOPY_TRAILER)
+
+
+class _Limited(object):
+    """Read at most `size` bytes from a file object.
+    """
+
+    def __init__(self, fileobj, size):
+        self.fileobj = fileobj
+        self.size = size
+
+    def read(self, n=-1):
+        if n < 0 or n > self.size:
+            n = self.size
+        data = self.fileobj.read(n)
+        self.size -= len(data)
+        return data
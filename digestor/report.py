@@ -0,0 +1,215 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.report
+===============
+
+Measure the time, I/O and memory used by each stage of a conversion, and
+write the measurements to a JSON run report.
+
+Bytes read and written are counted by the kernel for each ``read()`` and
+``write()`` call of this process, so they do not include data accessed
+through memory maps, nor I/O done by child processes such as STILTS.
+Where the operating system allows it, the peak resident set size (RSS)
+is reset at the start of each stage, so it is the peak of that stage
+alone; otherwise it is the peak of the process so far.
+"""
+import json
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from . import __version__
+
+
+def _io_counters():
+    """Bytes read and written by this process so far.
+
+    Returns
+    -------
+    :class:`tuple`
+        Bytes read and written, or ``(None, None)`` if unknown.
+    """
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict([line.split(':') for line in f if ':' in line])
+        return (int(counters['rchar']), int(counters['wchar']))
+    except (OSError, KeyError, ValueError):
+        return (None, None)
+
+
+def _reset_peak():
+    """Reset the peak RSS of this process, if the operating system allows it.
+
+    Returns
+    -------
+    :class:`bool`
+        ``True`` if the peak was reset.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return False
+    return True
+
+
+def _maxrss(who):
+    """Maximum RSS reported by :func:`resource.getrusage`, in bytes.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(who).ru_maxrss
+    #
+    # Linux reports KiB, macOS reports bytes.
+    #
+    return rss if sys.platform == 'darwin' else rss*1024
+
+
+def peak_rss():
+    """Peak resident set size of this process.
+
+    Returns
+    -------
+    :class:`int`
+        The peak RSS in bytes, or ``None`` if unknown.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])*1024
+    except (OSError, ValueError):
+        pass
+    if resource is None:
+        return None
+    return _maxrss(resource.RUSAGE_SELF)
+
+
+def _children_cpu():
+    """CPU time used by child processes that have finished.
+    """
+    if resource is None:
+        return 0.0
+    r = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return r.ru_utime + r.ru_stime
+
+
+def _delta(end, start):
+    """Difference of two counters that may be unknown.
+    """
+    if end is None or start is None:
+        return None
+    return end - start
+
+
+class RunReport(object):
+    """Collect measurements of the stages of a conversion.
+
+    Parameters
+    ----------
+    log : :class:`logging.Logger`, optional
+        If set, log a summary of each stage when it finishes.
+    info : :class:`dict`, optional
+        Other information to include in the report, for example the
+        names of the input files.
+
+    Attributes
+    ----------
+    stages : :class:`list`
+        One :class:`dict` of measurements per stage, in the order the
+        stages finished.
+    status : :class:`int`
+        Exit status of the conversion, if known.
+    """
+
+    def __init__(self, log=None, info=None):
+        self.log = log
+        self.info = dict() if info is None else info
+        self.stages = list()
+        self.status = None
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self._started = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+
+    @contextmanager
+    def stage(self, name):
+        """Measure a stage of the conversion.
+
+        The measurements are recorded even if the stage raises an
+        exception.  In that case, the name of the exception is recorded
+        as ``error``.
+
+        Parameters
+        ----------
+        name : :class:`str`
+            Name of the stage, usually the name of the method.
+
+        Yields
+        ------
+        :class:`dict`
+            The record of this stage, to which the stage may add
+            its own measurements.
+        """
+        record = {'stage': name}
+        reset = _reset_peak()
+        read, written = _io_counters()
+        children = _children_cpu()
+        cpu = time.process_time()
+        wall = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = type(e).__name__
+            raise
+        finally:
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.process_time() - cpu
+            record['children_cpu'] = _children_cpu() - children
+            end_read, end_written = _io_counters()
+            record['bytes_read'] = _delta(end_read, read)
+            record['bytes_written'] = _delta(end_written, written)
+            record['peak_rss'] = peak_rss()
+            record['peak_rss_stage'] = reset
+            self.stages.append(record)
+            if self.log is not None:
+                self.log.info("Stage %s: %.3f s wall, %.3f s CPU, peak RSS %s.",
+                              name, record['wall'], record['cpu'],
+                              'unknown' if record['peak_rss'] is None else
+                              '{0:.1f} MiB'.format(record['peak_rss']/2**20))
+
+    def summary(self):
+        """Construct the complete report.
+
+        Returns
+        -------
+        :class:`dict`
+            The report, which can be serialized to JSON.
+        """
+        report = {'version': __version__,
+                  'started': self._started,
+                  'status': self.status,
+                  'wall': time.perf_counter() - self._wall,
+                  'cpu': time.process_time() - self._cpu,
+                  'peak_rss': max([s['peak_rss'] for s in self.stages
+                                   if s['peak_rss'] is not None] + [0]) or peak_rss(),
+                  'children_peak_rss': None if resource is None else _maxrss(resource.RUSAGE_CHILDREN),
+                  'stages': self.stages}
+        report.update(self.info)
+        return report
+
+    def write(self, filename):
+        """Write the report to a JSON file.
+
+        Parameters
+        ----------
+        filename : :class:`str`
+            Name of the file.
+        """
+        with open(filename, 'w') as f:
+            json.dump(self.summary(), f, indent=4)
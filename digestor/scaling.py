@@ -0,0 +1,409 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.scaling
+================
+
+Measure how the memory used by :meth:`~digestor.base.Digestor.processFITS`
+grows with the number of rows, and check it against a budget.
+
+Each conversion runs in a new process, so that measurements do not
+depend on what ran before.  Two measures of memory are recorded:
+
+* The peak of anonymous resident memory, sampled every few milliseconds,
+  including any worker processes, above its level before the conversion.
+  Unlike the peak RSS, it does not count pages of the memory-mapped
+  input file, which the kernel may reclaim at any time.
+* The peak of memory allocated through Python and NumPy, as traced by
+  :mod:`tracemalloc`, in the converting process only.
+
+A straight line is fitted to each measure as a function of the number of
+rows.  Its slope, in bytes per row, is what grows with the size of the
+table: a conversion that streams its input should have a slope near
+zero, and one that holds the table in memory should have a slope near
+the size of one input row plus two output rows, the converted table and
+the copy made while writing it.  An extra copy of a column or of the
+table shows up as a larger slope.
+"""
+import json
+import os
+import sys
+import threading
+import time
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+
+#
+# Conversions to measure, and the arguments of processFITS for each.
+# None is replaced by the block size.
+#
+VARIANTS = {'processFITS': {},
+            'processFITS_blocks': {'blocksize': None},
+            'processFITS_pgcopy': {'blocksize': None, 'output': 'pgcopy'},
+            'processFITS_parallel': {'blocksize': None, 'processes': 2}}
+#
+# Largest allowed slope of memory use, in bytes per row.  Converting the
+# whole synthetic table uses about 670 bytes per row: an input row of 181
+# bytes, two output rows of 217 bytes and temporary columns.
+#
+BUDGETS = {'processFITS': 768,
+           'processFITS_blocks': 16,
+           'processFITS_pgcopy': 16,
+           'processFITS_parallel': 16}
+#
+# Measures of memory that are checked against the budget.
+#
+MEASURES = ('peak_anon', 'tracemalloc')
+
+
+def _anon(pid='self'):
+    """Anonymous resident memory of a process, in bytes.
+    """
+    try:
+        with open('/proc/{0}/status'.format(pid)) as f:
+            for line in f:
+                if line.startswith('RssAnon:'):
+                    return int(line.split()[1])*1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def _children(pid):
+    """Find the child processes of a process.
+    """
+    children = list()
+    for p in os.listdir('/proc'):
+        if p.isdigit():
+            try:
+                with open('/proc/{0}/stat'.format(p)) as f:
+                    stat = f.read()
+            except OSError:
+                continue
+            #
+            # The command name may contain spaces, but is enclosed in
+            # parentheses.
+            #
+            if int(stat[stat.rindex(')') + 2:].split()[1]) == pid:
+                children.append(int(p))
+    return children
+
+
+class MemorySampler(threading.Thread):
+    """Sample the anonymous resident memory of this process in the background.
+
+    Parameters
+    ----------
+    interval : :class:`float`, optional
+        Time between samples in seconds (default 0.005).
+    children : :class:`bool`, optional
+        If ``True``, add the memory of all child processes.
+
+    Attributes
+    ----------
+    peak : :class:`int`
+        Largest sample so far, in bytes, or ``None`` if the memory
+        cannot be measured.
+    """
+
+    def __init__(self, interval=0.005, children=False):
+        super(MemorySampler, self).__init__(daemon=True)
+        self.interval = interval
+        self.children = children
+        self.peak = None
+        self._done = threading.Event()
+
+    def sample(self):
+        """Measure the memory now.
+
+        Returns
+        -------
+        :class:`int`
+            The memory in bytes, or ``None`` if it cannot be measured.
+        """
+        total = _anon()
+        if total is not None and self.children:
+            for p in _children(os.getpid()):
+                total += _anon(p) or 0
+        return total
+
+    def run(self):
+        while True:
+            m = self.sample()
+            if m is not None and (self.peak is None or m > self.peak):
+                self.peak = m
+            if self._done.wait(self.interval):
+                break
+
+    def stop(self):
+        """Stop sampling and wait for the thread to finish.
+        """
+        self._done.set()
+        self.join()
+
+
+def measure(fits, sql, variant, blocksize=10000):
+    """Measure the memory used by one conversion.
+
+    This function is meant to run in a new process, see :func:`run_scaling`.
+
+    Parameters
+    ----------
+    fits : :class:`str`
+        Name of the input FITS file.
+    sql : :class:`str`
+        Name of the SQL file defining the table.
+    variant : :class:`str`
+        Name of the conversion, from :data:`VARIANTS`.
+    blocksize : :class:`int`, optional
+        Number of rows in each block.
+
+    Returns
+    -------
+    :class:`dict`
+        The number of rows, the anonymous memory before the conversion,
+        the increase of its peak during the conversion, the peak RSS
+        and the :mod:`tracemalloc` peak, in bytes, and the wall time.
+    """
+    import gc
+    import tracemalloc
+    from .benchmark import _prepared
+    from .header import read_header
+    from .report import _reset_peak, peak_rss
+    kwargs = dict([(k, blocksize if v is None else v)
+                   for k, v in VARIANTS[variant].items()])
+    fits, sql = os.path.abspath(fits), os.path.abspath(sql)
+    cwd = os.getcwd()
+    with TemporaryDirectory(dir=os.path.dirname(fits)) as d:
+        os.chdir(d)
+        try:
+            s = _prepared(fits, sql)
+            gc.collect()
+            sampler = MemorySampler(children=kwargs.get('processes', 1) > 1)
+            baseline = sampler.sample()
+            _reset_peak()
+            tracemalloc.start()
+            start = time.perf_counter()
+            sampler.start()
+            try:
+                s.processFITS(overwrite=True, **kwargs)
+            finally:
+                sampler.stop()
+                wall = time.perf_counter() - start
+                traced = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        finally:
+            os.chdir(cwd)
+    return {'variant': variant,
+            'rows': read_header(fits, 1)['NAXIS2'],
+            'baseline': baseline,
+            'peak_anon': None if baseline is None else sampler.peak - baseline,
+            'peak_rss': peak_rss(),
+            'tracemalloc': traced,
+            'wall': wall}
+
+
+def fit(measurements, measure):
+    """Fit memory use as a linear function of the number of rows.
+
+    Parameters
+    ----------
+    measurements : :class:`list`
+        Results of :func:`measure` for one variant.
+    measure : :class:`str`
+        The measure to fit, from :data:`MEASURES`.
+
+    Returns
+    -------
+    :class:`tuple`
+        The slope, in bytes per row, and the intercept, in bytes, or
+        ``(None, None)`` if the measure is unknown.
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If there are fewer than two different numbers of rows.
+    """
+    import numpy as np
+    rows = np.array([m['rows'] for m in measurements], dtype=np.float64)
+    if np.unique(rows).size < 2:
+        raise ValueError("At least two different numbers of rows are needed to fit memory use!")
+    if any([m[measure] is None for m in measurements]):
+        return (None, None)
+    memory = np.array([m[measure] for m in measurements], dtype=np.float64)
+    slope, intercept = np.polyfit(rows, memory, 1)
+    return (float(slope), float(intercept))
+
+
+def run_scaling(sizes, variants=tuple(VARIANTS), budgets=None,
+                blocksize=10000, directory='.', seed=1):
+    """Measure memory use for several sizes and compare it to the budgets.
+
+    Parameters
+    ----------
+    sizes : :class:`list`
+        Numbers of rows.  Synthetic input files are generated if needed.
+    variants : :class:`list`, optional
+        Names of the conversions to measure, from :data:`VARIANTS`.
+    budgets : :class:`dict`, optional
+        Largest allowed slope of each variant in bytes per row, replacing
+        those in :data:`BUDGETS`.
+    blocksize : :class:`int`, optional
+        Number of rows in each block (default 10000).  Each size should
+        hold at least two blocks, one per process of
+        ``processFITS_parallel``; smaller tables are converted in smaller
+        blocks, so their memory use does not fit the same line.
+    directory : :class:`str`, optional
+        Find or generate input files, and write output files, in this
+        directory.
+    seed : :class:`int`, optional
+        Seed for random number generation.
+
+    Returns
+    -------
+    :class:`dict`
+        For each variant, the measurements, the budget and, for each
+        measure, the slope, the intercept and whether the slope is within
+        the budget.
+
+    Raises
+    ------
+    :exc:`ValueError`
+        If a variant is unknown, or there are too few sizes.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import get_context
+    from .benchmark import prepare_input
+    b = BUDGETS.copy()
+    if budgets is not None:
+        b.update(budgets)
+    for v in variants:
+        if v not in VARIANTS:
+            raise ValueError("Unknown variant: {0}!".format(v))
+    if len(set(sizes)) < 2:
+        raise ValueError("At least two different numbers of rows are needed to fit memory use!")
+    inputs = [prepare_input(directory, n, seed) for n in sorted(set(sizes))]
+    results = dict()
+    for v in variants:
+        measurements = list()
+        for fits, sql in inputs:
+            #
+            # A new process for each measurement, so that the peak does
+            # not depend on memory freed, but not returned, earlier.
+            #
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                measurements.append(pool.submit(measure, fits, sql, v, blocksize).result())
+        results[v] = {'budget': b[v], 'measurements': measurements}
+        for m in MEASURES:
+            slope, intercept = fit(measurements, m)
+            results[v][m] = {'slope': slope,
+                             'intercept': intercept,
+                             'ok': slope is None or slope <= b[v]}
+    return results
+
+
+def summarize(results):
+    """Describe the results of :func:`run_scaling`.
+
+    Parameters
+    ----------
+    results : :class:`dict`
+        Results of :func:`run_scaling`.
+
+    Returns
+    -------
+    :class:`str`
+        A table of the slope and intercept of each measure of each
+        variant, and whether it is within budget.
+    """
+    lines = ["{0:<22s} {1:<12s} {2:>12s} {3:>12s} {4:>12s} {5:>6s}".format('variant', 'measure',
+                                                                         'B/row', 'budget',
+                                                                         'MiB at 0', 'check')]
+    for v, r in results.items():
+        for m in MEASURES:
+            if r[m]['slope'] is None:
+                lines.append("{0:<22s} {1:<12s} {2:>12s} {3:12d} {4:>12s} {5:>6s}".format(v, m, 'unknown',
+                                                                                         r['budget'], '-', '-'))
+            else:
+                lines.append("{0:<22s} {1:<12s} {2:12.1f} {3:12d} {4:12.1f} {5:>6s}".format(v, m, r[m]['slope'],
+                                                                                           r['budget'],
+                                                                                           r[m]['intercept']/2**20,
+                                                                                           'OK' if r[m]['ok'] else 'FAIL'))
+    return '\n'.join(lines) + '\n'
+
+
+def _budget(value):
+    """Parse a ``VARIANT=BYTES`` command-line budget.
+    """
+    variant, sep, limit = value.partition('=')
+    if not sep or variant not in VARIANTS:
+        raise ValueError("Invalid budget: {0}!".format(value))
+    return (variant, int(limit))
+
+
+def get_options(args=None):
+    """Parse command-line options.
+
+    Parameters
+    ----------
+    args : :class:`list`, optional
+        Parse these arguments instead of :data:`sys.argv`.
+
+    Returns
+    -------
+    :class:`argparse.Namespace`
+        The parsed options.
+    """
+    parser = ArgumentParser(description="Check that memory use of FITS conversions grows no faster than a budget.",
+                            prog=os.path.basename(sys.argv[0]))
+    parser.add_argument('-B', '--budget', dest='budgets', metavar='VARIANT=BYTES',
+                        action='append', type=_budget, default=[],
+                        help='Allow at most BYTES per row for VARIANT; may be repeated (defaults: {0}).'.format(', '.join(['{0}={1:d}'.format(*b) for b in BUDGETS.items()])))
+    parser.add_argument('-b', '--block-size', dest='blocksize', metavar='N',
+                        type=int, default=10000,
+                        help='Convert blocks of N rows (default %(default)s).')
+    parser.add_argument('-d', '--directory', metavar='DIR', default='.',
+                        help='Find or generate input files, and write temporary output files, in DIR (default %(default)s).')
+    parser.add_argument('-n', '--rows', dest='sizes', metavar='N',
+                        type=lambda x: int(float(x)), action='append',
+                        help='Measure a table of N rows, for example 1e8; may be repeated (default 1e5, 1e6 and 1e7).')
+    parser.add_argument('-o', '--output', metavar='FILE',
+                        help='Write all measurements and fits to FILE, in JSON format.')
+    parser.add_argument('-s', '--seed', metavar='N', type=int, default=1,
+                        help='Seed for random number generation (default %(default)s).')
+    parser.add_argument('-V', '--variant', dest='variants', metavar='VARIANT',
+                        action='append', choices=tuple(VARIANTS),
+                        help='Measure only VARIANT; may be repeated (default all of {0}).'.format(', '.join(VARIANTS)))
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    """Entry-point for command-line script.
+
+    Parameters
+    ----------
+    args : :class:`list`, optional
+        Use these command-line arguments instead of :data:`sys.argv`.
+
+    Returns
+    -------
+    :class:`int`
+        An integer suitable for passing to :func:`sys.exit`: 0 if every
+        slope is within its budget, 1 otherwise.
+    """
+    options = get_options(args)
+    sizes = options.sizes if options.sizes else [100000, 1000000, 10000000]
+    variants = options.variants if options.variants else tuple(VARIANTS)
+    try:
+        results = run_scaling(sizes, variants, dict(options.budgets),
+                              blocksize=options.blocksize,
+                              directory=options.directory,
+                              seed=options.seed)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    print(summarize(results), end='')
+    if options.output is not None:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=4)
+    return 0 if all([r[m]['ok'] for r in results.values() for m in MEASURES]) else 1
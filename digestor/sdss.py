@@ -6,6 +6,7 @@ digestor.sdss
 
 Convert SDSS SQL (MS SQL Server) table definitions to Data Lab SQL (PostgreSQL).
 """
+import logging
 import os
 import re
 import sys
@@ -13,13 +14,42 @@ import time
 # from datetime import datetime
 from argparse import ArgumentParser
 
-from pkg_resources import resource_filename
 # from pytz import utc
-from jinja2 import Environment, PackageLoader, select_autoescape
-import numpy as np
-from astropy.table import Table
 
 from .base import Digestor
+from .cache import content_digest, read_cache, write_cache
+from .header import read_header
+from .report import RunReport
+
+#
+# Directory containing packaged data files.  The package is not zip-safe,
+# so these are ordinary files.
+#
+_data_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+#
+# Template environment, created when first needed.
+#
+_template_env = None
+
+
+def template_environment():
+    """Create or return the template environment for SQL files.
+
+    The environment is created once per process, and is not stored in
+    :class:`SDSS` objects, so they can be passed to other processes.
+
+    Returns
+    -------
+    :class:`jinja2.Environment`
+        The template environment.
+    """
+    global _template_env
+    if _template_env is None:
+        from jinja2 import Environment, PackageLoader, select_autoescape
+        _template_env = Environment(loader=PackageLoader('digestor'),
+                                    autoescape=select_autoescape(),
+                                    trim_blocks=True)
+    return _template_env
 
 
 class SDSS(Digestor):
@@ -29,7 +59,10 @@ class SDSS(Digestor):
     # Match lines in SQL definition files.
     #
     _SQLre = {'comment': re.compile(r'\s*--/(H|T)\s+(.*)$'),
-              'column': re.compile(r'\s*(\S+)\s+(\S+)\s*([^,]+),?\s*(--.*)$')}
+              'column': re.compile(r'\s*(\S+)\s+(\S+)\s*([^,]+),?\s*(--.*)$'),
+              'table': re.compile(r'CREATE\s+TABLE\s+(?:\[?\w+\]?\.)*\[?(\w+)\]?', re.I),
+              'statement': re.compile(r'CREATE\s', re.I),
+              'end': re.compile(r'(\)|GO$)', re.I)}
     #
     # Map SQL Server data types to PostgreSQL.
     #
@@ -44,6 +77,21 @@ class SDSS(Digestor):
     # Identify columns that contain photometric flags
     #
     _flagre = re.compile(r'flags(|_[ugriz])$', re.I)
+    #
+    # Identify mappings to an element of an array column.
+    #
+    _arrayre = re.compile(r'([^\[]+)\[\d+\]')
+    #
+    # Additional conversions of string columns to integers.
+    #
+    _safe_conversion = {('J', 'smallint'): 2**15,
+                         ('A', 'smallint'): 2**15,
+                         ('A', 'integer'): 2**31,
+                         ('A', 'bigint'): 2**63}
+    #
+    # Compute sdss_joinid in-process instead of with STILTS.
+    #
+    _native_stilts = {'cmd=addcol -ucd meta.id -after specobjid sdss_joinid "(((long)plate<<50)|((long)fiberid<<38)|(((long)mjd-(long)50000)<<24))"': 'sdss_joinid'}
 
     def __init__(self, *args, **kwargs):
         if 'join' in kwargs:
@@ -53,9 +101,6 @@ class SDSS(Digestor):
             self.join = False
         super().__init__(*args, **kwargs)
         self.NOFITS = dict()
-        self.env = Environment(loader=PackageLoader('digestor'),
-                               autoescape=select_autoescape(),
-                               trim_blocks=True)
         #
         # sdss_joinid is SDSS-specific, so we don't want to initialize
         # that in the superclass.
@@ -67,17 +112,138 @@ class SDSS(Digestor):
                                                          indexed=1,
                                                          ucd='meta.id;src'), ]
 
+    @property
+    def env(self):
+        """Template environment for SQL files, shared by all instances.
+        """
+        return template_environment()
+
     def parseSQL(self, filename):
         """Parse an entire SQL file.
 
+        If the file defines several tables, only the definition of
+        :attr:`table` is used.
+
         Parameters
         ----------
         filename : :class:`str`
             Name of the SQL file.
         """
-        with open(filename) as SQL:
-            for line in SQL:
-                self.parseLine(line)
+        self.loadSchema(self.parseSchema([filename]))
+
+    def parseSchema(self, filenames, cache=True):
+        """Parse the definitions of every table in one or more SQL files.
+
+        This reads a complete schema dump in a single pass.  The result
+        contains only :class:`str`, :class:`int`, :class:`dict` and
+        :class:`list`, so it is stored as JSON in the cache described in
+        :mod:`digestor.cache`, and files that have been parsed before are
+        not parsed again.
+
+        Parameters
+        ----------
+        filenames : :class:`list`
+            Names of the SQL files.
+        cache : :class:`bool`, optional
+            If ``False``, do not use the cache.
+
+        Returns
+        -------
+        :class:`dict`
+            A mapping of lower-case table name to a :class:`dict` with the
+            table ``description``, the TapSchema ``columns`` and the
+            ``mapping`` of SQL columns to FITS columns, in file order.
+            Columns defined before any ``CREATE`` statement, or all
+            columns if there is no such statement, are stored with an
+            empty table name.  Lines after the end of a ``CREATE TABLE``
+            statement, and in other statements such as ``CREATE VIEW``,
+            are ignored.
+        """
+        log = self.logName('sdss.SDSS.parseSchema')
+        if cache:
+            digest = content_digest(filenames)
+            tables = read_cache('schema', digest)
+            if tables is not None:
+                log.debug("Using cached definitions of %d tables from %s.",
+                          len(tables), ', '.join(filenames))
+                return tables
+        tables = dict()
+        table = tables[''] = {'description': '', 'columns': list(), 'mapping': dict()}
+        name = ''
+        for filename in filenames:
+            log.debug("Parsing %s.", filename)
+            with open(filename) as SQL:
+                for line in SQL:
+                    kind, value = self._parseLine(line, name or '')
+                    if kind == 'table':
+                        name = value
+                        log.debug("CREATE TABLE %s", name)
+                        table = tables.setdefault(name, {'description': '',
+                                                         'columns': list(),
+                                                         'mapping': dict()})
+                    elif kind == 'end':
+                        #
+                        # No current table until the next CREATE TABLE.
+                        #
+                        name = table = None
+                    elif table is None:
+                        continue
+                    elif kind == 'description':
+                        table['description'] += value
+                    elif kind == 'column':
+                        p, r = value
+                        table['columns'].append(p)
+                        if r is not None:
+                            table['mapping'][p['column_name']] = r
+        if not tables['']['columns'] and len(tables) > 1:
+            del tables['']
+        log.debug("Parsed %d tables.", len(tables))
+        if cache:
+            write_cache('schema', digest, tables)
+        return tables
+
+    def loadSchema(self, tables, name=None):
+        """Add a table definition from :meth:`parseSchema` to the metadata.
+
+        Parameters
+        ----------
+        tables : :class:`dict`
+            Table definitions returned by :meth:`parseSchema`.
+        name : :class:`str`, optional
+            Name of the table definition to use.  If not set, use the
+            definition of :attr:`table` or, if there is only one
+            definition, that one, whatever its name.  If set, and there
+            is no such definition, only a definition without a name,
+            from a SQL file with no ``CREATE TABLE`` statement, is used
+            instead.
+
+        Raises
+        ------
+        :exc:`KeyError`
+            If the table definition cannot be found.
+        """
+        log = self.logName('sdss.SDSS.loadSchema')
+        named = name is not None
+        if not named:
+            name = self.table
+        if name.lower() in tables:
+            table = tables[name.lower()]
+        elif len(tables) == 1 and (not named or '' in tables):
+            table = list(tables.values())[0]
+        else:
+            msg = "Could not find a SQL definition of %s!"
+            log.error(msg, name)
+            raise KeyError(msg % name)
+        ti = self.tableIndex()
+        log.debug("self.tapSchema['tables'][%d]['description'] += '%s'", ti, table['description'])
+        self.tapSchema['tables'][ti]['description'] += table['description']
+        for c in table['columns']:
+            p = dict(c)
+            p['table_name'] = self.table
+            self.tapSchema['columns'].append(p)
+        for col, r in table['mapping'].items():
+            log.debug("self.mapping['%s'] = '%s'", col, r)
+            self.mapping[col] = r
 
     def parseLine(self, line):
         """Parse a single line from a SQL file.
@@ -92,47 +258,87 @@ class SDSS(Digestor):
         * Currently, the long description (``--/T``) is thrown out.
         """
         log = self.logName('sdss.SDSS.parseLine')
+        kind, value = self._parseLine(line, self.table)
+        if kind == 'description':
+            ti = self.tableIndex()
+            log.debug("self.tapSchema['tables'][%d]['description'] += '%s'", ti, value)
+            self.tapSchema['tables'][ti]['description'] += value
+        elif kind == 'column':
+            p, r = value
+            p['table_name'] = self.table
+            self.tapSchema['columns'].append(p)
+            if r is not None:
+                log.debug("self.mapping['%s'] = '%s'", p['column_name'], r)
+                self.mapping[p['column_name']] = r
+        return
+
+    def _parseLine(self, line, table):
+        """Interpret a single line from a SQL file.
+
+        Each line is matched against at most one regular expression,
+        chosen by how the line starts.
+
+        Parameters
+        ----------
+        line : :class:`str`
+            A single line from a SQL file.
+        table : :class:`str`
+            Name of the table being defined.
+
+        Returns
+        -------
+        :class:`tuple`
+            The kind of line, ``'table'``, ``'end'``, ``'description'``,
+            ``'column'`` or ``None``, and its value: the table name, the
+            text of the short description, or the column metadata and FITS
+            column name returned by :meth:`parseColumnMetadata`.  The end
+            of a table definition, and the start of any other ``CREATE``
+            statement, are of kind ``'end'``.
+        """
+        log = self.logName('sdss.SDSS._parseLine')
         l = line.strip()
-        for r in self._SQLre:
-            m = self._SQLre[r].match(l)
+        if l.startswith('--'):
+            m = self._SQLre['comment'].match(l)
             if m is not None:
                 g = m.groups()
-                if r == 'comment':
-                    ti = self.tableIndex()
-                    if g[0] == 'H':
-                        log.debug("self.tapSchema['tables'][%d]['description'] += '%s'", ti, g[1])
-                        self.tapSchema['tables'][ti]['description'] += g[1]
-                    if g[0] == 'T':
-                        log.debug("self.tapSchema['tables'][%d]['long_description'] += '%s'", ti, g[1])
-                        # self.tapSchema['tables'][ti]['long_description'] += g[1]+'\n'
-                    return
-                elif r == 'column':
-                    col = g[0].lower()
-                    if col in self._skip_columns:
-                        log.debug("Skipping column %s.", col)
-                        return
-                    typ = g[1].strip('[]').lower()
-                    try:
-                        post_type = self._server2post[typ]
-                    except KeyError:
-                        post_type = typ
-                    log.debug("    %s %s %s,", col, post_type, g[2])
-                    log.debug("metadata = '%s'", g[3])
-                    p, r = self.parseColumnMetadata(col, g[3])
-                    p['table_name'] = self.table
-                    if post_type == 'double precision':
-                        p['datatype'] = 'double'
-                    elif post_type.startswith('varchar'):
-                        p['datatype'] = 'character'
-                        p['size'] = int(post_type.split('(')[1].strip(')'))
-                    else:
-                        p['datatype'] = post_type
-                    self.tapSchema['columns'].append(p)
-                    if r is not None:
-                        log.debug("self.mapping['%s'] = '%s'", col, r)
-                        self.mapping[col] = r
-                    return
-        return
+                if g[0] == 'H':
+                    return ('description', g[1])
+                log.debug("long_description += '%s'", g[1])
+            return (None, None)
+        if self._SQLre['statement'].match(l) is not None:
+            m = self._SQLre['table'].match(l)
+            if m is not None:
+                return ('table', m.groups()[0].lower())
+            return ('end', None)
+        if self._SQLre['end'].match(l) is not None:
+            return ('end', None)
+        if '--' not in l:
+            return (None, None)
+        m = self._SQLre['column'].match(l)
+        if m is None:
+            return (None, None)
+        g = m.groups()
+        col = g[0].lower()
+        if col in self._skip_columns:
+            log.debug("Skipping column %s.", col)
+            return (None, None)
+        typ = g[1].strip('[]').lower()
+        try:
+            post_type = self._server2post[typ]
+        except KeyError:
+            post_type = typ
+        log.debug("    %s %s %s,", col, post_type, g[2])
+        log.debug("metadata = '%s'", g[3])
+        p, r = self.parseColumnMetadata(col, g[3])
+        p['table_name'] = table
+        if post_type == 'double precision':
+            p['datatype'] = 'double'
+        elif post_type.startswith('varchar'):
+            p['datatype'] = 'character'
+            p['size'] = int(post_type.split('(')[1].strip(')'))
+        else:
+            p['datatype'] = post_type
+        return ('column', (p, r))
 
     def parseColumnMetadata(self, column, data):
         """Parse the metadata for an individual column.
@@ -227,6 +433,76 @@ class SDSS(Digestor):
                 self.mapping[sc] = mapping[sc]
         return
 
+    def deriveColumns(self, old):
+        """Compute Data Lab-added columns from the data in `old`.
+
+        Parameters
+        ----------
+        old : :class:`astropy.table.Table`
+            Input data, either the entire table or a block of rows.
+
+        Returns
+        -------
+        :class:`dict`
+            A mapping of column name to column data, for each column
+            in :attr:`nativeColumns`.
+
+        Raises
+        ------
+        :exc:`KeyError`
+            If a column needed to compute ``sdss_joinid`` cannot be found.
+        """
+        log = self.logName('sdss.SDSS.deriveColumns')
+        derived = super().deriveColumns(old)
+        if 'sdss_joinid' in self.nativeColumns:
+            import numpy as np
+            lower = dict([(n.lower(), n) for n in old.colnames])
+            for c in ('plate', 'fiberid', 'mjd'):
+                if c not in lower:
+                    msg = "Could not find a FITS column corresponding to %s!"
+                    log.error(msg, c)
+                    raise KeyError(msg % c)
+            plate = np.asarray(old[lower['plate']]).astype(np.int64)
+            fiberid = np.asarray(old[lower['fiberid']]).astype(np.int64)
+            mjd = np.asarray(old[lower['mjd']]).astype(np.int64)
+            log.debug("derived['sdss_joinid'] = (plate << 50) | (fiberid << 38) | ((mjd - 50000) << 24)")
+            derived['sdss_joinid'] = (plate << 50) | (fiberid << 38) | ((mjd - 50000) << 24)
+        return derived
+
+    @property
+    def inputColumns(self):
+        """FITS columns needed to convert the table, in FITS order.
+
+        In addition to the mapped columns, this includes the columns used
+        to compute ``sdss_joinid`` and to combine photometric flags.
+        """
+        used = set(super().inputColumns)
+        lower = dict([(n.lower(), n) for n in self.FITS])
+        if 'sdss_joinid' in self.nativeColumns:
+            used.update([lower[c] for c in ('plate', 'fiberid', 'mjd') if c in lower])
+        for c in list(used):
+            if c.upper() in ('FLAGS', 'OBJC_FLAGS') and c + '2' in self.FITS:
+                used.add(c + '2')
+        return [c for c in self.FITS if c in used]
+
+    def fitsLookup(self):
+        """Index the FITS column names for matching SQL column names.
+
+        Returns
+        -------
+        :class:`dict`
+            A mapping of normalized name, in lower case, both with and
+            without underscores, to the FITS columns with that name,
+            in FITS order.
+        """
+        lookup = dict()
+        for fc in self.FITS:
+            fcl = fc.lower()
+            lookup.setdefault(fcl, list()).append(fc)
+            if '_' in fcl:
+                lookup.setdefault(fcl.replace('_', ''), list()).append(fc)
+        return lookup
+
     def mapColumns(self):
         """Complete mapping of FITS table columns to SQL columns.
 
@@ -237,7 +513,14 @@ class SDSS(Digestor):
         """
         log = self.logName('sdss.SDSS.mapColumns')
         drop = list()
+        native = self.nativeColumns
+        lookup = self.fitsLookup()
+        if self.nativePositionColumns:
+            self.positionColumns(self.FITS)
         for sc in self.colNames:
+            if sc in native:
+                log.debug("SQL: %s will be computed in-process.", sc)
+                continue
             if sc in self.mapping:
                 #
                 # Make sure the column actually exists.
@@ -252,30 +535,24 @@ class SDSS(Digestor):
                 if mc in self.FITS:
                     log.debug("FITS: %s -> SQL: %s", self.mapping[sc], sc)
                     verify_mapping = True
-                else:
+                elif mc.lower() in lookup:
                     #
                     # See if there is a column containing underscores that
-                    # could correspond to this mapping.
+                    # could correspond to this mapping.  If there are
+                    # several, the last one is used.
                     #
-                    for fc in self.FITS:
-                        for fcl in (fc.lower(), fc.lower().replace('_', ''),):
-                            if fcl == mc.lower():
-                                log.debug("FITS: %s%s -> SQL: %s", fc, index, sc)
-                                self.mapping[sc] = fc + index
-                                verify_mapping = True
+                    fc = lookup[mc.lower()][-1]
+                    log.debug("FITS: %s%s -> SQL: %s", fc, index, sc)
+                    self.mapping[sc] = fc + index
+                    verify_mapping = True
                 if not verify_mapping:
                     msg = "Could not find a FITS column corresponding to %s!"
                     log.error(msg, sc)
                     raise KeyError(msg % sc)
-            else:
-                for fc in self.FITS:
-                    for fcl in (fc.lower(), fc.lower().replace('_', ''),):
-                        if fcl == sc:
-                            log.debug("FITS: %s -> SQL: %s", fc, sc)
-                            self.mapping[sc] = fc
-                            break
-                    if sc in self.mapping:
-                        break
+            elif sc in lookup:
+                fc = lookup[sc][0]
+                log.debug("FITS: %s -> SQL: %s", fc, sc)
+                self.mapping[sc] = fc
             if sc not in self.mapping:
                 if self.random and sc == 'random_id':
                     log.info("Skipping %s which will be added by FITS2DB.",
@@ -297,235 +574,219 @@ class SDSS(Digestor):
         #
         # Remove SQL columns that were requested to be dropped.
         #
-        for sc in drop:
-            i = self.columnIndex(sc)
+        for i in sorted([self.columnIndex(sc) for sc in drop], reverse=True):
             log.debug("del self.tapSchema['columns'][%d]", i)
             del self.tapSchema['columns'][i]
         #
         # Check for FITS columns that are NOT mapped to the SQL file.
         #
+        used = set(self.mapping.values())
+        for m in [self._arrayre.match(v) for v in self.mapping.values()]:
+            if m is not None:
+                used.add(m.groups()[0])
         for col in self.FITS:
-            if col in self.mapping.values():
+            if col in used:
                 log.debug("FITS column %s will be transferred to SQL.", col)
             else:
-                col_array = re.compile(col + r'\[\d+\]')
-                if any([col_array.match(sc) is not None for sc in self.mapping.values()]):
-                    log.debug("FITS column %s will be transferred to SQL.", col)
-                else:
-                    log.warning("FITS column %s will be dropped from SQL!", col)
+                log.warning("FITS column %s will be dropped from SQL!", col)
         return
 
-    def _photoFlag(self, column, table):
+    def _photoFlag(self, step, table):
         """Handle photometric flags in SDSS data.
 
         Parameters
         ----------
-        column : :class:`dict`
-            A TapSchema column definition.
+        step : :class:`dict`
+            A conversion step from :meth:`planColumn`.
         table : :class:`astropy.table.Table`
             Table containing the input data.
 
         Returns
         -------
         :class:`numpy.ndarray`
-            The combined flags and flags2 data, or ``None`` if the
-            column did not match.
+            The combined flags and flags2 data.
+        """
+        import numpy as np
+        log = self.logName('sdss.SDSS._photoFlag')
+        fcol = step['source']
+        band = step['index']
+        if band is not None:
+            log.debug("np.left_shift(table['%s2'][:, %d].astype(np.int64), 32) | table['%s'][:, %d].astype(np.int64)", fcol, band, fcol, band)
+            return (np.left_shift(table[fcol + '2'][:, band].astype(np.int64), 32) |
+                    table[fcol][:, band].astype(np.int64))
+        log.debug("np.left_shift(table['%s2'].astype(np.int64), 32) | table['%s'].astype(np.int64)", fcol, fcol)
+        return (np.left_shift(table[fcol + '2'].astype(np.int64), 32) |
+                table[fcol].astype(np.int64))
+
+    def inputBytes(self, step, old):
+        """Size of the input data read by one conversion step.
+
+        Combining photometric flags reads two columns.
+
+        Parameters
+        ----------
+        step : :class:`dict`
+            Conversion step from :meth:`planColumn`.
+        old : :class:`astropy.table.Table`
+            Input data, either the entire table or a block of rows.
+
+        Returns
+        -------
+        :class:`int`
+            The number of bytes.
+        """
+        n = super().inputBytes(step, old)
+        if step['kernel'] == 'flags':
+            return 2*n
+        return n
+
+    def prepareConversion(self):
+        """Seed the random number generator used for ``random_id``.
+
+        The generator is seeded once per conversion, so that blocks do not
+        repeat the same sequence.
+        """
+        if self.random:
+            import numpy as np
+            log = self.logName('sdss.SDSS.prepareConversion')
+            stime = int(time.time())
+            log.debug('np.random.seed(%s)', stime)
+            np.random.seed(stime)
+
+    def planColumn(self, col):
+        """Decide how SDSS FITS data for a single column will be converted.
+
+        In addition to the conversions in
+        :meth:`~digestor.base.Digestor.planColumn`, this handles
+        ``random_id``, placeholder columns, photometric flags and
+        integers stored as strings.  Non-finite floating-point values are
+        replaced with -9999.
+
+        Parameters
+        ----------
+        col : :class:`dict`
+            TapSchema column definition.
+
+        Returns
+        -------
+        :class:`dict`
+            A conversion step.
 
         Raises
         ------
+        :exc:`ValueError`
+            If the FITS data type cannot be converted to SQL.
         :exc:`AssertionError`
-            If the required columns are not present in the FITS file.
+            If photometric flags are not defined as expected.
         """
-        log = self.logName('sdss.SDSS._photoFlag')
-        m = self._flagre.match(column['column_name'])
+        log = self.logName('sdss.SDSS.planColumn')
+        name = col['column_name']
+        if name in self.nativeColumns:
+            return super().planColumn(col)
+        if self.random and name == 'random_id':
+            log.info("Creating %s column using numpy.random.random().", name)
+            return self.planStep(col, 'random')
+        if name in self.NOFITS:
+            log.info("Creating placeholder column %s for post-processing.", name)
+            return self.planStep(col, 'constant')
+        m = self._flagre.match(name)
         if m is not None:
+            log.info("Combining photo flags for %s", name)
+            assert col['datatype'] == 'bigint'
+            fcol = self.mapping[name]
             g = m.groups()[0].replace('_', '')
             if g:
-                #
-                # Ensure FLAGS and FLAGS2 are present.
-                #
                 band = 'ugriz'.index(g)
-                assert column['datatype'] == 'bigint'
-                assert self.mapping[column['column_name']].lower() == 'flags[{0:d}]'.format(band)
-                assert 'FLAGS' in table.colnames
-                assert 'FLAGS2' in table.colnames
-                log.debug("np.left_shift(table['FLAGS2'][:, %d].astype(np.int64), 32) | table['FLAGS'][:, %d].astype(np.int64)", band, band)
-                return (np.left_shift(table['FLAGS2'][:, band].astype(np.int64), 32) |
-                        table['FLAGS'][:, band].astype(np.int64))
+                assert fcol.lower() == 'flags[{0:d}]'.format(band)
+                fcol = fcol.split('[')[0]
             else:
-                #
-                # Ensure OBJC_FLAGS and OBJC_FLAGS2 are present.
-                #
-                assert column['datatype'] == 'bigint'
-                assert self.mapping[column['column_name']].lower() == 'objc_flags'
-                assert 'OBJC_FLAGS' in table.colnames
-                assert 'OBJC_FLAGS2' in table.colnames
-                log.debug("np.left_shift(table['OBJC_FLAGS2'].astype(np.int64), 32) | table['OBJC_FLAGS'].astype(np.int64)")
-                return (np.left_shift(table['OBJC_FLAGS2'].astype(np.int64), 32) |
-                        table['OBJC_FLAGS'].astype(np.int64))
-        return None
-
-    def processFITS(self, hdu=1, overwrite=False):
-        """Convert a pre-processed FITS file into one ready for database loading.
+                band = None
+                assert fcol.lower() == 'objc_flags'
+            #
+            # Ensure FLAGS and FLAGS2 or OBJC_FLAGS and OBJC_FLAGS2 are present.
+            #
+            assert fcol in self.FITS
+            assert fcol + '2' in self.FITS
+            return self.planStep(col, 'flags', fcol, band)
+        step = super().planColumn(col)
+        if step['kernel'] == 'narrow' and step['ftype'] == 'A':
+            log.debug("String to integer conversion required for %s -> %s.",
+                      step['source'], name)
+            step['kernel'] = 'parse'
+        if step['ftype'] in ('D', 'E'):
+            step['sentinel'] = -9999.0
+        return step
+
+    def convertColumn(self, step, old, derived):
+        """Convert SDSS FITS data for a single column.
 
         Parameters
         ----------
-        hdu : :class:`int`, optional
-            Read data from this HDU (default 1).
-        overwrite : :class:`bool`, optional
-            If ``True``, remove any existing file.
+        step : :class:`dict`
+            Conversion step from :meth:`planColumn`.
+        old : :class:`astropy.table.Table`
+            Input data, either the entire table or a block of rows.
+        derived : :class:`dict`
+            Columns computed by :meth:`deriveColumns`.
 
         Returns
         -------
-        :class:`str`
-            The name of the file written.
+        :class:`numpy.ndarray`
+            The converted data.
 
         Raises
         ------
         :exc:`ValueError`
-            If the FITS data type cannot be converted to SQL.
+            If the values are too large for a range-checked conversion.
         """
-        log = self.logName('sdss.SDSS.processFITS')
-        out = "{0.schema}.{0.table}.fits".format(self)
-        if os.path.exists(out) and not overwrite:
-            log.info("Using existing file: %s.", out)
-            return out
-        if os.path.exists(out):
-            log.info("Removing existing file: %s.", out)
-            os.remove(out)
-        type_map = {'bigint': ('K', 'J', 'I', 'B'),
-                    'integer': ('J', 'I', 'B'),
-                    'smallint': ('I', 'B'),
-                    'boolean': ('L'),
-                    'double': ('D', 'E'),
-                    'real': ('E',),
-                    'character': ('A',)}
-        np_map = {'bigint': np.int64,
-                  'integer': np.int32,
-                  'smallint': np.int16,
-                  'boolean': bool,
-                  'double': np.float64,
-                  'real': np.float32}
-        safe_conversion = {('J', 'smallint'): 2**15,
-                           ('A', 'smallint'): 2**15,
-                           ('A', 'integer'): 2**31,
-                           ('A', 'bigint'): 2**63}
-        rebase = re.compile(r'^(\d+)(\D+)')
-        columns = [c for c in self.tapSchema['columns']
-                   if c['table_name'] == self.table]
-        old = Table.read(self._inputFITS, hdu=hdu)
-        new = Table()
-        for col in columns:
-            if self.random and col['column_name'] == 'random_id':
-                log.info("Creating %s column using numpy.random.random().",
-                         col['column_name'])
-                stime = int(time.time())
-                log.debug('np.random.seed(%s)', stime)
-                np.random.seed(stime)
-                log.debug("new['%s'] = np.random.random((%d,)).astype(%s)",
-                          col['column_name'], len(old), str(np_map[col['datatype']]))
-                new[col['column_name']] = 100.0*np.random.random((len(old),)).astype(np_map[col['datatype']])
-                continue
-            if col['column_name'] in self.NOFITS:
-                log.info("Creating placeholder column %s for post-processing.",
-                         col['column_name'])
-                log.debug("new['%s'] = np.zeros((%d,), dtype=%s)",
-                          col['column_name'], len(old), str(np_map[col['datatype']]))
-                new[col['column_name']] = np.zeros((len(old),), dtype=np_map[col['datatype']])
-                continue
-            if 'flags' in col['column_name']:
-                flags64 = self._photoFlag(col, old)
-                if flags64 is not None:
-                    log.info("Combining photo flags for %s", col['column_name'])
-                    new[col['column_name']] = flags64
-                    continue
-            fcol = self.mapping[col['column_name']]
-            index = None
-            if '[' in fcol:
-                foo = fcol.split('[')
-                fcol = foo[0]
-                index = int(foo[1].strip(']'))
-            ftype = self.FITS[fcol]
-            fbasetype = rebase.sub(r'\2', ftype)
-            if fbasetype == type_map[col['datatype']][0]:
-                log.debug("Type match for %s -> %s.", fcol, col['column_name'])
-                if index is not None:
-                    log.debug("new['%s'] = old['%s'][:, %d]",
-                              col['column_name'], fcol, index)
-                    new[col['column_name']] = old[fcol][:, index]
-                else:
-                    log.debug("new['%s'] = old['%s']", col['column_name'], fcol)
-                    new[col['column_name']] = old[fcol]
-            elif fbasetype in type_map[col['datatype']]:
-                log.debug("Safe type conversion possible for %s (%s) -> %s (%s).",
-                          fcol, fbasetype, col['column_name'], col['datatype'])
-                if index is not None:
-                    log.debug("new['%s'] = old['%s'][:, %d].astype(%s)",
-                              col['column_name'], fcol, index,
-                              str(np_map[col['datatype']]))
-                    new[col['column_name']] = old[fcol][:, index].astype(np_map[col['datatype']])
-                else:
-                    log.debug("new['%s'] = old['%s'].astype(%s)",
-                              col['column_name'], fcol,
-                              str(np_map[col['datatype']]))
-                    new[col['column_name']] = old[fcol].astype(np_map[col['datatype']])
+        import numpy as np
+        from .kernels import parse_integers
+        log = self.logName('sdss.SDSS.convertColumn')
+        name = step['column']
+        kernel = step['kernel']
+        dtype = step['dtype']
+        if kernel == 'random':
+            log.debug("new['%s'] = np.random.random((%d,)).astype(%s)",
+                      name, len(old), str(dtype))
+            return 100.0*np.random.random((len(old),)).astype(dtype)
+        if kernel == 'constant':
+            log.debug("new['%s'] = np.zeros((%d,), dtype=%s)",
+                      name, len(old), str(dtype))
+            return np.zeros((len(old),), dtype=dtype)
+        if kernel == 'flags':
+            return self._photoFlag(step, old)
+        if kernel not in ('narrow', 'parse'):
+            return super().convertColumn(step, old, derived)
+        fcol = step['source']
+        index = step['index']
+        limit = step['limit']
+        if kernel == 'parse':
+            wrap = step['datatype'] == 'bigint'
+            log.debug("test_old, bad = parse_integers(old['%s'], wrap=%s)", fcol, wrap)
+            test_old, bad = parse_integers(old[fcol], wrap=wrap)
+        else:
+            if index is not None:
+                test_old = old[fcol][:, index]
             else:
-                if (fbasetype, col['datatype']) in safe_conversion:
-                    limit = safe_conversion[(fbasetype, col['datatype'])]
-                    if fbasetype == 'A':
-                        try:
-                            old[fcol].fill_value = b'0'
-                        except AttributeError:  # This can happen during testing.
-                            pass
-                        log.debug("String to integer conversion required for %s -> %s.", fcol, col['column_name'])
-                        width = int(str(old[fcol].dtype).split(old[fcol].dtype.kind)[1])
-                        blank = ' '*width
-                        w = np.nonzero(old[fcol] == blank)[0]
-                        if len(w) > 0:
-                            log.debug("old['%s'][old['%s'] == blank] = blank[0:%d] + '0'",
-                                      fcol, fcol, width - 1)
-                            old[fcol][w] = blank[0:(width-1)] + '0'
-                        log.debug("test_old = old['%s'].astype(np.int64)", fcol)
-                        try:
-                            test_old = old[fcol].astype(np.int64)
-                        except OverflowError:
-                            log.debug("Attempting string to quasi-unsigned integer conversion for %s -> %s.",
-                                      fcol, col['column_name'])
-                            uold = old[fcol].astype(np.uint64)
-                            hi = np.nonzero(uold >= 2**63)[0]
-                            lo = np.nonzero(uold < 2**63)[0]
-                            test_old = np.zeros(uold.shape, dtype=np.int64)
-                            test_old[lo] = uold[lo]
-                            test_old[hi] = (uold[hi] - 2**63).astype(np.int64) - 2**63
-                    else:
-                        if index is not None:
-                            test_old = old[fcol][:, index]
-                        else:
-                            test_old = old[fcol]
-                    if ((test_old >= -limit) & (test_old <= limit - 1)).all():
-                        if (fbasetype, col['datatype']) == ('A', 'bigint'):
-                            log.debug("new['%s'] = test_old  # quasi-unsigned integer", col['column_name'])
-                            new[col['column_name']] = test_old
-                        else:
-                            if index is not None:
-                                log.debug("new['%s'] = old['%s'][:, %d].astype(%s)", col['column_name'], fcol, index, str(np_map[col['datatype']]))
-                                new[col['column_name']] = old[fcol][:, index].astype(np_map[col['datatype']])
-                            else:
-                                log.debug("new['%s'] = old['%s'].astype(%s)", col['column_name'], fcol, str(np_map[col['datatype']]))
-                                new[col['column_name']] = old[fcol].astype(np_map[col['datatype']])
-                    else:
-                        msg = "Values too large for safe data type conversion for %s (%s) -> %s (%s)!"
-                        log.error(msg, fcol, fbasetype, col['column_name'], col['datatype'])
-                        raise ValueError(msg % (fcol, fbasetype, col['column_name'], col['datatype']))
-                else:
-                    msg = "No safe data type conversion possible for %s (%s) -> %s (%s)!"
-                    log.error(msg, fcol, fbasetype, col['column_name'], col['datatype'])
-                    raise ValueError(msg % (fcol, fbasetype, col['column_name'], col['datatype']))
-            if fbasetype in ('D', 'E'):
-                new[col['column_name']][~np.isfinite(new[col['column_name']])] = -9999.0
-        log.debug("new.write('%s')", out)
-        new.write(out)
-        return out
+                test_old = old[fcol]
+            bad = np.zeros((len(test_old),), dtype=bool)
+        bad |= (test_old < -limit) | (test_old > limit - 1)
+        if bad.any():
+            rows = np.nonzero(bad)[0]
+            log.error("Invalid or out-of-range values for %s in %d rows, including %s.",
+                      fcol, len(rows), ', '.join([str(r) for r in rows[:10]]))
+            msg = "Values too large for safe data type conversion for %s (%s) -> %s (%s)!"
+            log.error(msg, fcol, step['ftype'], name, step['datatype'])
+            raise ValueError(msg % (fcol, step['ftype'], name, step['datatype']))
+        if (kernel, step['datatype']) == ('parse', 'bigint'):
+            log.debug("new['%s'] = test_old  # quasi-unsigned integer", name)
+            new = test_old
+        else:
+            log.debug("new['%s'] = test_old.astype(%s)", name, str(dtype))
+            new = test_old.astype(dtype)
+        if step['sentinel'] is not None:
+            self.replaceSentinel(step, new)
+        return new
 
     def writeSQL(self, filename):
         """Write the CREATE TABLE statement to `filename`, along with any
@@ -558,9 +819,14 @@ class SDSS(Digestor):
                                        pkey=pkey, join=self.join))
 
 
-def get_options():
+def get_options(args=None):
     """Parse command-line options.
 
+    Parameters
+    ----------
+    args : :class:`list`, optional
+        Parse these arguments instead of :data:`sys.argv`.
+
     Returns
     -------
     :class:`argparse.Namespace`
@@ -568,8 +834,13 @@ def get_options():
     """
     parser = ArgumentParser(description=__doc__.split("\n")[-2],
                             prog=os.path.basename(sys.argv[0]))
+    parser.add_argument('-b', '--block-size', dest='blocksize', metavar='N',
+                        type=int,
+                        help='Convert the FITS data in blocks of N rows, to limit memory usage.')
+    parser.add_argument('--column-metrics', dest='metrics', action='store_true',
+                        help='Record the time, size and sentinel substitutions of each column conversion in the run report.')
     parser.add_argument('-c', '--configuration', dest='config', metavar='FILE',
-                        default=resource_filename('digestor', 'data/sdss.yaml'),
+                        default=os.path.join(_data_dir, 'sdss.yaml'),
                         help='Read table-specific configuration from FILE.')
     parser.add_argument('-d', '--schema-description', dest='description',
                         metavar='TEXT',
@@ -580,6 +851,9 @@ def get_options():
     parser.add_argument('-e', '--extension', dest='hdu', metavar='N',
                         type=int, default=1,
                         help='Read data from FITS HDU N (default %(default)s).')
+    parser.add_argument('-f', '--format', dest='output', metavar='FORMAT',
+                        choices=['fits', 'pgcopy'], default='fits',
+                        help='Write converted data as FORMAT, either "fits" or "pgcopy" (PostgreSQL binary COPY) (default %(default)s).')
     parser.add_argument('-G', '--no-galactic', dest='galactic', action='store_false',
                         help='Do not add galactic coordinates.')
     parser.add_argument('-J', '--no-join', dest='join', action='store_false',
@@ -587,11 +861,16 @@ def get_options():
     parser.add_argument('-j', '--output-json', dest='output_json', metavar='FILE',
                         help='Write table metadata to FILE.')
     parser.add_argument('-k', '--keep', action='store_true',
-                        help='Do not overwrite any existing intermediate files.')
+                        help='Reuse existing intermediate files if their inputs, configuration and options have not changed.')
     parser.add_argument('-l', '--log', dest='log', metavar='FILE',
                         help='Log operations to FILE.')
     parser.add_argument('-m', '--merge', dest='merge_json', metavar='FILE',
                         help='Merge metadata in FILE into final metadata output.')
+    parser.add_argument('-M', '--metadata-only', dest='metadata', action='store_true',
+                        help='Only write the SQL and JSON files, reading just the FITS header; do not run STILTS or convert any data.')
+    parser.add_argument('-n', '--processes', dest='processes', metavar='N',
+                        type=int, default=1,
+                        help='Convert ranges of rows in N processes (default %(default)s).')
     parser.add_argument('-o', '--output-sql', dest='output_sql', metavar='FILE',
                         help='Write table definition to FILE.')
     parser.add_argument('-p', '--primary-key', dest='pkey', metavar='COLUMN',
@@ -599,36 +878,55 @@ def get_options():
                         help='COLUMN is primary key (default %(default)s).')
     parser.add_argument('-P', '--no-pixels', dest='pixels', action='store_false',
                         help='Do not add HTM & HEALPix columns.')
+    parser.add_argument('--plan', action='store_true',
+                        help='Print the conversion plan for each column and the estimated output size, then exit without converting any data.')
+    parser.add_argument('--report', dest='report', metavar='FILE',
+                        help='Write the time, I/O and memory used by each stage to FILE, in JSON format (default: the log file, with .report.json instead of .log).')
     parser.add_argument('-r', '--ra', dest='ra', metavar='COLUMN', default='ra',
                         help='Right Ascension is in COLUMN (default %(default)s).')
     parser.add_argument('-R', '--no-random', dest='random', action='store_false',
                         help='Do not add a random_id column.')
+    parser.add_argument('-S', '--stilts', dest='native', action='store_false',
+                        help='Compute all HTM, HEALPix & coordinate columns with STILTS.')
+    parser.add_argument('--shards', action='store_true',
+                        help='With --processes, write one output file per process instead of combining them.')
     parser.add_argument('-s', '--schema', metavar='SCHEMA',
                         default='sdss_dr14',
                         help='Define table with this schema (default %(default)s).')
+    parser.add_argument('-T', '--threads', dest='threads', metavar='N',
+                        type=int, default=1,
+                        help='Convert columns on N threads (default %(default)s).')
     parser.add_argument('-t', '--table', metavar='TABLE',
                         help='Set the table name.')
     parser.add_argument('-v', '--verbose', action='store_true',
                         help='Print extra information.')
     parser.add_argument('fits', help='FITS file to convert.')
     parser.add_argument('sql', help='SQL file to convert.')
-    return parser.parse_args()
+    options = parser.parse_args(args)
+    if options.metadata and options.plan:
+        parser.error("--metadata-only and --plan cannot be used together.")
+    return options
 
 
-def main():
+def main(args=None):
     """Entry-point for command-line script.
 
+    Parameters
+    ----------
+    args : :class:`list`, optional
+        Use these command-line arguments instead of :data:`sys.argv`.
+
     Returns
     -------
     :class:`int`
         An integer suitable for passing to :func:`sys.exit`.
     """
-    options = get_options()
+    options = get_options(args)
     if not os.path.exists(options.fits):
         print("%s does not exist!" % options.fits, file=sys.stderr)
         return 1
     if not os.path.exists(options.sql):
-        p = resource_filename('digestor', 'data/' + options.sql)
+        p = os.path.join(_data_dir, options.sql)
         if os.path.exists(p):
             options.sql = p
         else:
@@ -643,6 +941,8 @@ def main():
         options.output_json = options.output_sql.replace('sql', 'json')
     if options.log is None:
         options.log = options.output_sql.replace('sql', 'log')
+    if options.report is None:
+        options.report = os.path.splitext(options.log)[0] + '.report.json'
     try:
         sdss = SDSS(options.schema, options.table,
                     description=options.description,
@@ -651,6 +951,10 @@ def main():
                     random=options.random,
                     ecliptic=options.ecliptic,
                     galactic=options.galactic,
+                    ra=options.ra,
+                    native=options.native,
+                    threads=options.threads,
+                    metrics=options.metrics,
                     join=options.join)
     except ValueError as e:
         #
@@ -658,7 +962,49 @@ def main():
         #
         print(str(e))
         return 1
-    sdss.configureLog(options.log, options.verbose)
+    handler = sdss.configureLog(options.log, options.verbose)
+    report = RunReport(log=sdss.logName('sdss.main'),
+                       info={'schema': options.schema,
+                             'table': options.table,
+                             'fits': options.fits,
+                             'sql': options.sql})
+    try:
+        report.status = _convert(sdss, options, report)
+        return report.status
+    finally:
+        #
+        # Don't let a failure to write the report hide the outcome of
+        # the conversion.
+        #
+        try:
+            report.write(options.report)
+        except (OSError, TypeError, ValueError) as e:
+            sdss.logName('sdss.main').error("Could not write run report %s: %s",
+                                            options.report, str(e))
+        #
+        # Several tables may be converted by the same process.
+        #
+        logging.getLogger(sdss.rootLogger).removeHandler(handler)
+        handler.close()
+
+
+def _convert(sdss, options, report):
+    """Convert one table, after the command-line options have been checked.
+
+    Parameters
+    ----------
+    sdss : :class:`SDSS`
+        The object that will perform the conversion.
+    options : :class:`argparse.Namespace`
+        The parsed options.
+    report : :class:`~digestor.report.RunReport`
+        Record the time and memory used by each stage here.
+
+    Returns
+    -------
+    :class:`int`
+        An integer suitable for passing to :func:`sys.exit`.
+    """
     log = sdss.logName('sdss.main')
     # ts = datetime.utcnow().replace(tzinfo=utc).strftime('%Y-%m-%dT%H:%M:%S %Z')
     log.debug("options.fits = '%s'", options.fits)
@@ -668,58 +1014,101 @@ def main():
     log.debug("options.output_sql = '%s'", options.output_sql)
     log.debug("options.output_json = '%s'", options.output_json)
     log.debug("options.log = '%s'", options.log)
+    log.debug("options.report = '%s'", options.report)
     #
     # Preprocess the FITS file.
     #
-    sdss.customSTILTS(options.config)
-    try:
-        dlfits = sdss.addDLColumns(options.fits, ra=options.ra,
-                                   overwrite=(not options.keep))
-    except ValueError as e:
-        log.error(str(e))
-        return 1
-    sdss.parseFITS(dlfits, hdu=options.hdu)
+    with report.stage('customSTILTS'):
+        sdss.customSTILTS(options.config)
+    if options.metadata:
+        log.info("Writing metadata only, from the header of %s.", options.fits)
+        with report.stage('parseFITS'):
+            sdss.parseFITS(options.fits, hdu=options.hdu,
+                           pending=sdss.stiltsColumns())
+    else:
+        try:
+            with report.stage('addDLColumns'):
+                dlfits = sdss.addDLColumns(options.fits, overwrite=(not options.keep))
+        except ValueError as e:
+            log.error(str(e))
+            return 1
+        with report.stage('parseFITS'):
+            sdss.parseFITS(dlfits, hdu=options.hdu)
     #
     # Read the SQL file.
     #
-    sdss.parseSQL(options.sql)
+    with report.stage('parseSQL'):
+        sdss.parseSQL(options.sql)
     #
     # Map the FITS columns to table columns.
     #
-    sdss.fixNOFITS(options.config)
-    sdss.fixMapping(options.config)
+    with report.stage('fixNOFITS'):
+        sdss.fixNOFITS(options.config)
+    with report.stage('fixMapping'):
+        sdss.fixMapping(options.config)
     try:
-        sdss.mapColumns()
+        with report.stage('mapColumns'):
+            sdss.mapColumns()
     except KeyError as k:
         return 1
     #
     # Fix any table definition problems and sort the columns.
     #
-    sdss.fixColumns(options.config)
+    with report.stage('fixColumns'):
+        sdss.fixColumns(options.config)
     try:
-        sdss.sortColumns()
+        with report.stage('sortColumns'):
+            sdss.sortColumns()
     except AssertionError as e:
         log.error(str(e))
         return 1
     #
+    # Stop here if only the conversion plan was requested.
+    #
+    if options.plan:
+        try:
+            with report.stage('compilePlan'):
+                sdss.compilePlan()
+        except (ValueError, AssertionError) as e:
+            print(str(e), file=sys.stderr)
+            return 1
+        nrows = read_header(sdss._inputFITS, options.hdu)['NAXIS2']
+        print(sdss.formatPlan(nrows, options.output), end='')
+        return 0
+    #
     # Write the SQL files.
     #
-    sdss.writeSQL(options.output_sql)
-    sdss.writePOSTSQL(options.output_sql.replace('.sql', '_post.sql'),
-                      pkey=options.pkey)
+    with report.stage('writeSQL'):
+        sdss.writeSQL(options.output_sql)
+    with report.stage('writePOSTSQL'):
+        sdss.writePOSTSQL(options.output_sql.replace('.sql', '_post.sql'),
+                          pkey=options.pkey)
     #
     # Write the JSON file.
     #
-    sdss.writeTapSchema(options.output_json)
+    with report.stage('writeTapSchema'):
+        sdss.writeTapSchema(options.output_json)
+    if options.metadata:
+        return 0
     #
     # Sort the FITS data table to match the columns.  Do this last so that
     # if it crashes, we at least have the SQL and JSON files.
     #
     try:
-        pgfits = sdss.processFITS(hdu=options.hdu,
-                                  overwrite=(not options.keep))
+        with report.stage('processFITS') as record:
+            pgfits = sdss.processFITS(hdu=options.hdu,
+                                      overwrite=(not options.keep),
+                                      blocksize=options.blocksize,
+                                      processes=options.processes,
+                                      shards=options.shards,
+                                      output=options.output)
+            record['output'] = pgfits
+            if options.metrics:
+                record['columns'] = sdss.metricsTable()
     except ValueError as e:
         return 1
+    if options.output == 'pgcopy':
+        log.info("Load the data with: %s", sdss.copySQL().strip())
     # except Exception as e:
     #     log.error(str(e))
     #     return 2
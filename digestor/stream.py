@@ -0,0 +1,289 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.stream
+===============
+
+Read and write FITS binary tables in blocks of rows, so that memory usage
+depends on the size of a block rather than the size of the table.
+"""
+import os
+
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+from .kernels import signed_view
+
+#
+# Size of a FITS logical record in bytes.
+#
+FITS_BLOCK = 2880
+
+
+def read_blocks(filename, hdu=1, blocksize=1000000, start=0, stop=None,
+                columns=None, signed=False):
+    """Iterate over a FITS binary table in blocks of rows.
+
+    The file is memory-mapped, so only the rows in the current block are
+    converted into :class:`~astropy.table.Table` columns.  Columns that
+    need no scaling are views of the file, so only the bytes of the
+    columns, and elements of array columns, that are actually used are
+    read.  These views are read-only.  String columns are returned as
+    bytes, as with :meth:`astropy.table.Table.read`, but they are not
+    stripped and invalid values are not masked.
+
+    Parameters
+    ----------
+    filename : :class:`str`
+        Name of the FITS file.
+    hdu : :class:`int`, optional
+        Read data from this HDU (default 1).
+    blocksize : :class:`int`, optional
+        Number of rows in each block (default 1000000).  If ``None``,
+        read all rows in a single block.
+    start : :class:`int`, optional
+        Index of the first row to read (default 0).
+    stop : :class:`int`, optional
+        Stop reading at this row (default, the end of the table).
+    columns : :class:`list`, optional
+        Only return these columns (default, all columns).
+    signed : :class:`bool`, optional
+        If ``True``, return 64-bit unsigned integer columns (``TZERO`` equal
+        to :math:`2^{63}`) as signed integers with the same bits, converted
+        in place in a copy of the raw values of each block.
+
+    Yields
+    ------
+    :class:`astropy.table.Table`
+        A block of at most `blocksize` rows.  An empty table yields a single
+        block with no rows, so that the column definitions are available.
+    """
+    #
+    # The file is mapped read-only.  Writing to a copy-on-write mapping
+    # would turn every page written into private memory, which is only
+    # released when the file is closed, so memory use would grow with
+    # the number of rows read, whatever the block size.
+    #
+    with fits.open(filename, mode='denywrite', memmap=True,
+                   character_as_bytes=True) as hdulist:
+        data = hdulist[hdu].data
+        names = data.columns.names if columns is None else columns
+        if stop is None:
+            stop = len(data)
+        if blocksize is None:
+            blocksize = max(stop - start, 1)
+        unsigned = list()
+        if signed:
+            unsigned = [c.name for c in data.columns
+                        if c.name in names and c.format == 'K' and
+                        c.bzero == 2**63 and c.bscale in (None, 1)]
+        for first in range(start, max(stop, start + 1), blocksize):
+            block = data[first:min(first + blocksize, stop)]
+            #
+            # Slices of a FITS_rec do not inherit this setting.
+            #
+            block._character_as_bytes = True
+            #
+            # Unsigned columns are copied, one block at a time, and the
+            # copy is converted in place.
+            #
+            raw = block.view(np.ndarray)
+            yield Table([signed_view(np.array(raw[n]), offset=True) if n in unsigned else block[n]
+                         for n in names], names=names, copy=False)
+            del block, raw
+
+
+class FITSBlockWriter(object):
+    """Write a FITS binary table one block of rows at a time.
+
+    The header is constructed from the first block written, with ``NAXIS2``
+    set to the expected total number of rows.  Subsequent blocks must have
+    the same columns, in the same order, with the same data types.
+
+    Parameters
+    ----------
+    filename : :class:`str`
+        Name of the FITS file.
+    nrows : :class:`int`
+        Total number of rows that will be written.
+    """
+
+    def __init__(self, filename, nrows):
+        self.filename = filename
+        self.nrows = nrows
+        self.written = 0
+        self.header = None
+        self._bzero = dict()
+        self._dtype = None
+        self._fileobj = open(filename, 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            #
+            # Don't leave a truncated file that could be mistaken
+            # for a finished one.
+            #
+            self._fileobj.close()
+            os.remove(self.filename)
+        return False
+
+    def _writeHeader(self, table):
+        """Write the primary and table headers using `table` as a template.
+
+        Parameters
+        ----------
+        table : :class:`astropy.table.Table`
+            The first block of data.
+        """
+        hdu = fits.table_to_hdu(table)
+        hdu.header['NAXIS2'] = self.nrows
+        self.header = hdu.header
+        self._dtype = hdu.columns.dtype.newbyteorder('>')
+        for c in hdu.columns:
+            if c.bzero not in ('', None, 0):
+                self._bzero[c.name] = c.bzero
+        self._fileobj.write(fits.PrimaryHDU().header.tostring().encode('ascii'))
+        self._fileobj.write(self.header.tostring().encode('ascii'))
+
+    def allocate(self, table):
+        """Write the header and reserve space for all rows.
+
+        The rows are then written, possibly in parallel, by instances of
+        :class:`FITSPartWriter`.  The file is closed.
+
+        Parameters
+        ----------
+        table : :class:`astropy.table.Table`
+            A block of data used as a template for the header.
+
+        Returns
+        -------
+        :class:`tuple`
+            The byte offset of the data, the data type of each row and any
+            ``TZERO`` values, to be passed to :class:`FITSPartWriter`.
+        """
+        self._writeHeader(table)
+        offset = self._fileobj.tell()
+        size = self.nrows * self._dtype.itemsize
+        if size % FITS_BLOCK:
+            size += FITS_BLOCK - size % FITS_BLOCK
+        self._fileobj.truncate(offset + size)
+        self._fileobj.close()
+        return (offset, self._dtype, self._bzero)
+
+    def records(self, table):
+        """Convert `table` into FITS binary table rows.
+
+        Parameters
+        ----------
+        table : :class:`astropy.table.Table`
+            A block of data.
+
+        Returns
+        -------
+        :class:`numpy.ndarray`
+            A big-endian structured array, ready to be written to disk.
+        """
+        rec = np.zeros((len(table),), dtype=self._dtype)
+        for name in self._dtype.names:
+            col = np.asarray(table[name])
+            if col.dtype.kind == 'b':
+                rec[name] = np.where(col, ord('T'), ord('F'))
+            elif col.dtype.kind == 'U':
+                rec[name] = np.char.encode(col, 'ascii')
+            elif name in self._bzero:
+                rec[name] = col - col.dtype.type(self._bzero[name])
+            else:
+                rec[name] = col
+        return rec
+
+    def write(self, table):
+        """Append a block of rows to the file.
+
+        Parameters
+        ----------
+        table : :class:`astropy.table.Table`
+            A block of data.
+
+        Raises
+        ------
+        :exc:`ValueError`
+            If more rows are written than were declared.
+        """
+        if self._dtype is None:
+            self._writeHeader(table)
+        if self.written + len(table) > self.nrows:
+            raise ValueError("Attempt to write more than {0:d} rows to {1}!".format(self.nrows, self.filename))
+        self.records(table).tofile(self._fileobj)
+        self.written += len(table)
+
+    def close(self):
+        """Pad the data to a complete FITS block and close the file.
+
+        Raises
+        ------
+        :exc:`ValueError`
+            If fewer rows were written than were declared.
+        """
+        if self._fileobj.closed:
+            return
+        size = 0 if self._dtype is None else self.written * self._dtype.itemsize
+        if size % FITS_BLOCK:
+            self._fileobj.write(b'\x00' * (FITS_BLOCK - size % FITS_BLOCK))
+        self._fileobj.close()
+        if self.written != self.nrows:
+            raise ValueError("Only {0:d} of {1:d} rows were written to {2}!".format(self.written, self.nrows, self.filename))
+
+
+class FITSPartWriter(FITSBlockWriter):
+    """Write a range of rows into a file prepared by :meth:`FITSBlockWriter.allocate`.
+
+    Parameters
+    ----------
+    filename : :class:`str`
+        Name of the FITS file.
+    nrows : :class:`int`
+        Number of rows that will be written.
+    start : :class:`int`
+        Index of the first row to be written.
+    layout : :class:`tuple`
+        The value returned by :meth:`FITSBlockWriter.allocate`.
+    """
+
+    def __init__(self, filename, nrows, start, layout):
+        offset, dtype, bzero = layout
+        self.filename = filename
+        self.nrows = nrows
+        self.written = 0
+        self.header = None
+        self._bzero = bzero
+        self._dtype = dtype
+        self._fileobj = open(filename, 'r+b')
+        self._fileobj.seek(offset + start * dtype.itemsize)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._fileobj.close()
+        return False
+
+    def close(self):
+        """Close the file.
+
+        Raises
+        ------
+        :exc:`ValueError`
+            If fewer rows were written than were declared.
+        """
+        if self._fileobj.closed:
+            return
+        self._fileobj.close()
+        if self.written != self.nrows:
+            raise ValueError("Only {0:d} of {1:d} rows were written to {2}!".format(self.written, self.nrows, self.filename))
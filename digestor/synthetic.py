@@ -0,0 +1,162 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.synthetic
+==================
+
+Generate large SDSS-like FITS files and matching SQL definitions, for
+benchmarks.
+
+The data contain the features that make SDSS conversions expensive:
+per-band array columns, ``FLAGS``/``FLAGS2`` pairs, 64-bit integers
+stored as blank-padded strings, unsigned 64-bit identifiers above
+:math:`2^{63}`, non-finite values and range-checked narrowing.  Files are
+written block by block, so any number of rows can be generated with
+bounded memory.  Each block has its own random number stream, so the
+same number of rows, block size and seed always produce the same file.
+"""
+import numpy as np
+from astropy.table import Table
+
+from .stream import FITSBlockWriter
+
+#
+# Name of the synthetic table.
+#
+SYNTHETIC_TABLE = 'synthetic'
+#
+# First object ID, similar to SDSS photometric object IDs.
+#
+_first_objid = 1237645876861272065
+
+_sql = """CREATE TABLE {table} (
+-------------------------------------------------------------------------------
+--/H Synthetic SDSS-like catalog for benchmarks.
+--
+--/T Generated by digestor.synthetic.
+-------------------------------------------------------------------------------
+    objID bigint NOT NULL, --/D Object ID, stored as a blank-padded string --/K meta.id
+    specObjID bigint NOT NULL, --/D Spectrum ID, stored as an unsigned integer --/K meta.id
+    ra float NOT NULL, --/U deg --/D Right Ascension --/K pos.eq.ra
+    dec float NOT NULL, --/U deg --/D Declination --/K pos.eq.dec
+    plate smallint NOT NULL, --/D Plate number
+    mjd int NOT NULL, --/U days --/D MJD of observation
+    fiberID smallint NOT NULL, --/D Fiber number
+    run2d varchar(7) NOT NULL, --/D Spectroscopic reduction version
+    type smallint NOT NULL, --/D Morphological type, stored as a 32-bit integer
+    nSpecObs int NOT NULL, --/D Number of spectroscopic observations
+    flags bigint NOT NULL, --/F objc_flags --/D Object flags
+{bands}    z real NOT NULL, --/D Redshift
+    zErr real NOT NULL, --/D Redshift error
+);
+"""
+
+_band_sql = """    psfMag_{b} real NOT NULL, --/U mag --/D PSF magnitude in {b}
+    psfMagErr_{b} real NOT NULL, --/U mag --/D PSF magnitude error in {b}
+    modelMag_{b} real NOT NULL, --/U mag --/D Model magnitude in {b}
+    flags_{b} bigint NOT NULL, --/D Object flags in {b}
+"""
+
+
+def synthetic_sql(table=SYNTHETIC_TABLE):
+    """SQL definition of the synthetic table.
+
+    Parameters
+    ----------
+    table : :class:`str`, optional
+        Name of the table.
+
+    Returns
+    -------
+    :class:`str`
+        A ``CREATE TABLE`` statement in SDSS format.
+    """
+    bands = ''.join([_band_sql.format(b=b) for b in 'ugriz'])
+    return _sql.format(table=table, bands=bands)
+
+
+def synthetic_block(start, nrows, seed=1):
+    """Generate a block of rows of synthetic data.
+
+    Parameters
+    ----------
+    start : :class:`int`
+        Index of the first row.
+    nrows : :class:`int`
+        Number of rows.
+    seed : :class:`int`, optional
+        Seed for random number generation.
+
+    Returns
+    -------
+    :class:`astropy.table.Table`
+        The data, with SDSS-style FITS column names.
+    """
+    row = np.arange(start, start + nrows, dtype=np.int64)
+    #
+    # Blocks can be generated independently, in any order.
+    #
+    rng = np.random.default_rng([seed, start])
+    data = Table()
+    #
+    # About 1% of IDs are blank, and 1% are above 2**63.
+    #
+    objid = row.astype(np.uint64) + np.uint64(_first_objid)
+    high = row % 97 == 5
+    objid[high] += np.uint64(2**63)
+    text = np.char.rjust(objid.astype('S20'), 20)
+    text[row % 101 == 7] = b' '*20
+    data['OBJID'] = text
+    data['SPECOBJID'] = row.astype(np.uint64) + np.uint64(2**63 + 2**62)
+    data['RA'] = rng.uniform(0.0, 360.0, nrows)
+    data['DEC'] = np.degrees(np.arcsin(rng.uniform(-1.0, 1.0, nrows)))
+    data['PLATE'] = (266 + row // 1000 % 10000).astype(np.int16)
+    data['MJD'] = (51602 + row // 1000 % 5000).astype(np.int32)
+    data['FIBERID'] = (1 + row % 1000).astype(np.int16)
+    data['RUN2D'] = np.array([b'v5_13_0', b'26', b'104'])[row % 3]
+    data['TYPE'] = rng.choice(np.array([3, 6], dtype=np.int32), nrows)
+    data['NSPECOBS'] = (row % 4).astype(np.int16)
+    data['OBJC_FLAGS'] = rng.integers(0, 2**31, nrows, dtype=np.int32)
+    data['OBJC_FLAGS2'] = rng.integers(0, 2**31, nrows, dtype=np.int32)
+    mag = rng.normal(21.0, 2.0, (nrows, 5)).astype(np.float32)
+    #
+    # About 1% of magnitudes are not finite.
+    #
+    mag[rng.random((nrows, 5)) < 0.01] = np.nan
+    data['PSFMAG'] = mag
+    data['PSFMAGERR'] = rng.exponential(0.05, (nrows, 5)).astype(np.float32)
+    data['MODELMAG'] = mag + rng.normal(0.0, 0.1, (nrows, 5)).astype(np.float32)
+    data['FLAGS'] = rng.integers(0, 2**31, (nrows, 5), dtype=np.int32)
+    data['FLAGS2'] = rng.integers(0, 2**31, (nrows, 5), dtype=np.int32)
+    z = rng.exponential(0.3, nrows).astype(np.float32)
+    z[row % 53 == 11] = np.inf
+    data['Z'] = z
+    data['ZERR'] = rng.exponential(0.001, nrows).astype(np.float32)
+    return data
+
+
+def write_synthetic(filename, nrows, blocksize=1000000, seed=1, sql=None,
+                    table=SYNTHETIC_TABLE):
+    """Write a synthetic FITS file.
+
+    Parameters
+    ----------
+    filename : :class:`str`
+        Name of the FITS file.
+    nrows : :class:`int`
+        Number of rows.
+    blocksize : :class:`int`, optional
+        Generate and write this many rows at a time (default 1000000).
+    seed : :class:`int`, optional
+        Seed for random number generation.
+    sql : :class:`str`, optional
+        If set, also write the SQL definition of the table to this file.
+    table : :class:`str`, optional
+        Name of the table in the SQL definition.
+    """
+    with FITSBlockWriter(filename, nrows) as writer:
+        for start in range(0, max(nrows, 1), blocksize):
+            writer.write(synthetic_block(start, min(blocksize, nrows - start), seed))
+    if sql is not None:
+        with open(sql, 'w') as f:
+            f.write(synthetic_sql(table))
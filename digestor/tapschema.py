@@ -0,0 +1,165 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""
+digestor.tapschema
+==================
+
+Storage for TapSchema metadata that can be searched without scanning
+every column of every table.
+"""
+
+
+class ColumnList(list):
+    """A list of TapSchema column definitions, indexed by table and column.
+
+    This is a :class:`list` of :class:`dict`, so it serializes to the same
+    JSON as a plain list, and existing code may append, delete or replace
+    columns as usual.  Changing the list invalidates the index, which is
+    rebuilt when next needed.  Appending a column updates the index
+    instead.  Changing the ``table_name`` or ``column_name`` of a column
+    in place requires a call to :meth:`reindex`.
+
+    Parameters
+    ----------
+    columns : iterable, optional
+        Initial column definitions.
+    """
+
+    def __init__(self, columns=()):
+        super().__init__(columns)
+        self.reindex()
+
+    def __reduce__(self):
+        #
+        # The index is not pickled; it is rebuilt when needed.
+        #
+        return (self.__class__, (list(self),))
+
+    def reindex(self):
+        """Discard the index, so that it is rebuilt when next needed.
+        """
+        self._slots = None
+        self._tables = None
+
+    def _index(self):
+        """Build the index, if necessary.
+        """
+        if self._slots is None:
+            slots = dict()
+            tables = dict()
+            for i, c in enumerate(self):
+                key = (c['table_name'], c['column_name'])
+                if key not in slots:
+                    slots[key] = i
+                tables.setdefault(c['table_name'], list()).append(i)
+            self._slots = slots
+            self._tables = tables
+        return self._slots
+
+    def slot(self, table, column):
+        """Find the position of a column.
+
+        Parameters
+        ----------
+        table : :class:`str`
+            Name of the table.
+        column : :class:`str`
+            Name of the column.
+
+        Returns
+        -------
+        :class:`int`
+            The position of the first column definition matching `table`
+            and `column`.
+
+        Raises
+        ------
+        :exc:`KeyError`
+            If the column is not found.
+        """
+        return self._index()[(table, column)]
+
+    def slots(self, table):
+        """Positions of all columns in a table.
+
+        Parameters
+        ----------
+        table : :class:`str`
+            Name of the table.
+
+        Returns
+        -------
+        :class:`list`
+            The positions, in order.  This list must not be modified.
+        """
+        self._index()
+        return self._tables.get(table, [])
+
+    def names(self, table):
+        """Names of all columns in a table.
+
+        Parameters
+        ----------
+        table : :class:`str`
+            Name of the table.
+
+        Returns
+        -------
+        :class:`list`
+            The column names, in order.
+        """
+        return [self[i]['column_name'] for i in self.slots(table)]
+
+    def append(self, column):
+        super().append(column)
+        if self._slots is not None:
+            key = (column['table_name'], column['column_name'])
+            if key not in self._slots:
+                self._slots[key] = len(self) - 1
+            self._tables.setdefault(column['table_name'], list()).append(len(self) - 1)
+
+    def extend(self, columns):
+        for c in columns:
+            self.append(c)
+
+    def __iadd__(self, columns):
+        self.extend(columns)
+        return self
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.reindex()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.reindex()
+
+    def insert(self, index, column):
+        super().insert(index, column)
+        self.reindex()
+
+    def pop(self, index=-1):
+        column = super().pop(index)
+        self.reindex()
+        return column
+
+    def remove(self, column):
+        super().remove(column)
+        self.reindex()
+
+    def clear(self):
+        super().clear()
+        self.reindex()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self.reindex()
+
+    def reverse(self):
+        super().reverse()
+        self.reindex()
+
+    def __imul__(self, n):
+        super().__imul__(n)
+        self.reindex()
+        return self
@@ -7,9 +7,10 @@ import unittest.mock as mock
 import os
 import logging
 import json
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, TemporaryDirectory
 
 import numpy as np
+from astropy.table import Table
 
 from ..base import Digestor
 from .utils import DigestorCase
@@ -25,8 +26,12 @@ class TestBase(DigestorCase):
         self.table = 'spectra'
         self.stable = "{0.schema}.{0.table}".format(self)
         self.description = 'sdss schema'
+        #
+        # Most tests exercise the STILTS-based pixel columns.
+        #
         self.base = Digestor(self.schema, self.table,
-                             description=self.description)
+                             description=self.description,
+                             native=False)
 
     def test_configure_log(self):
         """Test the logging configuration.
@@ -113,6 +118,16 @@ class TestBase(DigestorCase):
             i = self.base.columnIndex('foobar')
         self.assertEqual(e.exception.args[0],
                          "Column {0} was not found in {1.schema}.{1.table}!".format('foobar', self.base))
+        #
+        # Removing a column must not leave stale positions behind.
+        #
+        i = self.base.columnIndex('ring256')
+        del self.base.tapSchema['columns'][self.base.columnIndex('htm9')]
+        self.assertEqual(self.base.columnIndex('ring256'), i - 1)
+        with self.assertRaises(ValueError):
+            self.base.columnIndex('htm9')
+        self.assertNotIn('htm9', self.base.colNames)
+        self.assertEqual(self.base.nColumns, len(self.base.colNames))
 
     def test_fix_columns(self):
         """Test "by hand" fixes to table definition.
@@ -173,10 +188,12 @@ class TestBase(DigestorCase):
     def test_add_dl_columns(self):
         """Test adding STILTS columns.
         """
-        with mock.patch('os.path.exists') as e:
-            e.return_value = True
+        with mock.patch('digestor.base.is_current') as c:
+            c.return_value = True
             out = self.base.addDLColumns('specObj-dr14.fits')
+            c.assert_called_with([out], mock.ANY)
         self.assertEqual(out, 'specObj-dr14.stilts.fits')
+        self.assertLog(-1, 'Using existing file: specObj-dr14.stilts.fits.')
         with mock.patch('subprocess.Popen') as proc:
             p = proc.return_value = mock.MagicMock()
             p.returncode = 0
@@ -223,6 +240,64 @@ class TestBase(DigestorCase):
                                     stderr=-1, stdout=-1)
         self.assertLog(-1, 'STILTS STDERR = foobar')
 
+    def test_add_dl_columns_native(self):
+        """Test adding STILTS columns when some are computed in-process.
+        """
+        base = Digestor(self.schema, self.table, description=self.description,
+                        ra='plug_ra')
+        self.assertListEqual(base.nativeColumns, ['htm9', 'ring256', 'nest4096',
+                                                  'elon', 'elat', 'glon', 'glat'])
+        with mock.patch('subprocess.Popen') as proc:
+            out = base.addDLColumns('specObj-dr14.fits')
+            proc.assert_not_called()
+        self.assertEqual(out, 'specObj-dr14.fits')
+        self.assertLog(-1, 'No STILTS processing needed for specObj-dr14.fits.')
+        base._custom_stilts_command = ['cmd=addcol foo 1']
+        with mock.patch('subprocess.Popen') as proc:
+            p = proc.return_value = mock.MagicMock()
+            p.returncode = 0
+            p.communicate.return_value = (b'', b'')
+            with mock.patch('os.path.exists') as e:
+                e.return_value = False
+                out = base.addDLColumns('specObj-dr14.fits')
+            proc.assert_called_with(['stilts', 'tpipe',
+                                     'in=specObj-dr14.fits',
+                                     'cmd=addcol foo 1',
+                                     'ofmt=fits-basic',
+                                     'out=specObj-dr14.stilts.fits'],
+                                    stderr=-1, stdout=-1)
+        self.assertEqual(out, 'specObj-dr14.stilts.fits')
+        base = Digestor(self.schema, self.table, description=self.description,
+                        pixels=False, ecliptic=False, galactic=False)
+        self.assertListEqual(base.nativeColumns, [])
+        with mock.patch('subprocess.Popen') as proc:
+            out = base.addDLColumns('specObj-dr14.fits')
+            proc.assert_not_called()
+        self.assertEqual(out, 'specObj-dr14.fits')
+
+    def test_derive_columns(self):
+        """Test computing Data Lab-added columns in-process.
+        """
+        base = Digestor(self.schema, self.table, description=self.description)
+        old = {'RA': np.array([0.0, 45.0, 123.456]),
+               'DEC': np.array([0.0, 41.8103148958, -30.5])}
+        t = mock.MagicMock()
+        t.colnames = list(old.keys())
+        t.__getitem__.side_effect = lambda key: old[key]
+        derived = base.deriveColumns(t)
+        self.assertListEqual(derived['htm9'].tolist(), [4063232, 4185139, 2608835])
+        self.assertListEqual(derived['ring256'].tolist(), [391680, 129667, 592735])
+        self.assertListEqual(derived['nest4096'].tolist(), [79691776, 12582912, 161479533])
+        self.assertTrue(np.allclose(derived['glon'], [96.33728341, 147.16120971, 249.11372872]))
+        self.assertTrue(np.allclose(derived['elat'], [-2.11114248e-07, 23.70374744, -48.72965160]))
+        base.native = False
+        self.assertDictEqual(base.deriveColumns(t), {})
+        base.native = True
+        base.ra = 'plug_ra'
+        with self.assertRaises(KeyError) as e:
+            base.deriveColumns(t)
+        self.assertEqual(e.exception.args[0], 'Could not find a FITS column corresponding to plug_ra!')
+
     def test_map_columns(self):
         """Test mapping of FITS columns to SQL columns.
         """
@@ -246,18 +321,55 @@ class TestBase(DigestorCase):
         with self.assertRaises(KeyError) as e:
             self.base.mapColumns()
         self.assertEqual(e.exception.args[0], 'Could not find a FITS column corresponding to z!')
+        #
+        # Pixel columns computed in-process do not need a FITS column.
+        #
+        self.base.native = True
+        self.base.FITS = {'RA': 'D', 'DEC': 'D', 'z': 'E',
+                          'elon': 'D', 'elat': 'D',
+                          'glon': 'D', 'glat': 'D'}
+        self.base.mapping = dict()
+        self.base.mapColumns()
+        self.assertNotIn('htm9', self.base.mapping)
+        self.assertNotIn('ring256', self.base.mapping)
+        self.assertNotIn('nest4096', self.base.mapping)
+        del self.base.FITS['DEC']
+        with self.assertRaises(KeyError) as e:
+            self.base.mapColumns()
+        self.assertEqual(e.exception.args[0], 'Could not find a FITS column corresponding to dec!')
+
+    def test_stilts_columns(self):
+        """Test predicting the columns added by STILTS.
+        """
+        self.assertListEqual(self.base.stiltsColumns(),
+                             ['htm9', 'ring256', 'nest4096', 'elon', 'elat', 'glon', 'glat'])
+        self.assertEqual(self.base.stiltsCommands('plug_ra')[0],
+                         'cmd=addcol htm9 (int)htmIndex(9,plug_ra,plug_dec)')
+        self.base._custom_stilts_command = ['cmd=select skyversion==2',
+                                            'cmd=addcol -ucd meta.id -after specobjid sdss_joinid "(((long)plate<<50)|((long)fiberid<<38))"']
+        self.base.pixels = False
+        self.base.galactic = False
+        self.assertListEqual(self.base.stiltsColumns(), ['sdss_joinid', 'elon', 'elat'])
+        base = Digestor(self.schema, self.table, description=self.description)
+        self.assertListEqual(base.stiltsCommands(), [])
+        self.assertListEqual(base.stiltsColumns(), [])
 
     def test_parse_fits(self):
         """Test reading metadata from FITS file.
         """
-        with mock.patch('astropy.io.fits.open', mock.mock_open()) as mo:
-            columns = mock.MagicMock()
-            columns.columns.names = ['foo', 'bar']
-            columns.columns.formats = ['D', 'J']
-            mo.return_value.__enter__.return_value = [None, columns]
+        header = {'TFIELDS': 2, 'TTYPE1': 'foo', 'TFORM1': 'D',
+                  'TTYPE2': 'bar', 'TFORM2': 'J'}
+        with mock.patch('digestor.base.read_header') as rh:
+            rh.return_value = header
             self.base.parseFITS('foo.fits')
+        rh.assert_called_once_with('foo.fits', 1)
         self.assertEqual(self.base._inputFITS, 'foo.fits')
         self.assertDictEqual(self.base.FITS, {'foo': 'D', 'bar': 'J'})
+        with mock.patch('digestor.base.read_header') as rh:
+            rh.return_value = header
+            self.base.parseFITS('foo.fits', pending=['htm9'])
+        self.assertDictEqual(self.base.FITS, {'foo': 'D', 'bar': 'J', 'htm9': None})
+        self.assertLog(-1, 'Columns htm9 will be added by STILTS.')
 
     def test_process_fits(self):
         """Test processing of FITS file for loading.
@@ -333,8 +445,9 @@ class TestBase(DigestorCase):
         #
         # Raise an unsafe error.
         #
-        with mock.patch('digestor.base.Table') as T:
-            t = T.read.return_value = mock.MagicMock()
+        with mock.patch('digestor.stream.read_blocks') as R, mock.patch('astropy.table.Table'):
+            t = mock.MagicMock()
+            R.return_value = iter([t])
             t.__getitem__.side_effect = lambda key: dummy_values[key]
             with self.assertRaises(ValueError) as e:
                 self.base.processFITS()
@@ -346,28 +459,136 @@ class TestBase(DigestorCase):
         #
         # Try again.
         #
-        with mock.patch('digestor.base.Table') as T:
-            t = T.read.return_value = mock.MagicMock()
+        with mock.patch('digestor.stream.read_blocks') as R, mock.patch('astropy.table.Table'):
+            t = mock.MagicMock()
+            R.return_value = iter([t])
             t.__getitem__.side_effect = lambda key: dummy_values[key]
             out = self.base.processFITS()
         self.assertEqual(out, '{0.schema}.{0.table}.fits'.format(self))
         #
         # Check overwrite
         #
-        with mock.patch('os.path.exists') as ex:
-            ex.return_value = True
+        with mock.patch('digestor.base.is_current') as c:
+            c.return_value = True
             out = self.base.processFITS()
-            ex.assert_called_with(out)
+            c.assert_called_with([out], self.base.outputKey(1, [out]))
         with mock.patch('os.path.exists') as ex:
             with mock.patch('os.remove') as rm:
-                with mock.patch('digestor.base.Table') as T:
-                    t = T.read.return_value = mock.MagicMock()
+                with mock.patch('digestor.stream.read_blocks') as R, mock.patch('astropy.table.Table'):
+                    t = mock.MagicMock()
+                    R.return_value = iter([t])
                     t.__getitem__.side_effect = lambda key: dummy_values[key]
                     ex.return_value = True
                     out = self.base.processFITS(overwrite=True)
             rm.assert_called_with(out)
             ex.assert_called_with(out)
 
+    def test_process_fits_narrow(self):
+        """Test narrowing integers that do not fit in a later block.
+        """
+        b = Digestor(self.schema, self.table, description=self.description,
+                     pixels=False, random=False, ecliptic=False, galactic=False)
+        b.tapSchema['columns'] += [b.tapColumn('id', datatype='bigint'),
+                                   b.tapColumn('small', datatype='smallint')]
+        data = Table()
+        data['id'] = np.arange(6, dtype=np.int64)
+        data['small'] = np.array([1, 2, 3, 4, 2**15, 5], dtype=np.int32)
+        cwd = os.getcwd()
+        with TemporaryDirectory() as d:
+            os.chdir(d)
+            try:
+                data.write('foo.fits')
+                b.parseFITS('foo.fits')
+                b.mapColumns()
+                self.assertEqual(b.planColumn(b.tapSchema['columns'][-1])['kernel'], 'narrow')
+                for kwargs in ({'blocksize': 2}, {'blocksize': 2, 'output': 'pgcopy'}, {}):
+                    with self.assertRaises(ValueError) as e:
+                        b.processFITS(overwrite=True, **kwargs)
+                    self.assertEqual(e.exception.args[0],
+                                     'No safe data type conversion possible for small (J) -> small (smallint)!')
+                    self.assertLog(-1, 'No safe data type conversion possible for small (J) -> small (smallint)!')
+                data['small'][4] = 6
+                data.write('foo.fits', overwrite=True)
+                out = b.processFITS(overwrite=True, blocksize=2)
+                t = Table.read(out)
+            finally:
+                os.chdir(cwd)
+        self.assertListEqual(t.colnames, ['id', 'small'])
+        self.assertListEqual(t['small'].tolist(), [1, 2, 3, 4, 6, 5])
+        self.assertEqual(t['small'].dtype.itemsize, 2)
+
+    def test_output_key(self):
+        """Test that the output stamp depends on the position columns.
+        """
+        keys = list()
+        for ra in ('ra', 'plug_ra'):
+            b = Digestor(self.schema, self.table, description=self.description,
+                         random=False, ecliptic=False, galactic=False, ra=ra)
+            b.FITS = {'RA': 'D', 'DEC': 'D', 'PLUG_RA': 'D', 'PLUG_DEC': 'D'}
+            b._inputFITS = 'foo.fits'
+            self.assertEqual(b.plan[0]['column'], 'htm9')
+            self.assertEqual(b.plan[0]['kernel'], 'derived')
+            self.assertEqual(b.plan[0]['source'], ra.upper())
+            keys.append(b.outputKey(1, ['foo_out.fits']))
+        self.assertNotEqual(keys[0], keys[1])
+
+    def test_copy_sql(self):
+        """Test listing only the columns written to a binary COPY file.
+        """
+        b = Digestor(self.schema, self.table, description=self.description,
+                     pixels=False, ecliptic=False, galactic=False)
+        b.tapSchema['columns'] += [b.tapColumn('id', datatype='bigint')]
+        b.FITS = {'ID': 'K'}
+        b.mapping = {'id': 'ID'}
+        self.assertListEqual(b.colNames, ['random_id', 'id'])
+        self.assertEqual(b.copySQL(),
+                         'COPY sdss.spectra (id) FROM STDIN WITH (FORMAT binary);\n')
+        self.assertEqual(b.copySQL('/data/foo.pgcopy'),
+                         "COPY sdss.spectra (id) FROM '/data/foo.pgcopy' WITH (FORMAT binary);\n")
+
+    def test_convert_columns(self):
+        """Test converting columns on several threads.
+        """
+        columns = [self.base.tapColumn('c{0:d}'.format(k), datatype='double')
+                   for k in range(6)]
+        old = dict([('C{0:d}'.format(k), np.arange(10, dtype=np.float32) + k)
+                    for k in range(6)])
+        self.base.FITS = dict([(c, 'E') for c in old])
+        self.base.mapping = dict([(c.lower(), c) for c in old])
+        steps = [self.base.planColumn(c) for c in columns]
+        self.assertListEqual([s['kernel'] for s in steps], ['widen']*6)
+        serial = self.base.convertColumns(steps, old, dict())
+        self.base.threads = 3
+        threaded = self.base.convertColumns(steps, old, dict())
+        self.assertEqual(len(threaded), 6)
+        for k in range(6):
+            self.assertEqual(threaded[k].dtype, np.dtype(np.float64))
+            self.assertTrue((threaded[k] == serial[k]).all())
+            self.assertEqual(threaded[k][0], k)
+        root_logger = logging.getLogger('digestor')
+        h = root_logger.handlers[0]
+        workers = [r for r in h.buffer if r.name == 'digestor.base.Digestor.convertColumns']
+        self.assertLessEqual(len(workers), 3)
+        self.assertEqual(sum([r.args[1] for r in workers]), 6)
+        self.assertTrue(workers[0].getMessage().startswith('convert_'))
+        #
+        # Input columns are read-only views of the input file, which
+        # are copied only if sentinel values must be replaced.
+        #
+        self.base.FITS['R'] = 'E'
+        self.base.mapping['r'] = 'R'
+        step = self.base.planColumn(self.base.tapColumn('r', datatype='real'))
+        self.assertEqual(step['kernel'], 'passthrough')
+        step['sentinel'] = -9999.0
+        old = {'R': np.array([1.0, np.nan, 3.0], dtype=np.float32)}
+        old['R'].flags.writeable = False
+        new = self.base.convertColumn(step, old, dict())
+        self.assertEqual(new[1], step['sentinel'])
+        self.assertTrue(np.isnan(old['R'][1]))
+        old['R'] = old['R'][::2]
+        new = self.base.convertColumn(step, old, dict())
+        self.assertTrue(np.shares_memory(new, old['R']))
+
     def test_write_schema(self):
         """Test writing TapSchema metadata to file.
         """
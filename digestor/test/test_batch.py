@@ -0,0 +1,111 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.batch.
+"""
+import json
+import os
+import unittest
+import unittest.mock as mock
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+
+from ..batch import get_options, main, read_manifest, run_job
+from .utils import DigestorCase
+
+manifest = """options: -s sdss_dr16 -d "Sloan Digital Sky Survey Data Release 16"
+jobs:
+    - fits: specObj-dr16.fits
+      sql: specobjall.sql
+      table: specobjall
+      options: -r plug_ra
+    - fits: photoPlate-dr16.fits
+      sql: photoplate.sql
+      options: [-T, 4]
+"""
+
+
+class TestBatch(DigestorCase):
+    """Test digestor.batch.
+    """
+
+    def test_get_options(self):
+        """Test command-line arguments.
+        """
+        with mock.patch('sys.argv', ['sdss2dl_batch', '-n', '4', 'dr16.yaml']):
+            options = get_options()
+        self.assertEqual(options.processes, 4)
+        self.assertEqual(options.manifest, 'dr16.yaml')
+        self.assertIsNone(options.summary)
+
+    def test_read_manifest(self):
+        """Test reading a manifest of jobs.
+        """
+        with TemporaryDirectory() as d:
+            f = os.path.join(d, 'dr16.yaml')
+            with open(f, 'w') as y:
+                y.write(manifest)
+            jobs = read_manifest(f)
+            self.assertListEqual(jobs[0], ['-s', 'sdss_dr16', '-d', 'Sloan Digital Sky Survey Data Release 16',
+                                           '-r', 'plug_ra', '--table', 'specobjall',
+                                           'specObj-dr16.fits', 'specobjall.sql'])
+            self.assertListEqual(jobs[1], ['-s', 'sdss_dr16', '-d', 'Sloan Digital Sky Survey Data Release 16',
+                                           '-T', '4', 'photoPlate-dr16.fits', 'photoplate.sql'])
+            with open(f, 'w') as y:
+                y.write("jobs:\n    - fits: specObj-dr16.fits\n")
+            with self.assertRaises(ValueError) as e:
+                read_manifest(f)
+            self.assertEqual(str(e.exception), "Job 0 in {0} has no 'sql' entry!".format(f))
+
+    def test_run_job(self):
+        """Test running a single job.
+        """
+        with mock.patch('digestor.batch.sdss_main') as m:
+            m.return_value = 0
+            job = run_job(['foo.fits', 'foo.sql'])
+            m.assert_called_once_with(['foo.fits', 'foo.sql'])
+        self.assertEqual(job['status'], 0)
+        self.assertIsNone(job['error'])
+        with mock.patch('digestor.batch.sdss_main') as m:
+            m.side_effect = OSError('Disk full')
+            job = run_job(['foo.fits', 'foo.sql'])
+        self.assertEqual(job['status'], 2)
+        self.assertEqual(job['error'], 'OSError: Disk full')
+
+    def test_main(self):
+        """Test running a manifest.
+        """
+        with TemporaryDirectory() as d:
+            f = os.path.join(d, 'dr16.yaml')
+            with open(f, 'w') as y:
+                y.write(manifest)
+            with mock.patch('sys.argv', ['sdss2dl_batch', '-n', '2', f]), \
+                    mock.patch('digestor.batch.ProcessPoolExecutor', ThreadPoolExecutor), \
+                    mock.patch('digestor.batch.sdss_main') as m, \
+                    mock.patch('builtins.print') as p:
+                m.side_effect = [0, 1]
+                status = main()
+            self.assertEqual(status, 1)
+            self.assertEqual(m.call_count, 2)
+            self.assertEqual(p.call_count, 2)
+            with open(os.path.join(d, 'dr16.summary.json')) as j:
+                summary = json.load(j)
+            self.assertEqual(summary['failed'], 1)
+            self.assertListEqual([job['status'] for job in summary['jobs']], [0, 1])
+            self.assertEqual(summary['jobs'][1]['args'][-1], 'photoplate.sql')
+            with open(f, 'w') as y:
+                y.write("jobs:\n    - fits: specObj-dr16.fits\n      sql: foo.sql\n      options: --no-such-option\n")
+            with mock.patch('sys.argv', ['sdss2dl_batch', f]), \
+                    mock.patch('sys.stderr'), \
+                    mock.patch('builtins.print') as p:
+                status = main()
+            self.assertEqual(status, 1)
+            p.assert_called_with('Invalid options for job: --no-such-option specObj-dr16.fits foo.sql',
+                                 file=mock.ANY)
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
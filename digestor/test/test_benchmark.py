@@ -0,0 +1,80 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.benchmark.
+"""
+import os
+import unittest
+import unittest.mock as mock
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+from ..benchmark import (BENCHMARKS, compare, main, prepare_input,
+                         read_results, run_benchmarks)
+from .utils import DigestorCase
+
+
+class TestBenchmark(DigestorCase):
+    """Test digestor.benchmark.
+    """
+
+    def test_prepare_input(self):
+        """Test reusing synthetic input files.
+        """
+        with TemporaryDirectory() as d:
+            fits, sql = prepare_input(d, 20, seed=3)
+            self.assertEqual(fits, os.path.join(d, 'synthetic_20_3.fits'))
+            self.assertEqual(sql, os.path.join(d, 'synthetic_20_3.sql'))
+            with mock.patch('digestor.synthetic.write_synthetic') as w:
+                self.assertEqual(prepare_input(d, 20, seed=3), (fits, sql))
+                w.assert_not_called()
+            with self.assertRaises(ValueError):
+                run_benchmarks(fits, sql, ['foo'])
+
+    def test_main(self):
+        """Test running and comparing benchmarks.
+        """
+        with TemporaryDirectory() as d:
+            results = os.path.join(d, 'results.jsonl')
+            args = ['-n', '50', '-r', '1', '-d', d, '-o', results]
+            with mock.patch('sys.stdout', new_callable=StringIO) as out:
+                self.assertEqual(main(args), 0)
+            lines = out.getvalue().split('\n')
+            self.assertEqual(len(lines), len(BENCHMARKS) + 2)
+            self.assertEqual(lines[1].split()[2:], ['-', '-'])
+            with mock.patch('sys.stdout', new_callable=StringIO) as out:
+                self.assertEqual(main(args + ['-B', 'parseSQL', '-B', 'processFITS']), 0)
+            lines = out.getvalue().split('\n')
+            self.assertEqual(len(lines), 5)
+            self.assertTrue(lines[3].startswith('Compared to '))
+            r = read_results(results)
+            self.assertEqual(sorted(os.listdir(d)),
+                             ['results.jsonl', 'synthetic_50_1.fits', 'synthetic_50_1.sql'])
+        self.assertEqual(len(r), 2)
+        self.assertEqual(r[0]['rows'], 50)
+        self.assertListEqual(list(r[0]['benchmarks'].keys()), list(BENCHMARKS))
+        self.assertListEqual(list(r[1]['benchmarks'].keys()), ['parseSQL', 'processFITS'])
+        for name, b in r[0]['benchmarks'].items():
+            self.assertEqual(len(b['times']), 1)
+            self.assertEqual(b['best'], b['times'][0])
+            self.assertEqual(name in ('parseSQL', 'mapColumns'), 'rows_per_second' not in b)
+        c = compare(r[1], r[0]).split('\n')
+        self.assertAlmostEqual(float(c[1].split()[2]), r[0]['benchmarks']['parseSQL']['best'], places=4)
+        self.assertEqual(read_results(os.path.join(d, 'results.jsonl')), [])
+
+    def test_generate(self):
+        """Test only generating input files.
+        """
+        with TemporaryDirectory() as d:
+            with mock.patch('sys.stdout', new_callable=StringIO) as out:
+                self.assertEqual(main(['-g', '-n', '10', '-d', d]), 0)
+            self.assertEqual(sorted(os.listdir(d)),
+                             ['synthetic_10_1.fits', 'synthetic_10_1.sql'])
+        self.assertTrue(out.getvalue().startswith('Input files: '))
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -0,0 +1,106 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.cache.
+"""
+import os
+import unittest
+import unittest.mock as mock
+from tempfile import TemporaryDirectory
+
+from ..cache import (STAMP_SUFFIX, cache_directory, content_digest,
+                     file_identity, is_current, read_cache, remove_stamp,
+                     stage_key, write_cache, write_stamp)
+from .utils import DigestorCase
+
+
+class TestCache(DigestorCase):
+    """Test digestor.cache.
+    """
+
+    def test_stage_key(self):
+        """Test that keys depend on inputs, parameters and version.
+        """
+        with TemporaryDirectory() as d:
+            f = os.path.join(d, 'foo.fits')
+            with open(f, 'w') as i:
+                i.write('foo')
+            self.assertEqual(file_identity(f)['size'], 3)
+            self.assertIsNone(file_identity(os.path.join(d, 'bar.fits'))['size'])
+            key = stage_key('test', [f], {'a': 1, 'b': [1, 2]})
+            self.assertEqual(len(key), 64)
+            self.assertEqual(stage_key('test', [f], {'b': [1, 2], 'a': 1}), key)
+            self.assertNotEqual(stage_key('other', [f], {'a': 1, 'b': [1, 2]}), key)
+            self.assertNotEqual(stage_key('test', [f], {'a': 2, 'b': [1, 2]}), key)
+            with mock.patch('digestor.cache.__version__', '0.0.0'):
+                self.assertNotEqual(stage_key('test', [f], {'a': 1, 'b': [1, 2]}), key)
+            os.utime(f, ns=(0, 0))
+            self.assertNotEqual(stage_key('test', [f], {'a': 1, 'b': [1, 2]}), key)
+
+    def test_stamp(self):
+        """Test recording and checking complete outputs.
+        """
+        with TemporaryDirectory() as d:
+            outputs = [os.path.join(d, 'foo.{0:d}.fits'.format(k)) for k in range(2)]
+            self.assertFalse(is_current(outputs, 'abc'))
+            with open(outputs[0], 'w') as o:
+                o.write('foo')
+            write_stamp(outputs, 'abc')
+            self.assertTrue(os.path.exists(outputs[0] + STAMP_SUFFIX))
+            self.assertFalse(os.path.exists(outputs[1] + STAMP_SUFFIX))
+            self.assertTrue(is_current(outputs[:1], 'abc'))
+            self.assertFalse(is_current(outputs, 'abc'))
+            with open(outputs[1], 'w') as o:
+                o.write('bar')
+            write_stamp(outputs, 'abc')
+            self.assertTrue(is_current(outputs, 'abc'))
+            self.assertFalse(is_current(outputs, 'def'))
+            os.remove(outputs[1])
+            self.assertFalse(is_current(outputs, 'abc'))
+            with open(outputs[0] + STAMP_SUFFIX, 'w') as o:
+                o.write('{')
+            self.assertFalse(is_current(outputs[:1], 'abc'))
+            remove_stamp(outputs)
+            self.assertListEqual(os.listdir(d), [os.path.basename(outputs[0])])
+
+    def test_cache(self):
+        """Test storing results keyed by file contents.
+        """
+        self.assertEqual(cache_directory(), self.cache_dir.name)
+        with mock.patch.dict(os.environ, {'DIGESTOR_CACHE': ''}):
+            self.assertIsNone(cache_directory())
+            write_cache('test', 'abc', {'a': 1})
+            self.assertIsNone(read_cache('test', 'abc'))
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': '/foo'}):
+            del os.environ['DIGESTOR_CACHE']
+            self.assertEqual(cache_directory(), '/foo/digestor')
+        self.assertListEqual(os.listdir(self.cache_dir.name), [])
+        with TemporaryDirectory() as d:
+            f = [os.path.join(d, 'foo{0:d}.sql'.format(k)) for k in range(2)]
+            for k in range(2):
+                with open(f[k], 'w') as i:
+                    i.write('foo')
+            digest = content_digest(f)
+            self.assertEqual(content_digest(f), digest)
+            self.assertNotEqual(content_digest(f[:1]), digest)
+            os.utime(f[0], ns=(0, 0))
+            self.assertEqual(content_digest(f), digest)
+            with open(f[1], 'w') as i:
+                i.write('bar')
+            self.assertNotEqual(content_digest(f), digest)
+        self.assertIsNone(read_cache('test', digest))
+        write_cache('test', digest, {'a': [1, 2]})
+        self.assertDictEqual(read_cache('test', digest), {'a': [1, 2]})
+        self.assertListEqual(os.listdir(self.cache_dir.name),
+                             ['test-{0}.json'.format(digest)])
+        with mock.patch('digestor.cache.__version__', '0.0.0'):
+            self.assertIsNone(read_cache('test', digest))
+        with mock.patch.dict(os.environ, {'DIGESTOR_CACHE': '/dev/null/foo'}):
+            write_cache('test', digest, {'a': [1, 2]})
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
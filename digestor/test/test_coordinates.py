@@ -0,0 +1,58 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.coordinates.
+"""
+import unittest
+
+import numpy as np
+
+from ..coordinates import ICRS_ECLIPTIC, ICRS_GALACTIC, ecliptic, galactic
+
+
+class TestCoordinates(unittest.TestCase):
+    """Test digestor.coordinates.
+    """
+
+    def test_matrices(self):
+        """Test that the transformations are rotations.
+        """
+        #
+        # The FK5 to galactic matrix is only given to 12 decimal places.
+        #
+        for m in (ICRS_GALACTIC, ICRS_ECLIPTIC):
+            self.assertTrue(np.allclose(np.dot(m, m.T), np.eye(3), rtol=0, atol=1e-10))
+            self.assertAlmostEqual(np.linalg.det(m), 1.0, places=10)
+
+    def test_galactic(self):
+        """Test conversion to galactic coordinates.
+        """
+        #
+        # Galactic center and north galactic pole.
+        #
+        l, b = galactic([266.40499, 192.85948], [-28.93617, 27.12825])
+        self.assertTrue(np.allclose(l[:1] % 360.0 - 360.0*(l[:1] > 180), [0.0], atol=1e-4))
+        self.assertTrue(np.allclose(b, [0.0, 90.0], atol=1e-4))
+        l, b = galactic(0.0, 0.0)
+        self.assertAlmostEqual(float(l), 96.33728341, places=7)
+        self.assertAlmostEqual(float(b), -60.18855197, places=7)
+
+    def test_ecliptic(self):
+        """Test conversion to ecliptic coordinates.
+        """
+        lon, lat = ecliptic(np.array([[90.0, 270.0], [45.0, 0.0]]),
+                            np.array([[23.43929111, 66.56070889], [41.8103148958, 0.0]]))
+        self.assertEqual(lon.shape, (2, 2))
+        self.assertAlmostEqual(lon[0, 0], 90.0, places=4)
+        self.assertAlmostEqual(lat[0, 0], 0.0, places=4)
+        self.assertAlmostEqual(lat[0, 1], 90.0, places=4)
+        self.assertAlmostEqual(lon[1, 0], 54.8578846, places=6)
+        self.assertAlmostEqual(lat[1, 0], 23.70374744, places=7)
+        self.assertTrue(((lon >= 0) & (lon < 360)).all())
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
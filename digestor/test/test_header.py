@@ -0,0 +1,67 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.header.
+"""
+import gzip
+import os
+import shutil
+import unittest
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+from ..header import read_header, table_columns
+from .utils import DigestorCase
+
+
+class TestHeader(DigestorCase):
+    """Test digestor.header.
+    """
+
+    def test_read_header(self):
+        """Compare headers with those read by :mod:`astropy.io.fits`.
+        """
+        data = Table()
+        data['id'] = np.arange(10, dtype=np.int64)
+        data['mag'] = np.arange(50, dtype=np.float32).reshape(10, 5)
+        data['name'] = np.array(['foo'] * 10)
+        image = fits.ImageHDU(np.zeros((7, 11), dtype=np.int16), name='IMAGE')
+        table = fits.BinTableHDU(data, name='DATA')
+        table.header['OBSERVER'] = "O'Hara"
+        table.header['EXPTIME'] = (1.5e3, 'seconds')
+        table.header['RAW'] = True
+        table.header['COMMENT'] = 'A comment.'
+        with TemporaryDirectory() as d:
+            f = os.path.join(d, 'foo.fits')
+            fits.HDUList([fits.PrimaryHDU(), image, table]).writeto(f)
+            with open(f, 'rb') as i, gzip.open(f + '.gz', 'wb') as o:
+                shutil.copyfileobj(i, o)
+            for filename in (f, f + '.gz'):
+                h = read_header(filename, 2)
+                expected = fits.getheader(f, 2)
+                for key in expected:
+                    if key not in ('COMMENT', 'HISTORY', ''):
+                        self.assertEqual(h[key], expected[key])
+                self.assertNotIn('COMMENT', h)
+                self.assertEqual(h['OBSERVER'], "O'Hara")
+                self.assertEqual(h['EXPTIME'], 1500.0)
+                self.assertIs(h['RAW'], True)
+                self.assertEqual(read_header(filename, 1)['EXTNAME'], 'IMAGE')
+                self.assertIs(read_header(filename)['SIMPLE'], True)
+                with fits.open(f) as hdulist:
+                    self.assertEqual(table_columns(h),
+                                     (hdulist[2].columns.names,
+                                      hdulist[2].columns.formats))
+                with self.assertRaises(IndexError):
+                    read_header(filename, 3)
+        self.assertEqual(table_columns({'NAXIS': 0}), ([], []))
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -0,0 +1,66 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.healpix.
+"""
+import unittest
+
+import numpy as np
+
+from ..healpix import nest_index, ring_index
+
+
+class TestHEALPix(unittest.TestCase):
+    """Test digestor.healpix.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        #
+        # Reference values computed with the HEALPix C++ library.
+        #
+        cls.ra = np.array([0.0, 45.0, 123.456, 210.0, 359.999, 180.0, 10.0, 300.0])
+        cls.dec = np.array([0.0, 41.8103148958, -30.5, 89.99, -89.99, 90.0, -45.0, 65.0])
+        cls.ring = {0: [4, 0, 9, 2, 11, 2, 8, 3],
+                    8: [391680, 129667, 592735, 2, 786431, 2, 670778, 37173],
+                    12: [100638720, 33531907, 151746034, 2, 201326591, 2, 171843498, 9429376]}
+        cls.nest = {0: [4, 0, 9, 2, 11, 2, 8, 3],
+                    8: [311296, 49152, 630779, 196607, 720896, 196607, 566118, 255513],
+                    12: [79691776, 12582912, 161479533, 50331647, 184549376, 50331647, 144926308, 65411552]}
+
+    def test_ring_index(self):
+        """Test RING scheme pixel numbers.
+        """
+        for order in self.ring:
+            self.assertListEqual(ring_index(order, self.ra, self.dec).tolist(),
+                                 self.ring[order])
+
+    def test_nest_index(self):
+        """Test NESTED scheme pixel numbers.
+        """
+        for order in self.nest:
+            self.assertListEqual(nest_index(order, self.ra, self.dec).tolist(),
+                                 self.nest[order])
+
+    def test_consistency(self):
+        """Test that both schemes assign the same number of points to each pixel.
+        """
+        rng = np.random.default_rng(42)
+        ra = rng.uniform(0, 360, 10000)
+        dec = np.degrees(np.arcsin(rng.uniform(-1, 1, 10000)))
+        ring = ring_index(4, ra, dec)
+        nest = nest_index(4, ra, dec)
+        self.assertTrue(((ring >= 0) & (ring < 12*16**2)).all())
+        self.assertListEqual(sorted(np.bincount(ring, minlength=12*16**2).tolist()),
+                             sorted(np.bincount(nest, minlength=12*16**2).tolist()))
+        self.assertListEqual(ring_index(4, ra - 360.0, dec).tolist(), ring.tolist())
+        with self.assertRaises(ValueError) as e:
+            ring_index(30, ra, dec)
+        self.assertEqual(str(e.exception), "HEALPix order must be in the range 0 to 29!")
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -0,0 +1,67 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.htm.
+"""
+import unittest
+
+import numpy as np
+
+from ..htm import _descend, htm_index
+
+
+class TestHTM(unittest.TestCase):
+    """Test digestor.htm.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        #
+        # Reference values computed with the JHU HTM library.  The points
+        # at (0, 0) and the north pole lie on the edges of root trixels,
+        # and follow the convention used by STILTS.
+        #
+        cls.ra = np.array([0.0, 45.0, 123.456, 210.0, 359.999, 180.0, 10.0, 300.0])
+        cls.dec = np.array([0.0, 41.8103148958, -30.5, 89.99, -89.99, 90.0, -45.0, 65.0])
+        cls.htm = {0: [15, 15, 9, 13, 11, 14, 8, 12],
+                   1: [62, 63, 39, 53, 45, 57, 35, 49],
+                   9: [4063232, 4185139, 2608835, 3473408, 2949120, 3735552, 2330424, 3273915],
+                   20: [17042430230528, 17553749233423, 10942249623985, 14568529128487,
+                        12369505816728, 15668040695808, 9774508608368, 13731797630178]}
+
+    def test_htm_index(self):
+        """Test HTM trixel IDs.
+        """
+        for level in self.htm:
+            self.assertListEqual(htm_index(level, self.ra, self.dec).tolist(),
+                                 self.htm[level])
+        self.assertEqual(htm_index(9, self.ra, self.dec).dtype, np.dtype(np.int64))
+        with self.assertRaises(ValueError) as e:
+            htm_index(31, self.ra, self.dec)
+        self.assertEqual(str(e.exception), "HTM level must be in the range 0 to 30!")
+
+    def test_edges(self):
+        """Test that points on trixel edges agree with the exact algorithm.
+        """
+        ra, dec = np.meshgrid(np.arange(0.0, 360.0, 11.25), np.arange(-90.0, 90.1, 5.625))
+        ra = np.radians(ra.ravel())
+        dec = np.radians(dec.ravel())
+        p = (np.cos(dec)*np.cos(ra), np.cos(dec)*np.sin(ra), np.sin(dec))
+        htmid, flag = _descend(9, p)
+        self.assertTrue(flag.any())
+        exact, _ = _descend(9, p, exact=True)
+        self.assertListEqual(htm_index(9, np.degrees(ra), np.degrees(dec)).tolist(),
+                             exact.tolist())
+        rng = np.random.default_rng(42)
+        ra = rng.uniform(0, 360, 10000)
+        dec = np.degrees(np.arcsin(rng.uniform(-1, 1, 10000)))
+        htmid = htm_index(6, ra, dec)
+        self.assertTrue(((htmid >= 8*4**6) & (htmid < 16*4**6)).all())
+        self.assertListEqual((htm_index(9, ra, dec) >> 6).tolist(), htmid.tolist())
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
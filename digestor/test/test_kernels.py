@@ -0,0 +1,84 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.kernels.
+"""
+import unittest
+
+import numpy as np
+
+from ..kernels import parse_integers, signed_view
+from .utils import DigestorCase
+
+
+class TestKernels(DigestorCase):
+    """Test digestor.kernels.
+    """
+
+    def test_signed_view(self):
+        """Test reinterpreting unsigned integers.
+        """
+        for dtype in ('<u8', '>u8', '>u4', 'u1'):
+            u = np.array([0, 1, np.iinfo(dtype).max], dtype=dtype)
+            s = signed_view(u)
+            self.assertEqual(s.dtype.kind, 'i')
+            self.assertEqual(s.dtype.itemsize, u.dtype.itemsize)
+            self.assertTrue(np.shares_memory(s, u))
+            self.assertListEqual(s.tolist(), [0, 1, -1])
+        u = np.array([0, 2**63, 2**64 - 1], dtype=np.uint64)
+        raw = (u - np.uint64(2**63)).view(np.int64).astype('>i8')
+        s = signed_view(raw, offset=True)
+        self.assertTrue(np.shares_memory(s, raw))
+        self.assertEqual(s.dtype, np.dtype('>i8'))
+        self.assertListEqual(s.tolist(), u.view(np.int64).tolist())
+
+    def test_parse_integers(self):
+        """Test parsing fixed-width integers.
+        """
+        data = np.array([b'  -12', b'     ', b'  1 2', b'   +7', b'    -',
+                         b'    x', b'99999', b'-   1', b'12   ', b' -3  ',
+                         b'\0\0\0\0\0'])
+        values, bad = parse_integers(data)
+        self.assertListEqual(bad.tolist(), [False, False, True, False, True,
+                                            True, False, True, False, False, False])
+        self.assertListEqual(values[~bad].tolist(), [-12, 0, 7, 99999, 12, -3, 0])
+        self.assertTrue((data == np.array([b'  -12', b'     ', b'  1 2', b'   +7', b'    -',
+                                           b'    x', b'99999', b'-   1', b'12   ', b' -3  ',
+                                           b''])).all())
+
+    def test_parse_integers_64(self):
+        """Test parsing integers near the 64-bit limits.
+        """
+        data = np.array([b'-9223372036854775808', b' 9223372036854775807',
+                         b' 9223372036854775808', b'18446744073709551615',
+                         b'18446744073709551616', b'-9223372036854775809'])
+        values, bad = parse_integers(data)
+        self.assertListEqual(bad.tolist(), [False, False, False, False, True, True])
+        self.assertListEqual(values[:4].tolist(), [-2**63, 2**63 - 1, -2**63, -1])
+        values, bad = parse_integers(data, wrap=False)
+        self.assertListEqual(bad.tolist(), [False, False, True, True, True, True])
+        values, bad = parse_integers(np.array([b'0000000000000000000000000012',
+                                               b'1000000000000000000000000012']))
+        self.assertListEqual(bad.tolist(), [False, True])
+        self.assertEqual(values[0], 12)
+
+    def test_parse_integers_unicode(self):
+        """Test parsing unicode and masked strings.
+        """
+        values, bad = parse_integers(np.array(['  é1', ' 001', '    ']))
+        self.assertListEqual(bad.tolist(), [True, False, False])
+        self.assertListEqual(values[1:].tolist(), [1, 0])
+        values, bad = parse_integers(np.ma.MaskedArray([b'12', b'xx'], mask=[False, True]))
+        self.assertListEqual(bad.tolist(), [False, False])
+        self.assertListEqual(values.tolist(), [12, 0])
+        n = 20000
+        values, bad = parse_integers(np.char.rjust(np.arange(n).astype('S8'), 8))
+        self.assertFalse(bad.any())
+        self.assertTrue((values == np.arange(n)).all())
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
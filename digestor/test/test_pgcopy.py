@@ -0,0 +1,130 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.pgcopy.
+"""
+import os
+import struct
+import unittest
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from astropy.table import Table
+
+from ..pgcopy import (PGCOPY_HEADER, PGCOPY_TRAILER, PGCopyWriter, _field,
+                      concatenate, records)
+from ..stream import FITSBlockWriter, read_blocks
+from .utils import DigestorCase
+
+
+def parse(data):
+    """Split the body of a binary COPY file into rows of raw fields.
+    """
+    rows = list()
+    i = 0
+    while i < len(data):
+        n, = struct.unpack('>h', data[i:i+2])
+        i += 2
+        row = list()
+        for k in range(n):
+            length, = struct.unpack('>i', data[i:i+4])
+            i += 4
+            row.append(data[i:i+length])
+            i += length
+        rows.append(row)
+    return rows
+
+
+class TestPGCopy(DigestorCase):
+    """Test digestor.pgcopy.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.data = Table()
+        self.data['id'] = np.arange(4, dtype=np.int64) - 1
+        self.data['mag'] = np.arange(4, dtype=np.float32) + 0.5
+        self.data['name'] = np.array([b'ab  ', b'    ', b'abcd', b'a b '])
+        self.data['ok'] = np.arange(4) % 2 == 0
+        self.data['n'] = np.arange(4, dtype=np.int16)
+        self.types = {'id': 'bigint', 'mag': 'real', 'name': 'character',
+                      'ok': 'boolean', 'n': 'smallint'}
+
+    def test_records(self):
+        """Test conversion of a table to binary rows.
+        """
+        rows = parse(records(self.data, self.types))
+        self.assertEqual(len(rows), 4)
+        self.assertListEqual([len(r) for r in rows], [5]*4)
+        self.assertEqual(struct.unpack('>q', rows[0][0])[0], -1)
+        self.assertEqual(struct.unpack('>f', rows[2][1])[0], 2.5)
+        self.assertListEqual([r[2] for r in rows], [b'ab', b'', b'abcd', b'a b'])
+        self.assertListEqual([r[3] for r in rows], [b'\x01', b'\x00', b'\x01', b'\x00'])
+        self.assertEqual(struct.unpack('>h', rows[3][4])[0], 3)
+        rows = parse(records(self.data[['id', 'n']], self.types))
+        self.assertListEqual([len(r[0]) + len(r[1]) for r in rows], [10]*4)
+
+    def test_records_unicode(self):
+        """Test conversion of unicode and masked columns.
+        """
+        t = Table()
+        t['name'] = np.array(['é ', 'x'])
+        t['id'] = np.ma.MaskedArray([1, 2], mask=[False, True], fill_value=-9999)
+        rows = parse(records(t, {'name': 'character', 'id': 'integer'}))
+        self.assertEqual(rows[0][0].decode('utf-8'), 'é')
+        self.assertEqual(rows[1][0], b'x')
+        self.assertEqual(struct.unpack('>i', rows[1][1])[0], -9999)
+
+    def test_passthrough(self):
+        """Test that big-endian FITS columns are not converted.
+        """
+        with TemporaryDirectory() as d:
+            f = os.path.join(d, 'foo.fits')
+            with FITSBlockWriter(f, len(self.data)) as w:
+                w.write(self.data)
+            old = next(read_blocks(f))
+            value, nchar = _field(old['id'], 'bigint')
+            self.assertIsNone(nchar)
+            self.assertTrue(np.shares_memory(value, old['id']))
+            self.assertEqual(value[3].tobytes(), np.array([2], dtype='>i8').tobytes())
+            value, nchar = _field(old['n'], 'integer')
+            self.assertFalse(np.shares_memory(value, old['n']))
+            self.assertEqual(records(old, self.types), records(self.data, self.types))
+            del old, value
+
+    def test_writer(self):
+        """Test writing a file in blocks, and combining files.
+        """
+        with TemporaryDirectory() as d:
+            f = os.path.join(d, 'foo.pgcopy')
+            with PGCopyWriter(f, self.types) as w:
+                w.write(self.data[:3])
+                w.write(self.data[3:])
+            self.assertEqual(w.written, 4)
+            with open(f, 'rb') as b:
+                data = b.read()
+            self.assertEqual(data[:len(PGCOPY_HEADER)], PGCOPY_HEADER)
+            self.assertEqual(data[-2:], PGCOPY_TRAILER)
+            self.assertEqual(data[len(PGCOPY_HEADER):-2],
+                             records(self.data, self.types))
+            parts = [os.path.join(d, 'foo.{0:d}.pgcopy'.format(k)) for k in range(2)]
+            with PGCopyWriter(parts[0], self.types) as w:
+                w.write(self.data[:1])
+            with PGCopyWriter(parts[1], self.types) as w:
+                w.write(self.data[1:])
+            g = os.path.join(d, 'bar.pgcopy')
+            concatenate(parts, g)
+            with open(g, 'rb') as b:
+                self.assertEqual(b.read(), data)
+            self.assertFalse(any([os.path.exists(p) for p in parts]))
+            with self.assertRaises(KeyError):
+                with PGCopyWriter(f, {'id': 'bigint'}) as w:
+                    w.write(self.data)
+            self.assertFalse(os.path.exists(f))
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -0,0 +1,80 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.report.
+"""
+import json
+import logging
+import os
+import unittest
+import unittest.mock as mock
+from tempfile import TemporaryDirectory
+
+from ..report import RunReport, peak_rss
+from .utils import DigestorCase
+
+
+class TestReport(DigestorCase):
+    """Test digestor.report.
+    """
+
+    def test_stage(self):
+        """Test measuring stages.
+        """
+        report = RunReport(log=logging.getLogger('digestor.test'),
+                           info={'table': 'foo'})
+        with TemporaryDirectory() as d:
+            f = os.path.join(d, 'foo.dat')
+            with report.stage('write') as record:
+                with open(f, 'wb') as o:
+                    o.write(b'\x00' * 100000)
+                record['output'] = f
+            with report.stage('read'):
+                with open(f, 'rb') as i:
+                    data = i.read()
+            self.assertEqual(len(data), 100000)
+            with self.assertRaises(KeyError):
+                with report.stage('fail'):
+                    raise KeyError('foo')
+            report.status = 1
+            r = os.path.join(d, 'foo.report.json')
+            report.write(r)
+            with open(r) as j:
+                summary = json.load(j)
+        self.assertListEqual([s['stage'] for s in summary['stages']],
+                             ['write', 'read', 'fail'])
+        self.assertEqual(summary['stages'][0]['output'], f)
+        self.assertEqual(summary['stages'][2]['error'], 'KeyError')
+        self.assertNotIn('error', summary['stages'][0])
+        self.assertEqual(summary['status'], 1)
+        self.assertEqual(summary['table'], 'foo')
+        for s in summary['stages']:
+            self.assertGreaterEqual(s['wall'], 0.0)
+            self.assertGreaterEqual(s['cpu'], 0.0)
+        if summary['stages'][0]['bytes_written'] is not None:
+            self.assertGreaterEqual(summary['stages'][0]['bytes_written'], 100000)
+            self.assertGreaterEqual(summary['stages'][1]['bytes_read'], 100000)
+        self.assertGreater(summary['peak_rss'], 0)
+        self.assertLog(-1, 'Stage fail: {0:.3f} s wall, {1:.3f} s CPU, peak RSS {2:.1f} MiB.'.format(
+            summary['stages'][2]['wall'], summary['stages'][2]['cpu'],
+            summary['stages'][2]['peak_rss']/2**20))
+
+    def test_no_proc(self):
+        """Test measurements without the /proc filesystem.
+        """
+        report = RunReport()
+        with mock.patch('builtins.open') as o:
+            o.side_effect = OSError
+            self.assertGreater(peak_rss(), 0)
+            with report.stage('foo'):
+                pass
+        self.assertIsNone(report.stages[0]['bytes_read'])
+        self.assertFalse(report.stages[0]['peak_rss_stage'])
+        self.assertGreater(report.stages[0]['peak_rss'], 0)
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
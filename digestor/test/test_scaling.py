@@ -0,0 +1,84 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.scaling.
+"""
+import json
+import os
+import sys
+import unittest
+import unittest.mock as mock
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+import numpy as np
+
+from ..scaling import MemorySampler, _budget, fit, main, run_scaling
+from .utils import DigestorCase
+
+
+class TestScaling(DigestorCase):
+    """Test digestor.scaling.
+    """
+
+    def test_fit(self):
+        """Test fitting memory use.
+        """
+        measurements = [{'rows': n, 'tracemalloc': 1000 + 8*n, 'peak_anon': None}
+                        for n in (100, 1000, 10000)]
+        slope, intercept = fit(measurements, 'tracemalloc')
+        self.assertAlmostEqual(slope, 8.0)
+        self.assertAlmostEqual(intercept, 1000.0, places=3)
+        self.assertEqual(fit(measurements, 'peak_anon'), (None, None))
+        with self.assertRaises(ValueError):
+            fit(measurements[:1]*2, 'tracemalloc')
+        with self.assertRaises(ValueError):
+            run_scaling([100, 100])
+        with self.assertRaises(ValueError):
+            run_scaling([100, 1000], ['foo'])
+        self.assertEqual(_budget('processFITS=100'), ('processFITS', 100))
+        with self.assertRaises(ValueError):
+            _budget('foo=100')
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'Requires /proc.')
+    def test_sampler(self):
+        """Test sampling memory in the background.
+        """
+        sampler = MemorySampler(interval=0.001, children=True)
+        before = sampler.sample()
+        sampler.start()
+        data = np.ones((2**22,), dtype=np.float64)
+        sampler.stop()
+        self.assertGreater(sampler.peak - before, data.nbytes//2)
+
+    def test_main(self):
+        """Test checking memory use against budgets.
+        """
+        with TemporaryDirectory() as d:
+            out = os.path.join(d, 'scaling.json')
+            with mock.patch('sys.stdout', new_callable=StringIO) as o:
+                status = main(['-n', '2000', '-n', '8000', '-b', '1000', '-d', d,
+                               '-V', 'processFITS', '-V', 'processFITS_blocks',
+                               '-B', 'processFITS=100', '-o', out])
+            with open(out) as f:
+                results = json.load(f)
+        self.assertEqual(status, 1)
+        self.assertIn('FAIL', o.getvalue())
+        self.assertListEqual(list(results.keys()), ['processFITS', 'processFITS_blocks'])
+        self.assertEqual(results['processFITS']['budget'], 100)
+        self.assertListEqual([m['rows'] for m in results['processFITS']['measurements']],
+                             [2000, 8000])
+        #
+        # Only the whole-table conversion grows with the number of rows.
+        #
+        self.assertGreater(results['processFITS']['tracemalloc']['slope'], 100)
+        self.assertFalse(results['processFITS']['tracemalloc']['ok'])
+        self.assertLess(results['processFITS_blocks']['tracemalloc']['slope'], 16)
+        self.assertTrue(results['processFITS_blocks']['tracemalloc']['ok'])
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -2,14 +2,18 @@
 # -*- coding: utf-8 -*-
 """Test digestor.sdss.
 """
+import json
+import logging
 import os
 import unittest
 import unittest.mock as mock
 from tempfile import NamedTemporaryFile, TemporaryDirectory
 
 import numpy as np
+from astropy.table import Table
 
-from ..sdss import SDSS, get_options
+from ..sdss import SDSS, get_options, main
+from ..stream import FITSBlockWriter
 from .utils import DigestorCase
 
 
@@ -23,8 +27,12 @@ class TestSDSS(DigestorCase):
         self.table = 'spectra'
         self.stable = "{0.schema}.{0.table}".format(self)
         self.description = 'sdss spectra'
+        #
+        # Most tests exercise the STILTS-based pixel columns.
+        #
         self.sdss = SDSS(self.schema, self.table,
-                         description=self.description)
+                         description=self.description,
+                         native=False)
 
     def test_get_options(self):
         """Test command-line arguments.
@@ -39,6 +47,16 @@ class TestSDSS(DigestorCase):
         self.assertIsNone(self.options.output_sql)
         self.assertIsNone(self.options.output_json)
         self.assertIsNone(self.options.merge_json)
+        self.assertTrue(self.options.native)
+        self.assertEqual(self.options.threads, 1)
+        self.assertEqual(self.options.processes, 1)
+        self.assertFalse(self.options.shards)
+        self.assertEqual(self.options.output, 'fits')
+        self.assertFalse(self.options.plan)
+        self.assertFalse(self.options.metadata)
+        with mock.patch('sys.stderr'):
+            with self.assertRaises(SystemExit):
+                get_options(['-M', '--plan', 'specObj-dr14.fits', 'specobjall.sql'])
 
     def test_sdss_joinid(self):
         """Test sdss_joinid option.
@@ -49,6 +67,49 @@ class TestSDSS(DigestorCase):
         self.assertTrue(s.join)
         self.assertEqual(s.tapSchema['columns'][-1]['column_name'], 'sdss_joinid')
 
+    def test_derive_columns(self):
+        """Test computing sdss_joinid in-process.
+        """
+        joinid = SDSS._native_stilts.copy().popitem()[0]
+        s = SDSS(self.schema, self.table, description=self.description,
+                 pixels=False, ecliptic=False, galactic=False, join=True)
+        self.assertListEqual(s.nativeColumns, [])
+        s._custom_stilts_command = ['cmd=select skyversion==2', joinid]
+        self.assertListEqual(s.nativeColumns, ['sdss_joinid'])
+        old = Table()
+        old['PLATE'] = np.array([266, 8000], dtype=np.int16)
+        old['MJD'] = np.array([51602, 59000], dtype=np.int32)
+        old['FIBERID'] = np.array([1, 1000], dtype=np.int16)
+        derived = s.deriveColumns(old)
+        self.assertListEqual(derived['sdss_joinid'].tolist(),
+                             [(266 << 50) | (1 << 38) | (1602 << 24),
+                              (8000 << 50) | (1000 << 38) | (9000 << 24)])
+        with mock.patch('subprocess.Popen') as proc:
+            p = proc.return_value = mock.MagicMock()
+            p.returncode = 0
+            p.communicate.return_value = (b'', b'')
+            with mock.patch('os.path.exists') as e:
+                e.return_value = False
+                s.addDLColumns('specObj-dr14.fits')
+            proc.assert_called_with(['stilts', 'tpipe',
+                                     'in=specObj-dr14.fits',
+                                     'cmd=select skyversion==2',
+                                     'ofmt=fits-basic',
+                                     'out=specObj-dr14.stilts.fits'],
+                                    stderr=-1, stdout=-1)
+        s.FITS = {'PLATE': 'I', 'MJD': 'J', 'FIBERID': 'I', 'Z': 'E',
+                  'FLAGS': '5J', 'FLAGS2': '5J', 'OBJC_FLAGS': 'J', 'OBJC_FLAGS2': 'J'}
+        s.tapSchema['columns'] += [s.tapColumn('sdss_joinid', datatype='bigint'),
+                                   s.tapColumn('flags_u', datatype='bigint')]
+        s.mapping = {'sdss_joinid': 'SDSS_JOINID', 'flags_u': 'FLAGS[0]'}
+        self.assertListEqual(s.inputColumns, ['PLATE', 'MJD', 'FIBERID', 'FLAGS', 'FLAGS2'])
+        del old['MJD']
+        with self.assertRaises(KeyError) as e:
+            s.deriveColumns(old)
+        self.assertEqual(e.exception.args[0], 'Could not find a FITS column corresponding to mjd!')
+        s.native = False
+        self.assertNotIn('sdss_joinid', s.deriveColumns(old))
+
     def test_parse_sql(self):
         """Test parsing a whole SQL file.
         """
@@ -62,6 +123,82 @@ class TestSDSS(DigestorCase):
             f.seek(0)
             self.sdss.parseSQL(f.name)
 
+    def test_parse_schema(self):
+        """Test parsing several tables from several SQL files.
+        """
+        sql = [r"""-- Schema dump
+CREATE TABLE [dbo].[PhotoObjAll] (
+--/H Photometric objects.
+--/T Long description.
+  objID bigint NOT NULL, --/D Object ID --/K ID_MAIN
+  htmID bigint NOT NULL, --/D HTM ID
+  flags_u bigint NOT NULL, --/D Flags
+  createdDate bigint NOT NULL, --/D Creation date
+)
+GO
+CREATE VIEW PhotoPrimary
+--/H Primary photometric objects.
+AS SELECT * FROM PhotoObjAll
+WHERE mode = 1 -- primary only
+GO
+CREATE FUNCTION fGetNearbyObj(@ra float, @dec float,
+  @r float, --/D radius
+)
+GO
+CREATE TABLE SpecObjAll (
+--/H Spectra.
+  specObjID numeric(20) NOT NULL, --/D Spectrum ID --/F specobjid
+  class varchar(32) NOT NULL, --/D Class
+)
+""", r"""CREATE TABLE sdss_dr16.zooSpec (
+--/H Galaxy Zoo.
+  specObjID bigint NOT NULL, --/D Spectrum ID
+  p_el real NOT NULL, --/D Probability --/F NOFITS
+);
+"""]
+        with TemporaryDirectory() as d:
+            filenames = list()
+            for k, s in enumerate(sql):
+                filenames.append(os.path.join(d, 'schema{0:d}.sql'.format(k)))
+                with open(filenames[-1], 'w') as f:
+                    f.write(s)
+            tables = self.sdss.parseSchema(filenames)
+            one = self.sdss.parseSchema(filenames[1:])
+            self.assertLog(-1, 'Parsed 1 tables.')
+            self.assertEqual(self.sdss.parseSchema(filenames), tables)
+            self.assertLog(-1, 'Using cached definitions of 3 tables from {0}.'.format(', '.join(filenames)))
+            self.assertEqual(self.sdss.parseSchema(filenames, cache=False), tables)
+            self.assertLog(-1, 'Parsed 3 tables.')
+        self.assertListEqual(list(tables.keys()), ['photoobjall', 'specobjall', 'zoospec'])
+        self.assertEqual(json.loads(json.dumps(tables)), tables)
+        self.assertEqual(tables['photoobjall']['description'], 'Photometric objects.')
+        self.assertListEqual([c['column_name'] for c in tables['photoobjall']['columns']],
+                             ['objid', 'flags_u', 'createddate'])
+        self.assertDictEqual(tables['photoobjall']['mapping'], {'flags_u': 'FLAGS[0]'})
+        self.assertEqual(tables['specobjall']['columns'][1]['datatype'], 'character')
+        self.assertEqual(tables['specobjall']['columns'][1]['size'], 32)
+        self.assertDictEqual(tables['specobjall']['mapping'], {'specobjid': 'SPECOBJID'})
+        self.assertDictEqual(tables['zoospec']['mapping'], {})
+        sdss = SDSS(self.schema, 'specObjAll', description=self.description,
+                    pixels=False, random=False, ecliptic=False, galactic=False)
+        sdss.loadSchema(tables)
+        self.assertListEqual(sdss.colNames, ['specobjid', 'class'])
+        self.assertEqual(sdss.tapSchema['tables'][0]['description'], 'Spectra.')
+        self.assertDictEqual(sdss.mapping, {'specobjid': 'SPECOBJID'})
+        with self.assertRaises(KeyError) as e:
+            sdss.loadSchema(one, 'photoobjall')
+        self.assertEqual(e.exception.args[0], 'Could not find a SQL definition of photoobjall!')
+        with self.assertRaises(KeyError) as e:
+            sdss.loadSchema(tables, 'foo')
+        self.assertEqual(e.exception.args[0], 'Could not find a SQL definition of foo!')
+        sdss.loadSchema(one)
+        self.assertListEqual(sdss.colNames, ['specobjid', 'class', 'specobjid', 'p_el'])
+        unnamed = {'': {'description': '',
+                        'columns': [sdss.tapColumn('foo', datatype='real')],
+                        'mapping': dict()}}
+        sdss.loadSchema(unnamed, 'photoobjall')
+        self.assertEqual(sdss.colNames[-1], 'foo')
+
     def test_parse_line(self):
         """Test parsing single SQL lines.
         """
@@ -217,6 +354,28 @@ class TestSDSS(DigestorCase):
         self.assertDictEqual(self.sdss.mapping, final_mapping)
         self.assertLog(-1, 'FITS column FOOBAR will be dropped from SQL!')
 
+    def test_fits_lookup(self):
+        """Test matching FITS column names.
+        """
+        self.sdss.FITS = {'A_B': 'D', 'ab': 'D', 'a_b': 'D', 'MAG': '5E', 'MAG_IVAR': '5E'}
+        lookup = self.sdss.fitsLookup()
+        self.assertListEqual(lookup['ab'], ['A_B', 'ab', 'a_b'])
+        self.assertListEqual(lookup['a_b'], ['A_B', 'a_b'])
+        self.assertListEqual(lookup['magivar'], ['MAG_IVAR'])
+        sdss = SDSS(self.schema, self.table, description=self.description,
+                    pixels=False, random=False, ecliptic=False, galactic=False)
+        sdss.tapSchema['columns'] += [sdss.tapColumn(c, datatype='double')
+                                      for c in ('ab', 'x', 'magivar_g')]
+        sdss.FITS = self.sdss.FITS
+        sdss.mapping = {'x': 'A_B', 'magivar_g': 'MAGIVAR[1]'}
+        sdss.mapColumns()
+        self.assertDictEqual(sdss.mapping, {'ab': 'A_B', 'x': 'A_B',
+                                            'magivar_g': 'MAG_IVAR[1]'})
+        self.assertLog(-2, 'FITS column MAG will be dropped from SQL!')
+        sdss.mapping = {'x': 'AB[2]', 'magivar_g': 'MAG_IVAR[1]'}
+        sdss.mapColumns()
+        self.assertEqual(sdss.mapping['x'], 'a_b[2]')
+
     def test_map_columns_no_random(self):
         """Test turning off random column.
         """
@@ -646,8 +805,9 @@ class TestSDSS(DigestorCase):
         #
         # Raise an unsafe error.
         #
-        with mock.patch('digestor.sdss.Table') as T:
-            t = T.read.return_value = mock.MagicMock()
+        with mock.patch('digestor.stream.read_blocks') as R, mock.patch('astropy.table.Table'):
+            t = mock.MagicMock()
+            R.return_value = iter([t])
             t.__getitem__.side_effect = lambda key: dummy_values[key.lower()]
             t.colnames = [k.upper() for k in dummy_values.keys()]
             with self.assertRaises(ValueError) as e:
@@ -661,8 +821,9 @@ class TestSDSS(DigestorCase):
         #
         # Try again.
         #
-        with mock.patch('digestor.sdss.Table') as T:
-            t = T.read.return_value = mock.MagicMock()
+        with mock.patch('digestor.stream.read_blocks') as R, mock.patch('astropy.table.Table'):
+            t = mock.MagicMock()
+            R.return_value = iter([t])
             t.__getitem__.side_effect = lambda key: dummy_values[key.lower()]
             t.colnames = [k.upper() for k in dummy_values.keys()]
             with self.assertRaises(ValueError) as e:
@@ -675,23 +836,30 @@ class TestSDSS(DigestorCase):
         #
         # Try again.
         #
-        with mock.patch('digestor.sdss.Table') as T:
-            t = T.read.return_value = mock.MagicMock()
+        with mock.patch('digestor.stream.read_blocks') as R, mock.patch('astropy.table.Table'):
+            t = mock.MagicMock()
+            R.return_value = iter([t])
             t.__getitem__.side_effect = lambda key: dummy_values[key.lower()]
             t.colnames = [k.upper() for k in dummy_values.keys()]
             out = self.sdss.processFITS()
         self.assertEqual(out, '{0.schema}.{0.table}.fits'.format(self))
+        root_logger = logging.getLogger('digestor')
+        seeds = [r for r in root_logger.handlers[0].buffer
+                 if r.name == 'digestor.sdss.SDSS.prepareConversion']
+        self.assertGreater(len(seeds), 0)
+        self.assertTrue(seeds[-1].getMessage().startswith('np.random.seed('))
         #
         # Check overwrite
         #
-        with mock.patch('os.path.exists') as ex:
-            ex.return_value = True
+        with mock.patch('digestor.base.is_current') as c:
+            c.return_value = True
             out = self.sdss.processFITS()
-            ex.assert_called_with(out)
+            c.assert_called_with([out], self.sdss.outputKey(1, [out]))
         with mock.patch('os.path.exists') as ex:
             with mock.patch('os.remove') as rm:
-                with mock.patch('digestor.sdss.Table') as T:
-                    t = T.read.return_value = mock.MagicMock()
+                with mock.patch('digestor.stream.read_blocks') as R, mock.patch('astropy.table.Table'):
+                    t = mock.MagicMock()
+                    R.return_value = iter([t])
                     t.__getitem__.side_effect = lambda key: dummy_values[key.lower()]
                     t.colnames = [k.upper() for k in dummy_values.keys()]
                     ex.return_value = True
@@ -699,6 +867,268 @@ class TestSDSS(DigestorCase):
             rm.assert_called_with(out)
             ex.assert_called_with(out)
 
+    def test_process_fits_blocks(self):
+        """Test processing of SDSS-specific FITS file in blocks.
+        """
+        s = SDSS(self.schema, self.table, description=self.description,
+                 pixels=False, ecliptic=False, galactic=False, threads=2,
+                 metrics=True)
+        s.tapSchema['columns'] += [s.tapColumn('objid', datatype='bigint'),
+                                   s.tapColumn('mag_u', datatype='real'),
+                                   s.tapColumn('z', datatype='double'),
+                                   s.tapColumn('flags_u', datatype='bigint')]
+        s.mapping = {'mag_u': 'MAG[0]', 'flags_u': 'FLAGS[0]'}
+        z = np.arange(5, dtype=np.float32)
+        z[3] = np.nan
+        #
+        # Blank strings are padded with spaces, as written by STILTS.
+        #
+        data = Table()
+        data['OBJID'] = np.array([b' '*19 + b'1', b' '*20, b'18446744073709551615',
+                                  b'9223372036854775807', b' '*19 + b'2'])
+        data['MAG'] = np.arange(10, dtype=np.float32).reshape(5, 2)
+        data['Z'] = z
+        data['FLAGS'] = np.ones((5, 5), dtype=np.int32)
+        data['FLAGS2'] = np.ones((5, 5), dtype=np.int32)
+        cwd = os.getcwd()
+        with TemporaryDirectory() as d:
+            os.chdir(d)
+            try:
+                with FITSBlockWriter('foo.fits', len(data)) as w:
+                    w.write(data)
+                s.parseFITS('foo.fits')
+                s.mapColumns()
+                s.sortColumns()
+                out = s.processFITS(blocksize=2)
+                self.assertEqual(out, '{0.schema}.{0.table}.fits'.format(self))
+                t = Table.read(out)
+            finally:
+                os.chdir(cwd)
+        self.assertListEqual([(st['column'], st['kernel'], st['sentinel']) for st in s.plan],
+                             [('objid', 'parse', None), ('flags_u', 'flags', None),
+                              ('z', 'widen', -9999.0), ('random_id', 'random', None),
+                              ('mag_u', 'passthrough', -9999.0)])
+        self.assertEqual(s.plan[1]['source'], 'FLAGS')
+        self.assertEqual(s.plan[4]['index'], 0)
+        self.assertListEqual(t.colnames, ['objid', 'flags_u', 'z', 'random_id', 'mag_u'])
+        self.assertListEqual(t['objid'].tolist(), [1, 0, -1, 2**63 - 1, 2])
+        self.assertListEqual(t['z'].tolist(), [0.0, 1.0, 2.0, -9999.0, 4.0])
+        self.assertListEqual(t['mag_u'].tolist(), [0.0, 2.0, 4.0, 6.0, 8.0])
+        self.assertListEqual(t['flags_u'].tolist(), [2**32 + 1]*5)
+        self.assertEqual(t['random_id'].dtype.kind, 'f')
+        self.assertEqual(len(np.unique(t['random_id'])), 5)
+        root_logger = logging.getLogger('digestor')
+        workers = [r.getMessage() for r in root_logger.handlers[0].buffer
+                   if r.name == 'digestor.base.Digestor.convertColumns']
+        self.assertGreater(len(workers), 0)
+        self.assertRegex(workers[-1], r'^convert_\d converted \d columns in ')
+        metrics = s.metricsTable()
+        self.assertEqual(len(metrics), 5)
+        self.assertGreaterEqual(metrics[0]['time'], metrics[-1]['time'])
+        self.assertListEqual([(s.columnMetrics[c]['kernel'], s.columnMetrics[c]['rows'],
+                               s.columnMetrics[c]['bytes_in'], s.columnMetrics[c]['bytes_out'],
+                               s.columnMetrics[c]['sentinels'])
+                              for c in t.colnames],
+                             [('parse', 5, 100, 40, 0),
+                              ('flags', 5, 40, 40, 0),
+                              ('widen', 5, 20, 40, 1),
+                              ('random', 5, 0, 20, 0),
+                              ('passthrough', 5, 20, 20, 0)])
+
+    def test_process_fits_invalid(self):
+        """Test reporting of rows that cannot be converted.
+        """
+        s = SDSS(self.schema, self.table, description=self.description,
+                 pixels=False, ecliptic=False, galactic=False, random=False)
+        s.tapSchema['columns'] += [s.tapColumn('objid', datatype='integer')]
+        data = Table()
+        data['OBJID'] = np.array([b'  1', b'  x', b'  3', b'-12', b' 1 '])
+        data['Z'] = np.arange(5, dtype=np.float32)
+        cwd = os.getcwd()
+        with TemporaryDirectory() as d:
+            os.chdir(d)
+            try:
+                with FITSBlockWriter('foo.fits', len(data)) as w:
+                    w.write(data)
+                s.parseFITS('foo.fits')
+                s.mapColumns()
+                with self.assertRaises(ValueError) as e:
+                    s.processFITS()
+            finally:
+                os.chdir(cwd)
+        self.assertEqual(e.exception.args[0],
+                         'Values too large for safe data type conversion for OBJID (A) -> objid (integer)!')
+        self.assertLog(-2, 'Invalid or out-of-range values for OBJID in 1 rows, including 1.')
+
+    def test_process_fits_parallel(self):
+        """Test processing of SDSS-specific FITS file in several processes.
+        """
+        s = SDSS(self.schema, self.table, description=self.description,
+                 pixels=False, ecliptic=False, galactic=False, metrics=True)
+        s.tapSchema['columns'] += [s.tapColumn('objid', datatype='bigint'),
+                                   s.tapColumn('z', datatype='double')]
+        data = Table()
+        data['OBJID'] = np.array([' {0:2d}'.format(k).encode() for k in range(11)])
+        data['Z'] = np.arange(11, dtype=np.float32)
+        cwd = os.getcwd()
+        with TemporaryDirectory() as d:
+            os.chdir(d)
+            try:
+                with FITSBlockWriter('foo.fits', len(data)) as w:
+                    w.write(data)
+                s.parseFITS('foo.fits')
+                s.mapColumns()
+                s.sortColumns()
+                out = s.processFITS(blocksize=2, processes=3)
+                self.assertEqual(out, '{0.schema}.{0.table}.fits'.format(self))
+                self.assertIn('Estimated size of 11 rows: {0:d} bytes'.format(os.path.getsize(out)),
+                              s.formatPlan(11))
+                t = Table.read(out)
+                self.assertEqual(s.columnMetrics['objid']['rows'], 11)
+                self.assertEqual(s.columnMetrics['z']['bytes_out'], 88)
+                shards = s.processFITS(processes=3, shards=True)
+                self.assertListEqual(shards, ['{0.schema}.{0.table}.{1:03d}.fits'.format(self, k)
+                                              for k in range(3)])
+                parts = [Table.read(f) for f in shards]
+                self.assertEqual(s.processFITS(processes=3, shards=True), shards)
+                self.assertLog(-1, 'Using existing file: {0}.'.format(shards[-1]))
+                #
+                # A changed input file invalidates the existing files.
+                #
+                os.utime('foo.fits', ns=(0, 0))
+                self.assertEqual(s.processFITS(processes=3, shards=True), shards)
+                self.assertTrue(all([os.path.exists(f + '.stage.json') for f in shards]))
+                self.assertLog(-1, 'Rows 7 to 11 written to {0}.'.format(shards[-1]))
+            finally:
+                os.chdir(cwd)
+        self.assertListEqual(t.colnames, ['objid', 'z', 'random_id'])
+        self.assertListEqual(t['objid'].tolist(), list(range(11)))
+        self.assertListEqual(t['z'].tolist(), list(range(11)))
+        self.assertEqual(len(np.unique(t['random_id'])), 11)
+        self.assertListEqual([len(p) for p in parts], [3, 4, 4])
+        self.assertListEqual(parts[2]['objid'].tolist(), [7, 8, 9, 10])
+
+    def test_process_fits_pgcopy(self):
+        """Test processing of SDSS-specific FITS file into binary COPY format.
+        """
+        s = SDSS(self.schema, self.table, description=self.description,
+                 pixels=False, ecliptic=False, galactic=False, random=False)
+        s.tapSchema['columns'] += [s.tapColumn('objid', datatype='bigint'),
+                                   s.tapColumn('z', datatype='double')]
+        data = Table()
+        data['OBJID'] = np.array([' {0:2d}'.format(k).encode() for k in range(11)])
+        data['Z'] = np.arange(11, dtype=np.float32)
+        data['SPECOBJID'] = np.arange(11, dtype=np.uint64) + np.uint64(2**64 - 11)
+        s.tapSchema['columns'].append(s.tapColumn('specobjid', datatype='bigint'))
+        cwd = os.getcwd()
+        with TemporaryDirectory() as d:
+            os.chdir(d)
+            try:
+                data.write('foo.fits')
+                s.parseFITS('foo.fits')
+                s.mapColumns()
+                s.sortColumns()
+                fitsout = s.processFITS()
+                t = Table.read(fitsout)
+                os.remove(fitsout)
+                os.remove(fitsout + '.stage.json')
+                out = s.processFITS(output='pgcopy')
+                self.assertEqual(out, '{0.schema}.{0.table}.pgcopy'.format(self))
+                with open(out, 'rb') as f:
+                    single = f.read()
+                os.remove(out)
+                s.processFITS(blocksize=4, output='pgcopy')
+                with open(out, 'rb') as f:
+                    blocks = f.read()
+                os.remove(out)
+                s.processFITS(blocksize=2, processes=3, output='pgcopy')
+                with open(out, 'rb') as f:
+                    parallel = f.read()
+                self.assertListEqual(sorted(os.listdir(d)),
+                                     ['foo.fits', out, out + '.stage.json'])
+                with self.assertRaises(ValueError):
+                    s.processFITS(output='csv')
+            finally:
+                os.chdir(cwd)
+        self.assertEqual(blocks, single)
+        self.assertEqual(parallel, single)
+        self.assertEqual(len(single), 19 + 11*(2 + 12 + 12 + 12) + 2)
+        self.assertEqual(single[19 + 38*10 + 6:][:8],
+                         np.array([10], dtype='>i8').tobytes())
+        self.assertEqual(single[19 + 38*10 + 18:][:8],
+                         np.array([-1], dtype='>i8').tobytes())
+        self.assertEqual(t['specobjid'].dtype, np.dtype('>i8'))
+        self.assertListEqual(t['specobjid'].tolist(), list(range(-11, 0)))
+        plan = s.formatPlan(11, 'pgcopy').split('\n')
+        self.assertEqual(plan[1].split(), ['objid', 'OBJID', 'parse', '<i8'])
+        self.assertEqual(plan[2].split(), ['specobjid', 'SPECOBJID', 'passthrough', '<i8'])
+        self.assertEqual(plan[3].split(), ['z', 'Z', 'widen', '<f8'])
+        self.assertEqual(plan[4], 'Estimated size of 11 rows: {0:d} bytes (0.0 MiB).'.format(len(single)))
+        self.assertEqual(s.copySQL(),
+                         'COPY {0.schema}.{0.table} (objid, specobjid, z) FROM STDIN WITH (FORMAT binary);\n'.format(self))
+
+    def test_main_metadata(self):
+        """Test writing metadata without converting any data.
+        """
+        sql = """CREATE TABLE specObjAll (
+--/H Spectra.
+  specObjID bigint NOT NULL, --/D Spectrum ID --/K ID_CATALOG
+  ra float NOT NULL, --/U deg --/D Right Ascension
+  dec float NOT NULL, --/U deg --/D Declination
+  mag_g real NOT NULL, --/D Magnitude
+);
+"""
+        data = Table()
+        data['SPECOBJID'] = np.arange(3, dtype=np.int64)
+        data['RA'] = np.zeros((3,), dtype=np.float64)
+        data['DEC'] = np.zeros((3,), dtype=np.float64)
+        data['MAG'] = np.zeros((3, 5), dtype=np.float32)
+        with TemporaryDirectory() as d:
+            f = os.path.join(d, 'specObj.fits')
+            data.write(f)
+            s = os.path.join(d, 'specObjAll.sql')
+            with open(s, 'w') as o:
+                o.write(sql)
+            with mock.patch('subprocess.Popen') as proc, \
+                    mock.patch('digestor.sdss.SDSS.processFITS') as p, \
+                    mock.patch('digestor.sdss.SDSS.configureLog') as c:
+                c.return_value = logging.NullHandler()
+                status = main(['-M', '-S', '-J', '-s', 'sdss', '-t', 'specobjall', f, s])
+                proc.assert_not_called()
+                p.assert_not_called()
+            self.assertEqual(status, 0)
+            self.assertListEqual(sorted(os.listdir(d)),
+                                 ['sdss.specobjall.json', 'sdss.specobjall.report.json',
+                                  'sdss.specobjall.sql', 'sdss.specobjall_post.sql',
+                                  'specObj.fits', 'specObjAll.sql'])
+            with open(os.path.join(d, 'sdss.specobjall.json')) as j:
+                metadata = json.load(j)
+            with open(os.path.join(d, 'sdss.specobjall.report.json')) as j:
+                report = json.load(j)
+            #
+            # A report that cannot be written does not replace the error.
+            #
+            missing = os.path.join(d, 'missing', 'report.json')
+            with mock.patch('digestor.sdss._convert') as convert, \
+                    mock.patch('digestor.sdss.SDSS.configureLog') as c:
+                c.return_value = logging.NullHandler()
+                convert.side_effect = RuntimeError('Conversion failed!')
+                with self.assertRaises(RuntimeError) as e:
+                    main(['-M', '-S', '-J', '-s', 'sdss', '-t', 'specobjall',
+                          '--report', missing, f, s])
+            self.assertEqual(e.exception.args[0], 'Conversion failed!')
+            self.assertLog(-1, "Could not write run report {0}: [Errno 2] No such file or directory: '{0}'".format(missing))
+        self.assertEqual(report['status'], 0)
+        self.assertEqual(report['table'], 'specobjall')
+        self.assertListEqual([r['stage'] for r in report['stages']],
+                             ['customSTILTS', 'parseFITS', 'parseSQL', 'fixNOFITS',
+                              'fixMapping', 'mapColumns', 'fixColumns', 'sortColumns',
+                              'writeSQL', 'writePOSTSQL', 'writeTapSchema'])
+        columns = [c['column_name'] for c in metadata['columns']]
+        self.assertListEqual(columns, ['specobjid', 'glon', 'glat', 'elon', 'elat',
+                                       'ra', 'dec', 'htm9', 'ring256', 'nest4096',
+                                       'random_id', 'mag_g'])
+
     def test_writeSQL(self):
         """Test writing SQL preload file.
         """
@@ -0,0 +1,134 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.stream.
+"""
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from astropy.io import fits
+from astropy.table import Table
+
+from ..stream import FITSBlockWriter, FITSPartWriter, read_blocks
+from .utils import DigestorCase
+
+
+class TestStream(DigestorCase):
+    """Test digestor.stream.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.data = Table()
+        self.data['id'] = np.arange(10, dtype=np.int64)
+        self.data['mag'] = np.arange(20, dtype=np.float32).reshape(10, 2)
+        self.data['name'] = np.array(['  12'] * 5 + ['    '] * 5)
+        self.data['ok'] = np.arange(10) % 2 == 0
+        self.data['small'] = np.arange(10, dtype=np.uint16) + 40000
+
+    def test_read_blocks(self):
+        """Test reading a FITS file in blocks.
+        """
+        with TemporaryDirectory() as d:
+            f = os.path.join(d, 'foo.fits')
+            fits.BinTableHDU(self.data).writeto(f)
+            blocks = list(read_blocks(f, blocksize=4))
+            self.assertEqual([len(b) for b in blocks], [4, 4, 2])
+            self.assertTrue((blocks[1]['id'] == np.arange(4, 8)).all())
+            self.assertEqual(blocks[2]['name'].dtype.kind, 'S')
+            self.assertFalse(blocks[2].has_masked_columns)
+            self.assertEqual(blocks[0]['name'][0], '  12')
+            self.assertTrue((blocks[2]['mag'][:, 1] == np.array([17, 19])).all())
+            with self.assertRaises(ValueError):
+                blocks[2]['mag'][0, 1] = 0
+            blocks = list(read_blocks(f, blocksize=4, start=3, stop=9))
+            self.assertEqual([len(b) for b in blocks], [4, 2])
+            self.assertTrue((blocks[1]['id'] == np.array([7, 8])).all())
+            blocks = list(read_blocks(f, blocksize=None, start=3, columns=['small', 'id']))
+            self.assertEqual([len(b) for b in blocks], [7])
+            self.assertListEqual(blocks[0].colnames, ['small', 'id'])
+            self.assertTrue((blocks[0]['small'] == np.arange(3, 10) + 40000).all())
+            u = os.path.join(d, 'unsigned.fits')
+            t = Table()
+            t['id'] = np.array([0, 2**63, 2**64 - 1], dtype=np.uint64)
+            t.write(u)
+            block = next(read_blocks(u))
+            self.assertEqual(block['id'].dtype, np.dtype(np.uint64))
+            block = next(read_blocks(u, signed=True))
+            self.assertEqual(block['id'].dtype, np.dtype('>i8'))
+            self.assertListEqual(block['id'].tolist(), [0, -2**63, -1])
+            self.assertListEqual(Table.read(u)['id'].tolist(), t['id'].tolist())
+            del block
+            blocks = list(read_blocks(f, blocksize=4, start=5, stop=5))
+            self.assertEqual(len(blocks), 1)
+            self.assertEqual(len(blocks[0]), 0)
+            empty = os.path.join(d, 'empty.fits')
+            self.data[:0].write(empty)
+            blocks = list(read_blocks(empty, blocksize=4))
+            self.assertEqual(len(blocks), 1)
+            self.assertEqual(len(blocks[0]), 0)
+            self.assertListEqual(blocks[0].colnames, self.data.colnames)
+
+    def test_block_writer(self):
+        """Test writing a FITS file in blocks.
+        """
+        with TemporaryDirectory() as d:
+            f = os.path.join(d, 'foo.fits')
+            with FITSBlockWriter(f, len(self.data)) as w:
+                for i in range(0, len(self.data), 3):
+                    w.write(self.data[i:i + 3])
+            self.assertEqual(os.stat(f).st_size % 2880, 0)
+            t = Table.read(f)
+            for c in ('id', 'mag', 'ok', 'small'):
+                self.assertTrue((t[c] == self.data[c]).all())
+            self.assertEqual(t['small'].dtype, np.dtype(np.uint16))
+            with fits.open(f) as hdulist:
+                self.assertEqual(hdulist[1].header['NAXIS2'], 10)
+            #
+            # Too many rows.
+            #
+            with self.assertRaises(ValueError) as e:
+                with FITSBlockWriter(f, 5) as w:
+                    w.write(self.data)
+            self.assertEqual(str(e.exception),
+                             "Attempt to write more than 5 rows to {0}!".format(f))
+            self.assertFalse(os.path.exists(f))
+            #
+            # Too few rows.
+            #
+            w = FITSBlockWriter(f, 20)
+            w.write(self.data)
+            with self.assertRaises(ValueError) as e:
+                w.close()
+            self.assertEqual(str(e.exception),
+                             "Only 10 of 20 rows were written to {0}!".format(f))
+
+    def test_part_writer(self):
+        """Test writing ranges of rows into a preallocated file.
+        """
+        with TemporaryDirectory() as d:
+            f = os.path.join(d, 'foo.fits')
+            layout = FITSBlockWriter(f, len(self.data)).allocate(self.data[:1])
+            self.assertEqual(os.stat(f).st_size % 2880, 0)
+            for start, stop in ((6, 10), (0, 6)):
+                with FITSPartWriter(f, stop - start, start, layout) as w:
+                    w.write(self.data[start:stop])
+            t = Table.read(f)
+            for c in ('id', 'mag', 'ok', 'small'):
+                self.assertTrue((t[c] == self.data[c]).all())
+            w = FITSPartWriter(f, 4, 6, layout)
+            w.write(self.data[6:8])
+            with self.assertRaises(ValueError) as e:
+                w.close()
+            self.assertEqual(str(e.exception),
+                             "Only 2 of 4 rows were written to {0}!".format(f))
+            self.assertTrue(os.path.exists(f))
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -0,0 +1,74 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.synthetic.
+"""
+import filecmp
+import os
+import unittest
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from astropy.table import Table
+
+from ..benchmark import _prepared
+from ..synthetic import synthetic_block, synthetic_sql, write_synthetic
+from .utils import DigestorCase
+
+
+class TestSynthetic(DigestorCase):
+    """Test digestor.synthetic.
+    """
+
+    def test_synthetic_block(self):
+        """Test generating a block of rows.
+        """
+        data = synthetic_block(100, 300, seed=2)
+        self.assertEqual(len(data), 300)
+        self.assertEqual(data['PSFMAG'].shape, (300, 5))
+        self.assertEqual(data['FLAGS'].dtype, np.int32)
+        self.assertEqual(data['OBJID'][108 - 100].strip(), '')
+        self.assertEqual(int(data['OBJID'][0]), 1237645876861272065 + 100)
+        self.assertGreater(int(data['OBJID'][199 - 100]), 2**63)
+        self.assertTrue((data['SPECOBJID'] > np.uint64(2**63)).all())
+        self.assertTrue(np.isnan(data['PSFMAG']).any())
+        self.assertTrue(np.isinf(data['Z']).any())
+        again = synthetic_block(100, 300, seed=2)
+        self.assertTrue((np.nan_to_num(again['MODELMAG']) == np.nan_to_num(data['MODELMAG'])).all())
+        other = synthetic_block(100, 300, seed=3)
+        self.assertFalse((other['RA'] == data['RA']).all())
+
+    def test_write_synthetic(self):
+        """Test writing and converting a synthetic file.
+        """
+        self.assertIn('CREATE TABLE foo (', synthetic_sql('foo'))
+        self.assertIn('flags_z bigint NOT NULL', synthetic_sql('foo'))
+        with TemporaryDirectory() as d:
+            f = os.path.join(d, 'synthetic.fits')
+            s = os.path.join(d, 'synthetic.sql')
+            write_synthetic(f, 250, blocksize=100, sql=s)
+            write_synthetic(f + '.2', 250, blocksize=100)
+            self.assertTrue(filecmp.cmp(f, f + '.2', shallow=False))
+            data = Table.read(f)
+            self.assertEqual(len(data), 250)
+            self.assertIs(data['OBJID'][7], np.ma.masked)
+            cwd = os.getcwd()
+            os.chdir(d)
+            try:
+                sdss = _prepared(f, s)
+                out = sdss.processFITS()
+            finally:
+                os.chdir(cwd)
+            new = Table.read(os.path.join(d, out))
+        self.assertEqual(len(new), 250)
+        for c in ('objid', 'specobjid', 'psfmag_u', 'flags_z', 'random_id'):
+            self.assertIn(c, new.colnames)
+        self.assertEqual(new['flags'].dtype.kind, 'i')
+        self.assertEqual(new['flags'].dtype.itemsize, 8)
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -0,0 +1,69 @@
+# Licensed under a MIT style license - see LICENSE.rst
+# -*- coding: utf-8 -*-
+"""Test digestor.tapschema.
+"""
+import json
+import pickle
+import unittest
+
+from ..tapschema import ColumnList
+from .utils import DigestorCase
+
+
+class TestTapSchema(DigestorCase):
+    """Test digestor.tapschema.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.plain = [{'table_name': t, 'column_name': c}
+                      for t in ('foo', 'bar') for c in ('a', 'b', 'c')]
+        self.columns = ColumnList(self.plain)
+
+    def test_lookup(self):
+        """Test finding columns.
+        """
+        self.assertEqual(self.columns.slot('bar', 'b'), 4)
+        self.assertListEqual(self.columns.slots('foo'), [0, 1, 2])
+        self.assertListEqual(self.columns.names('bar'), ['a', 'b', 'c'])
+        self.assertListEqual(self.columns.names('baz'), [])
+        with self.assertRaises(KeyError):
+            self.columns.slot('foo', 'd')
+        self.assertEqual(json.dumps(self.columns), json.dumps(self.plain))
+
+    def test_update(self):
+        """Test that changes to the list are indexed.
+        """
+        self.columns.append({'table_name': 'foo', 'column_name': 'd'})
+        self.assertEqual(self.columns.slot('foo', 'd'), 6)
+        self.assertListEqual(self.columns.names('foo'), ['a', 'b', 'c', 'd'])
+        self.columns += [{'table_name': 'baz', 'column_name': 'a'}]
+        self.assertEqual(self.columns.slot('baz', 'a'), 7)
+        del self.columns[1]
+        self.assertEqual(self.columns.slot('bar', 'b'), 3)
+        self.assertListEqual(self.columns.names('foo'), ['a', 'c', 'd'])
+        with self.assertRaises(KeyError):
+            self.columns.slot('foo', 'b')
+        self.columns[0] = {'table_name': 'foo', 'column_name': 'e'}
+        self.assertEqual(self.columns.slot('foo', 'e'), 0)
+        self.columns.insert(0, self.columns.pop())
+        self.assertEqual(self.columns.slot('baz', 'a'), 0)
+        self.columns[1]['column_name'] = 'f'
+        self.columns.reindex()
+        self.assertEqual(self.columns.slot('foo', 'f'), 1)
+
+    def test_pickle(self):
+        """Test that the list can be sent to another process.
+        """
+        columns = pickle.loads(pickle.dumps(self.columns))
+        self.assertIsInstance(columns, ColumnList)
+        self.assertListEqual(columns, self.plain)
+        self.assertEqual(columns.slot('bar', 'c'), 5)
+
+
+def test_suite():
+    """Allows testing of only this module with the command::
+
+        python setup.py test -m <modulename>
+    """
+    return unittest.defaultTestLoader.loadTestsFromName(__name__)
@@ -2,10 +2,34 @@
 # -*- coding: utf-8 -*-
 """Test top-level digestor functions.
 """
+import os
+import subprocess
+import sys
+import time
 import unittest
 import re
+from tempfile import TemporaryDirectory
+
+import numpy as np
+from astropy.table import Table
+
 from .. import __version__ as theVersion
 
+#
+# Run a command-line entry point in a fresh interpreter, and report the
+# expensive modules it imported.
+#
+_startup = """import sys
+from digestor.{0} import main
+sys.argv = ['{0}'] + {1!r}
+try:
+    status = main()
+except SystemExit as e:
+    status = e.code
+heavy = ('numpy', 'astropy', 'yaml', 'jinja2', 'pkg_resources', 'multiprocessing')
+print(status, ' '.join([m for m in heavy if m in sys.modules]))
+"""
+
 
 class TestTopLevel(unittest.TestCase):
     """Test top-level digestor functions.
@@ -31,6 +55,56 @@ class TestTopLevel(unittest.TestCase):
         """
         self.assertRegex(theVersion, self.versionre)
 
+    def startup(self, module, args, cwd=None):
+        """Run `module` with `args`, returning status, imports and time.
+        """
+        env = os.environ.copy()
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', _startup.format(module, args)],
+                             cwd=cwd, env=env, check=True,
+                             stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             universal_newlines=True).stdout
+        elapsed = time.perf_counter() - start
+        status, modules = out.splitlines()[-1].split(' ', 1)
+        return (int(status), modules.split(), elapsed)
+
+    def test_startup(self):
+        """Ensure command-line scripts start without expensive imports.
+        """
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check=True)
+        baseline = time.perf_counter() - start
+        status, modules, elapsed = self.startup('sdss', ['--help'])
+        self.assertEqual(status, 0)
+        self.assertListEqual(modules, [])
+        #
+        # Importing NumPy and Astropy alone used to take about 0.7 s.
+        #
+        self.assertLess(elapsed - baseline, 0.5)
+        status, modules, elapsed = self.startup('view', ['--help'])
+        self.assertEqual(status, 0)
+        self.assertListEqual(modules, [])
+        data = Table()
+        data['SPECOBJID'] = np.arange(3, dtype=np.int64)
+        data['RA'] = np.zeros((3,), dtype=np.float64)
+        data['DEC'] = np.zeros((3,), dtype=np.float64)
+        with TemporaryDirectory() as d:
+            data.write(os.path.join(d, 'specObj.fits'))
+            with open(os.path.join(d, 'specObjAll.sql'), 'w') as o:
+                o.write("CREATE TABLE specObjAll (\n" +
+                        "  specObjID bigint NOT NULL, --/D Spectrum ID\n" +
+                        "  ra float NOT NULL, --/U deg --/D Right Ascension\n" +
+                        "  dec float NOT NULL, --/U deg --/D Declination\n" +
+                        ");\n")
+            status, modules, elapsed = self.startup('sdss', ['-M', '-S', '-J', '-s', 'sdss',
+                                                             '-t', 'specobjall',
+                                                             'specObj.fits', 'specObjAll.sql'],
+                                                    cwd=d)
+            self.assertEqual(status, 0)
+            self.assertTrue(os.path.exists(os.path.join(d, 'sdss.specobjall.json')))
+        self.assertListEqual(modules, ['yaml', 'jinja2'])
+
 
 def test_suite():
     """Allows testing of only this module with the command::
@@ -6,9 +6,12 @@ digestor.test.utils
 
 Basic functionality shared by all tests.
 """
+import os
 import unittest
+import unittest.mock as mock
 import logging
 from logging.handlers import MemoryHandler
+from tempfile import TemporaryDirectory
 
 
 class TestHandler(MemoryHandler):
@@ -38,6 +41,12 @@ class DigestorCase(unittest.TestCase):
         pass
 
     def setUp(self):
+        #
+        # Never write to the cache of the user running the tests.
+        #
+        self.cache_dir = TemporaryDirectory()
+        self.cache_env = mock.patch.dict(os.environ, {'DIGESTOR_CACHE': self.cache_dir.name})
+        self.cache_env.start()
         root_logger = logging.getLogger('digestor')
         if len(root_logger.handlers) == 0:
             self.cache_handler = None
@@ -55,6 +64,8 @@ class DigestorCase(unittest.TestCase):
         root_logger.setLevel(logging.DEBUG)
 
     def tearDown(self):
+        self.cache_env.stop()
+        self.cache_dir.cleanup()
         root_logger = logging.getLogger('digestor')
         while len(root_logger.handlers) > 0:
             h = root_logger.handlers[0]
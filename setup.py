@@ -60,6 +60,9 @@ setup_keywords['test_suite'] = '{name}.test.{name}_test_suite'.format(**setup_ke
 # Autogenerate command-line scripts.
 #
 setup_keywords['entry_points'] = {'console_scripts': ['sdss2dl = digestor.sdss:main',
+                                                      'sdss2dl_batch = digestor.batch:main',
+                                                      'digestor_benchmark = digestor.benchmark:main',
+                                                      'digestor_scaling = digestor.scaling:main',
                                                       'add_view_metadata = digestor.view:main']}
 #
 # Add internal data directories.